@@ -1,10 +1,55 @@
-from django.contrib import admin
-from .models import Ticket, Message
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from .models import Ticket, Message, VERSION_CONFLICT_MESSAGE, VersionConflict
 from django.contrib.auth.models import User, Group
 
 
 admin.site.unregister(User)
 admin.site.unregister(Group)
 
-admin.site.register(Ticket)
-admin.site.register(Message)
\ No newline at end of file
+
+class TicketAdminForm(forms.ModelForm):
+    """
+    Versione del ticket vista all'apertura del form: chi salva una pagina
+    rimasta aperta mentre altri modificavano il ticket riceve un errore
+    invece di sovrascrivere.
+    """
+
+    seen_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    class Meta:
+        model = Ticket
+        fields = "__all__"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields["seen_version"].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        if self.instance.pk:
+            try:
+                self.instance.check_version(cleaned_data.get("seen_version"))
+            except VersionConflict:
+                raise forms.ValidationError(VERSION_CONFLICT_MESSAGE)
+
+        return cleaned_data
+
+
+@admin.register(Ticket)
+class TicketAdmin(admin.ModelAdmin):
+    form = TicketAdminForm
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        # ✅ modifica concorrente tra la validazione e il save()
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except VersionConflict:
+            self.message_user(request, VERSION_CONFLICT_MESSAGE, messages.ERROR)
+            return redirect(request.path)
+
+
+admin.site.register(Message)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.utils.archive import BATCH_SIZE, RETENTION_DAYS, archive_logs, verify_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Sposta gli AdminLog più vecchi della retention in archivi mensili "
+        "compressi (JSONL + gzip) e li cancella dalla tabella."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=RETENTION_DAYS,
+            help="Età minima (giorni) dei log da archiviare.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Controlla solo i checksum degli archivi esistenti.",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            broken = verify_archive()
+            if broken:
+                raise CommandError("Archivi mancanti o corrotti: " + ", ".join(broken))
+            self.stdout.write(self.style.SUCCESS("Archivi integri."))
+            return
+
+        total = archive_logs(
+            days=options["days"],
+            batch_size=options["batch_size"],
+            stdout=self.stdout,
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"Log archiviati: {total}"))
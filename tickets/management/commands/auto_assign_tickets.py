@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tickets.utils.assignment import BATCH_SIZE, DEFAULT_STRATEGY, STRATEGIES, auto_assign
+
+
+class Command(BaseCommand):
+    help = (
+        "Assegna i ticket liberi agli operatori attivi (round-robin o al "
+        "meno carico, dai contatori precalcolati)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--strategy", choices=STRATEGIES, default=DEFAULT_STRATEGY)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Assegna i ticket in coda una volta ed esce (utile da cron).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30.0,
+            help="Secondi tra un giro e l'altro.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            assigned = auto_assign(
+                strategy=options["strategy"],
+                batch_size=options["batch_size"],
+            )
+
+            if assigned:
+                self.stdout.write(f"Ticket assegnati: {assigned}")
+
+            if options["once"]:
+                break
+
+            time.sleep(options["interval"])
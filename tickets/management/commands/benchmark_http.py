@@ -0,0 +1,155 @@
+import asyncio
+import ssl
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark HTTP ad alta concorrenza di una URL, per confrontare lo "
+        "stesso progetto servito via WSGI (es. gunicorn ticketsys.wsgi) e "
+        "via ASGI (es. uvicorn ticketsys.asgi). Eseguire una volta per "
+        "deployment con gli stessi parametri."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Es. http://127.0.0.1:8000/tickets/")
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument(
+            "--sessionid",
+            help="Cookie di sessione di un utente già loggato (le view richiedono login).",
+        )
+        parser.add_argument(
+            "--header",
+            action="append",
+            default=[],
+            help='Header aggiuntivo "Nome: valore" (ripetibile), es. "Range: bytes=0-1023".',
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme not in ("http", "https"):
+            raise CommandError("Sono supportate solo URL http:// e https://")
+
+        headers = dict(h.split(":", 1) for h in options["header"])
+        if options["sessionid"]:
+            headers["Cookie"] = f"sessionid={options['sessionid']}"
+
+        started = time.perf_counter()
+        latencies, statuses, errors = asyncio.run(
+            run_benchmark(url, headers, options["concurrency"], options["requests"])
+        )
+        elapsed = time.perf_counter() - started
+
+        if not latencies:
+            raise CommandError(f"Nessuna risposta ({errors} errori)")
+
+        latencies.sort()
+
+        def pct(p):
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+        self.stdout.write(f"Richieste:     {len(latencies)} ok, {errors} errori")
+        self.stdout.write(f"Concorrenza:   {options['concurrency']}")
+        self.stdout.write(f"Throughput:    {len(latencies) / elapsed:.1f} req/s")
+        self.stdout.write(
+            f"Latenza (ms):  media {statistics.mean(latencies) * 1000:.1f} · "
+            f"p50 {pct(0.50):.1f} · p95 {pct(0.95):.1f} · p99 {pct(0.99):.1f}"
+        )
+        self.stdout.write(
+            "Status:        "
+            + ", ".join(f"{code}×{n}" for code, n in sorted(statuses.items()))
+        )
+
+
+# ============================================================
+# ===================== CLIENT HTTP/1.1 ======================
+# ============================================================
+
+async def run_benchmark(url, headers, concurrency, total):
+    remaining = [total]
+    latencies = []
+    statuses = {}
+    errors = [0]
+
+    async def worker():
+        conn = None
+
+        while remaining[0] > 0:
+            remaining[0] -= 1
+
+            try:
+                if conn is None:
+                    conn = await _connect(url)
+
+                start = time.perf_counter()
+                status, keep_alive = await _request(conn, url, headers)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+                if not keep_alive:
+                    conn[1].close()
+                    conn = None
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors[0] += 1
+                conn = None
+
+        if conn is not None:
+            conn[1].close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, errors[0]
+
+
+async def _connect(url):
+    port = url.port or (443 if url.scheme == "https" else 80)
+    context = ssl.create_default_context() if url.scheme == "https" else None
+    return await asyncio.open_connection(url.hostname, port, ssl=context)
+
+
+async def _request(conn, url, headers):
+    reader, writer = conn
+    path = url.path or "/"
+    if url.query:
+        path += "?" + url.query
+
+    lines = [f"GET {path} HTTP/1.1", f"Host: {url.netloc}", "Connection: keep-alive"]
+    lines += [f"{name.strip()}: {value.strip()}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("connessione chiusa dal server")
+    status = int(status_line.split()[1])
+
+    response_headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+
+    # il corpo va letto tutto per riusare la connessione
+    if response_headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif "content-length" in response_headers:
+        await reader.readexactly(int(response_headers["content-length"]))
+    elif status not in (204, 304):
+        await reader.read()
+        return status, False
+
+    # HTTP/1.0: la connessione si chiude, salvo "Connection: keep-alive"
+    connection = response_headers.get("connection", "").lower()
+    if status_line.startswith(b"HTTP/1.0"):
+        return status, connection == "keep-alive"
+    return status, connection != "close"
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from tickets.models import AdminLog
+from tickets.utils.exports import (
+    BATCH_SIZE, FORMATS, LOG_COLUMNS, encode, iter_log_rows, write_export,
+)
+from tickets.utils.filters import filter_admin_logs, log_filters
+
+
+class Command(BaseCommand):
+    help = (
+        "Esporta gli AdminLog in CSV o JSONL con gli stessi filtri di "
+        "admin_logs, compresi i log archiviati nel range di date richiesto. "
+        "Memoria costante."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(FORMATS), default="jsonl")
+        parser.add_argument(
+            "--output", "-o",
+            help="File di destinazione (default: standard output).",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+        parser.add_argument("--admin", help="Username di chi ha eseguito l'azione (contiene).")
+        parser.add_argument("--target", help="Username dell'utente coinvolto (contiene).")
+        parser.add_argument("--action", help="Azione (contiene).")
+        parser.add_argument("--from", dest="date_from", help="AAAA-MM-GG")
+        parser.add_argument("--to", dest="date_to", help="AAAA-MM-GG (incluso)")
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for name, option in (
+            ("admin", "admin"),
+            ("target", "target"),
+            ("action", "action"),
+            ("from", "date_from"),
+            ("to", "date_to"),
+        ):
+            if options[option]:
+                params[name] = options[option]
+
+        filters = log_filters(params)
+        logs = filter_admin_logs(AdminLog.objects.all(), filters)
+        chunks = encode(
+            options["format"],
+            LOG_COLUMNS,
+            iter_log_rows(logs, filters, batch_size=options["batch_size"]),
+        )
+
+        try:
+            write_export(chunks, options["output"])
+        except OSError as exc:
+            raise CommandError(f"Impossibile scrivere {options['output']}: {exc}")
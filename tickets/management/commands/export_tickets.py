@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from tickets.models import Ticket
+from tickets.utils.exports import (
+    BATCH_SIZE, FORMATS, TICKET_COLUMNS, encode, iter_ticket_rows, write_export,
+)
+from tickets.utils.filters import filter_tickets
+
+
+class Command(BaseCommand):
+    help = (
+        "Esporta i ticket in CSV o JSONL con gli stessi filtri della lista "
+        "ticket (stessi nomi dei parametri GET). Memoria costante."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument(
+            "--output", "-o",
+            help="File di destinazione (default: standard output).",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+        parser.add_argument("--priority", action="append", default=[])
+        parser.add_argument("--status", action="append", default=[])
+        parser.add_argument("--user", help="Id dell'utente creatore.")
+        parser.add_argument("--title")
+        parser.add_argument("--date-from", help="AAAA-MM-GG")
+        parser.add_argument("--date-to", help="AAAA-MM-GG (incluso)")
+        parser.add_argument("--q", help="Ricerca full-text.")
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        params.setlist("priority", options["priority"])
+        params.setlist("status", options["status"])
+        for name in ("user", "title", "date_from", "date_to", "q"):
+            if options[name]:
+                params[name] = options[name]
+
+        tickets = filter_tickets(Ticket.objects.all(), params)
+        chunks = encode(
+            options["format"],
+            TICKET_COLUMNS,
+            iter_ticket_rows(tickets, batch_size=options["batch_size"]),
+        )
+
+        try:
+            write_export(chunks, options["output"])
+        except OSError as exc:
+            raise CommandError(f"Impossibile scrivere {options['output']}: {exc}")
+
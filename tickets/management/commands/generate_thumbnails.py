@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from tickets.utils.thumbnails import THUMBNAIL_SIZES, available, backfill_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Genera le miniature mancanti delle immagini già allegate ai ticket."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            action="append",
+            choices=sorted(THUMBNAIL_SIZES),
+            help="Formato da generare (ripetibile). Default: tutti.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rigenera anche le miniature già presenti.",
+        )
+
+    def handle(self, *args, **options):
+        if not available():
+            self.stdout.write(self.style.WARNING("Pillow non installato: nessuna miniatura."))
+            return
+
+        done, failed = backfill_thumbnails(
+            sizes=options["size"],
+            force=options["force"],
+            stdout=self.stdout,
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"Generate: {done} - Fallite: {failed}"))
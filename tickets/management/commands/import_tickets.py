@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.utils.importer import BATCH_SIZE, import_tickets
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa ticket con messaggi e allegati da un file CSV o JSONL "
+        "(helpdesk legacy) a blocchi, con bulk_create e checkpoint: "
+        "rilanciato dopo un'interruzione riparte dall'ultimo blocco salvato."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File .csv o .jsonl")
+        parser.add_argument("--format", choices=["csv", "jsonl"])
+        parser.add_argument(
+            "--actor",
+            required=True,
+            help="Username registrato nell'audit come autore dell'import.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--name",
+            help="Nome del checkpoint (default: nome del file).",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignora il checkpoint e riparte dal primo record.",
+        )
+        parser.add_argument(
+            "--create-users",
+            action="store_true",
+            help="Crea (disattivati) gli utenti che non esistono.",
+        )
+        parser.add_argument(
+            "--attachments-root",
+            help="Cartella a cui sono relativi i path degli allegati.",
+        )
+
+    def handle(self, *args, **options):
+        actor = User.objects.filter(username=options["actor"]).first()
+        if actor is None:
+            raise CommandError(f"Utente inesistente: {options['actor']}")
+
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size deve essere almeno 1")
+
+        try:
+            result = import_tickets(
+                options["path"],
+                actor=actor,
+                fmt=options["format"],
+                name=options["name"],
+                batch_size=options["batch_size"],
+                create_users=options["create_users"],
+                attachments_root=options["attachments_root"],
+                restart=options["restart"],
+                stdout=self.stdout,
+                stderr=self.stderr,
+            )
+        except OSError as exc:
+            raise CommandError(f"Impossibile leggere {options['path']}: {exc}")
+
+        if result.resumed_from:
+            self.stdout.write(f"Ripreso dopo il record {result.resumed_from}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importati: {result.tickets} ticket, {result.messages} messaggi, "
+            f"{result.attachments} allegati - Doppioni: {result.duplicates} - "
+            f"Scartati: {result.rejected}"
+        ))
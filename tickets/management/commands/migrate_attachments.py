@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from tickets.utils.storage import migrate_legacy_attachments
+
+
+class Command(BaseCommand):
+    help = (
+        "Converte gli allegati salvati in ticket_<id>/<nome> nello storage "
+        "deduplicato per SHA-256."
+    )
+
+    def handle(self, *args, **options):
+        migrated, missing = migrate_legacy_attachments(stdout=self.stdout)
+
+        for relative_path in missing:
+            self.stdout.write(self.style.WARNING(f"File mancante: {relative_path}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Allegati migrati: {migrated}"))
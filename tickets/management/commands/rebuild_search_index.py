@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tickets.utils.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice di ricerca full-text dei ticket (backfill)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_index(
+                batch_size=options["batch_size"],
+                stdout=self.stdout,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Indice ricostruito: {total} ticket"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tickets.utils.stats import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce da zero la tabella dei contatori dei ticket."
+
+    def handle(self, *args, **options):
+        rows = reconcile_counters()
+
+        for (dimension, key), count in sorted(rows.items()):
+            self.stdout.write(f"{dimension}:{key or '-'} = {count}")
+
+        self.stdout.write(self.style.SUCCESS("Contatori riconciliati."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tickets.utils.rollups import BATCH_SIZE, rebuild_rollups, run_rollup
+
+
+class Command(BaseCommand):
+    help = "Aggrega i nuovi AdminLog nei rollup giornalieri del report attività."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Svuota i rollup e riaggrega tutto il log da capo (archivi compresi).",
+        )
+
+    def handle(self, *args, **options):
+        job = rebuild_rollups if options["rebuild"] else run_rollup
+        processed = job(batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Log aggregati: {processed}"))
@@ -0,0 +1,57 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from tickets.utils.mailer import deliver_outbox
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Invia le email in coda (EmailOutbox) a lotti, con retry e backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Svuota la coda una volta ed esce (utile da cron).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Secondi di attesa quando la coda è vuota.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        while True:
+            try:
+                sent, failed = deliver_outbox(batch_size=batch_size)
+            except Exception as exc:
+                # ✅ DB non raggiungibile o simili: il worker non muore,
+                #    riprova al giro successivo
+                logger.exception("send_outbox: invio del lotto fallito")
+                self.stderr.write(f"Errore: {type(exc).__name__}: {exc}")
+
+                if options["once"]:
+                    break
+
+                time.sleep(options["interval"])
+                continue
+
+            if sent or failed:
+                self.stdout.write(f"Inviate: {sent} - Fallite: {failed}")
+
+            # ✅ lotto pieno → probabilmente c'è altro in coda, continua subito
+            if sent + failed >= batch_size:
+                continue
+
+            if options["once"]:
+                break
+
+            time.sleep(options["interval"])
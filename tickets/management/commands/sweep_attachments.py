@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from tickets.utils.storage import ORPHAN_GRACE, sweep_orphans
+
+
+class Command(BaseCommand):
+    help = (
+        "Rimuove i contenuti orfani dello storage deduplicato: blob senza "
+        "riferimenti, file senza riga e temporanei di upload interrotti."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=ORPHAN_GRACE,
+            help="Età minima (secondi) dei file da rimuovere.",
+        )
+
+    def handle(self, *args, **options):
+        collected, removed = sweep_orphans(grace=options["grace"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Blob raccolti: {collected} - File orfani rimossi: {removed}"
+        ))
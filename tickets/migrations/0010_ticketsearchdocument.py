@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Indice full-text specifico del backend, sopra la tabella dei documenti.
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE tickets_search_fts USING fts5(
+        title, body,
+        content='tickets_ticketsearchdocument',
+        content_rowid='ticket_id'
+    )
+    """,
+    """
+    CREATE TRIGGER tickets_search_fts_ai AFTER INSERT ON tickets_ticketsearchdocument BEGIN
+        INSERT INTO tickets_search_fts(rowid, title, body)
+        VALUES (new.ticket_id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER tickets_search_fts_ad AFTER DELETE ON tickets_ticketsearchdocument BEGIN
+        INSERT INTO tickets_search_fts(tickets_search_fts, rowid, title, body)
+        VALUES ('delete', old.ticket_id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER tickets_search_fts_au AFTER UPDATE ON tickets_ticketsearchdocument BEGIN
+        INSERT INTO tickets_search_fts(tickets_search_fts, rowid, title, body)
+        VALUES ('delete', old.ticket_id, old.title, old.body);
+        INSERT INTO tickets_search_fts(rowid, title, body)
+        VALUES (new.ticket_id, new.title, new.body);
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS tickets_search_fts_au",
+    "DROP TRIGGER IF EXISTS tickets_search_fts_ad",
+    "DROP TRIGGER IF EXISTS tickets_search_fts_ai",
+    "DROP TABLE IF EXISTS tickets_search_fts",
+]
+
+POSTGRES_FORWARD = [
+    """
+    CREATE INDEX tickets_search_tsv_idx ON tickets_ticketsearchdocument
+    USING GIN (to_tsvector('simple', title || ' ' || body))
+    """,
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS tickets_search_tsv_idx",
+]
+
+MYSQL_FORWARD = [
+    "ALTER TABLE tickets_ticketsearchdocument ADD FULLTEXT INDEX tickets_search_ft (title, body)",
+]
+
+MYSQL_REVERSE = [
+    "ALTER TABLE tickets_ticketsearchdocument DROP INDEX tickets_search_ft",
+]
+
+STATEMENTS = {
+    "sqlite": (SQLITE_FORWARD, SQLITE_REVERSE),
+    "postgresql": (POSTGRES_FORWARD, POSTGRES_REVERSE),
+    "mysql": (MYSQL_FORWARD, MYSQL_REVERSE),
+}
+
+
+def create_fulltext_index(apps, schema_editor):
+    forward, _ = STATEMENTS.get(schema_editor.connection.vendor, ([], []))
+    for sql in forward:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    _, reverse = STATEMENTS.get(schema_editor.connection.vendor, ([], []))
+    for sql in reverse:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0009_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSearchDocument',
+            fields=[
+                ('ticket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='tickets.ticket')),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0010_ticketsearchdocument'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adminlog',
+            index=models.Index(fields=['timestamp'], name='adminlog_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminlog',
+            index=models.Index(fields=['action', 'timestamp'], name='adminlog_action_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'assigned_to', 'created_at'], name='ticket_status_assignee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['created_by', 'created_at'], name='ticket_creator_created_idx'),
+        ),
+    ]
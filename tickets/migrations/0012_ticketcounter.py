@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:04
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    """
+    Riempie i contatori con i ticket già presenti
+    (stessa logica di utils.stats.reconcile_counters).
+    """
+    Ticket = apps.get_model("tickets", "Ticket")
+    TicketCounter = apps.get_model("tickets", "TicketCounter")
+
+    rows = []
+
+    for dimension in ("status", "priority"):
+        for item in Ticket.objects.values(dimension).annotate(total=Count("id")).order_by():
+            rows.append(TicketCounter(dimension=dimension, key=item[dimension], count=item["total"]))
+
+    active = (
+        Ticket.objects.exclude(status="closed")
+        .values("assigned_to_id").annotate(total=Count("id")).order_by()
+    )
+    for item in active:
+        key = str(item["assigned_to_id"]) if item["assigned_to_id"] else ""
+        rows.append(TicketCounter(dimension="assignee", key=key, count=item["total"]))
+
+    TicketCounter.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('status', 'Stato'), ('priority', 'Priorità'), ('assignee', 'Assegnatario')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='ticketcounter_unique_key')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
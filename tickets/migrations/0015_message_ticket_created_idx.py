@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0014_storedblob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['ticket', 'created_at', 'id'], name='message_ticket_created_idx'),
+        ),
+    ]
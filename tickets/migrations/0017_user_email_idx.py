@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+# auth.User non è un model di questa app: l'indice si crea con lo
+# schema editor (AddIndex funziona solo sui model dell'app stessa).
+# username ha già il suo indice UNIQUE.
+
+EMAIL_INDEX = models.Index(fields=["email"], name="auth_user_email_idx")
+
+
+def add_email_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model("auth", "User"), EMAIL_INDEX)
+
+
+def remove_email_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model("auth", "User"), EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tickets', '0016_ticket_import_ref'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_email_index, remove_email_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0017_user_email_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'assigned_to', 'priority', 'created_at'], name='ticket_queue_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0019_ticket_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['assigned_to', 'created_at'], name='ticket_assignee_created_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:13
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def move_checkpoints(apps, schema_editor):
+    """
+    Sposta i checkpoint "import:<nome>" da RollupWatermark. I nomi lunghi
+    50 caratteri erano troncati (nome originale sconosciuto): vengono
+    scartati, l'import ripartirà dall'inizio saltando i doppioni.
+    """
+    RollupWatermark = apps.get_model("tickets", "RollupWatermark")
+    ImportCheckpoint = apps.get_model("tickets", "ImportCheckpoint")
+
+    old = RollupWatermark.objects.filter(name__startswith="import:")
+
+    ImportCheckpoint.objects.bulk_create([
+        ImportCheckpoint(
+            key=hashlib.sha256(w.name[len("import:"):].encode("utf-8")).hexdigest(),
+            name=w.name[len("import:"):],
+            last_number=w.last_id,
+        )
+        for w in old
+        if len(w.name) < 50
+    ])
+    old.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0020_ticket_assignee_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('name', models.TextField()),
+                ('last_number', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(move_checkpoints, migrations.RunPython.noop),
+    ]
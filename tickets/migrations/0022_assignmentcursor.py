@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_cursor(apps, schema_editor):
+    """
+    Sposta il cursore del round-robin da RollupWatermark ("assign:round_robin").
+    """
+    RollupWatermark = apps.get_model("tickets", "RollupWatermark")
+    AssignmentCursor = apps.get_model("tickets", "AssignmentCursor")
+    User = apps.get_model("auth", "User")
+
+    old = RollupWatermark.objects.filter(name="assign:round_robin").first()
+    if old is None:
+        return
+
+    last_operator = User.objects.filter(pk=old.last_id).first()
+    AssignmentCursor.objects.create(strategy="round_robin", last_operator=last_operator)
+    old.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0021_importcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strategy', models.CharField(max_length=20, unique=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_operator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(move_cursor, migrations.RunPython.noop),
+    ]
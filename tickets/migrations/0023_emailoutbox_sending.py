@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0022_assignmentcursor'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'In coda'), ('sending', 'In invio'), ('sent', 'Inviata'), ('dead', 'Fallita definitivamente')], default='pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+
+# Ricerca per prefisso senza distinzione di maiuscole (autocomplete e
+# directory utenti, vedi filter_users_by_prefix): indici funzionali su
+# UPPER(username) e UPPER(email). Come in 0017, auth.User non è un model
+# di questa app: gli indici si creano con lo schema editor.
+
+UPPER_INDEXES = [
+    models.Index(Upper("username"), name="auth_user_username_upper_idx"),
+    models.Index(Upper("email"), name="auth_user_email_upper_idx"),
+]
+
+
+def add_upper_indexes(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    for index in UPPER_INDEXES:
+        schema_editor.add_index(User, index)
+
+
+def remove_upper_indexes(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    for index in UPPER_INDEXES:
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tickets', '0023_emailoutbox_sending'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_upper_indexes, remove_upper_indexes),
+    ]
@@ -1,12 +1,248 @@
-from django.db import models
+from django.db import DatabaseError, models, router, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, pre_save
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+# ============================================================
+# =================== TRACCIAMENTO MODIFICHE =================
+# ============================================================
+
+def snapshot_fields(instance, fields=None):
+    """
+    Memorizza i valori dei campi così come sono nel DB, per poter
+    calcolare PRIMA → DOPO senza rileggere la riga.
+    """
+    loaded = getattr(instance, "_loaded_values", None) or {}
+
+    for f in instance._meta.concrete_fields:
+        if fields is not None and f.name not in fields and f.attname not in fields:
+            continue
+        # i campi differiti (.only/.defer) non sono in __dict__
+        if f.attname in instance.__dict__:
+            loaded[f.name] = instance.__dict__[f.attname]
+
+    instance._loaded_values = loaded
+
+
+def changed_fields(instance):
+    """
+    Campi modificati rispetto all'ultimo snapshot: {nome: (prima, dopo)}.
+    Per le FK i valori sono gli id (es. assigned_to → assigned_to_id).
+    """
+    loaded = getattr(instance, "_loaded_values", None) or {}
+    changes = {}
+
+    for f in instance._meta.concrete_fields:
+        if f.name not in loaded or f.attname not in instance.__dict__:
+            continue
+
+        old = loaded[f.name]
+        new = instance.__dict__[f.attname]
+        if old != new:
+            changes[f.name] = (old, new)
+
+    return changes
+
+
+class TrackedModel(models.Model):
+    """
+    Model che ricorda i valori caricati dal DB (from_db) e, nei save()
+    senza update_fields, scrive solo le colonne effettivamente cambiate.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        snapshot_fields(instance)
+        return instance
+
+    def changed_fields(self):
+        return changed_fields(self)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        snapshot_fields(self, fields)
+
+    def fields_to_update(self):
+        """
+        Campi da scrivere in un save() senza update_fields: solo quelli
+        cambiati + quelli auto_now (es. updated_at).
+        """
+        update_fields = list(self.changed_fields())
+        update_fields += [
+            f.name for f in self._meta.concrete_fields
+            if getattr(f, "auto_now", False) and f.name not in update_fields
+        ]
+        return update_fields
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not args
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+            and getattr(self, "_loaded_values", None)
+        ):
+            kwargs["update_fields"] = self.fields_to_update()
+
+        super().save(*args, **kwargs)
+
+        # ✅ dopo il salvataggio il nuovo stato diventa lo "stato DB"
+        snapshot_fields(self, kwargs.get("update_fields"))
+
+
+class VersionConflict(Exception):
+    """
+    Il record è stato modificato da qualcun altro dopo essere stato letto.
+    """
+
+    def __init__(self, instance):
+        self.instance = instance
+        super().__init__(
+            f"{instance._meta.object_name} {instance.pk}: "
+            f"versione {instance.version} non più attuale"
+        )
+
+
+# Modifica concorrente (VersionConflict): si ricarica e si riprova
+VERSION_CONFLICT_MESSAGE = (
+    "Il ticket è stato modificato da un altro utente nel frattempo: "
+    "ricarica la pagina e riprova."
+)
+
+
+class VersionedModel(TrackedModel):
+    """
+    Concorrenza ottimistica: ogni UPDATE è un compare-and-swap sulla
+    versione letta (WHERE version = N → SET version = N + 1). Se nel
+    frattempo la riga è cambiata il save() solleva VersionConflict invece
+    di sovrascrivere le modifiche altrui; nessun lock sulla riga.
+    """
+
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def check_version(self, version):
+        """
+        Versione vista dall'utente (campo del form o parametro del link):
+        se il record è cambiato mentre la pagina era aperta → VersionConflict.
+        Senza versione resta il controllo del save().
+        """
+        if str(version or "").isdigit() and int(version) != self.version:
+            raise VersionConflict(self)
+
+    def _checked_update_fields(self, update_fields):
+        """
+        update_fields validati come in Model.save(): nomi o attname
+        (assigned_to / assigned_to_id), ValueError per quelli sconosciuti.
+        Restituisce i nomi dei campi.
+        """
+        names = frozenset(update_fields)
+        unknown = names.difference(self._meta._non_pk_concrete_field_names)
+        if unknown:
+            raise ValueError(
+                "The following fields do not exist in this model, are m2m "
+                "fields, primary keys, or are non-concrete fields: %s"
+                % ", ".join(sorted(unknown))
+            )
+
+        return {
+            f.name for f in self._meta.concrete_fields
+            if f.name in names or f.attname in names
+        }
+
+    def save(self, *args, **kwargs):
+        """
+        UPDATE come compare-and-swap esplicito:
+        filter(pk=..., version=N).update(campi..., version=N + 1).
+        Gli INSERT passano dal save() normale.
+        """
+        if self._state.adding or args or kwargs.get("force_insert"):
+            return super().save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        deferred = self.get_deferred_fields()
+
+        if update_fields is not None:
+            if not update_fields:
+                return
+            update_fields = self._checked_update_fields(update_fields)
+        elif getattr(self, "_loaded_values", None):
+            update_fields = self.fields_to_update()
+        else:
+            # come Model.save(): con campi differiti solo quelli caricati
+            update_fields = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in deferred
+            ]
+
+        # riga sparita: INSERT solo per un save() "completo", come Model.save()
+        must_update = kwargs.get("update_fields") is not None or bool(deferred)
+
+        update_fields = frozenset(update_fields) | {"version"}
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        rows = type(self)._base_manager.using(using)
+
+        # ✅ stessi segnali di Model.save() (come claim_ticket), una sola volta
+        pre_save.send(
+            sender=type(self), instance=self, raw=False, using=using,
+            update_fields=update_fields,
+        )
+
+        values = {
+            f.attname: f.pre_save(self, False)   # auto_now (updated_at)
+            for f in self._meta.concrete_fields
+            if f.name in update_fields and f.name != "version" and not f.primary_key
+        }
+
+        # versione differita (.only/.defer): nessun valore da confrontare,
+        # la versione viene comunque incrementata
+        expected = self.__dict__.get("version")
+        target = rows.filter(pk=self.pk)
+        if expected is not None:
+            target = target.filter(version=expected)
+
+        created = False
+
+        updated = target.update(version=F("version") + 1, **values)
+
+        if not updated:
+            if expected is not None and rows.filter(pk=self.pk).exists():
+                raise VersionConflict(self)
+            if must_update:
+                raise DatabaseError("Save with update_fields did not affect any rows.")
+
+            # riga cancellata nel frattempo: INSERT senza un secondo pre_save
+            with transaction.mark_for_rollback_on_error(using):
+                self._save_table(cls=type(self), force_insert=True, using=using)
+            created = True
+
+        if expected is not None and not created:
+            self.version = expected + 1
+        self._state.db = using
+        self._state.adding = False
+
+        post_save.send(
+            sender=type(self), instance=self, created=created, raw=False, using=using,
+            update_fields=None if created else update_fields,
+        )
+
+        # ✅ dopo il salvataggio il nuovo stato diventa lo "stato DB"
+        snapshot_fields(self, None if created else update_fields)
 
 
 # ============================================================
 # ========================== TICKET ==========================
 # ============================================================
 
-class Ticket(models.Model):
+class Ticket(VersionedModel):
 
     PRIORITY_CHOICES = [
         ('low', 'Bassa'),
@@ -52,6 +288,37 @@ class Ticket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # ✅ id del ticket nel sistema di provenienza (import_tickets):
+    #    evita doppioni e ritrova gli id dopo un bulk_create
+    import_ref = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False
+    )
+
+    class Meta:
+        indexes = [
+            # ✅ paginazione keyset delle liste: ORDER BY created_at, id
+            models.Index(fields=["created_at", "id"], name="ticket_created_id_idx"),
+            # ✅ code operatore: stato + assegnatario, in ordine di data
+            models.Index(
+                fields=["status", "assigned_to", "created_at"],
+                name="ticket_status_assignee_idx",
+            ),
+            # ✅ "prossimo ticket" per priorità: una coda per valore,
+            #    già in ordine di data (niente sort, niente lock extra)
+            models.Index(
+                fields=["status", "assigned_to", "priority", "created_at"],
+                name="ticket_queue_priority_idx",
+            ),
+            # ✅ "i miei ticket"
+            models.Index(fields=["created_by", "created_at"], name="ticket_creator_created_idx"),
+            # ✅ ticket assegnati all'operatore, in ordine di data (niente sort)
+            models.Index(fields=["assigned_to", "created_at"], name="ticket_assignee_created_idx"),
+        ]
+
     def __str__(self):
         return f"[{self.id}] {self.title}"
 
@@ -73,11 +340,76 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # chat e feed incrementale: range scan per ticket in ordine
+            models.Index(
+                fields=["ticket", "created_at", "id"],
+                name="message_ticket_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Messaggio di {self.sender.username} - Ticket {self.ticket.id}"
 
 
+# ============================================================
+# ====================== CONTATORI TICKET ====================
+# ============================================================
+
+class TicketCounter(models.Model):
+    """
+    Contatori dei ticket mantenuti dai signal (vedi utils/stats.py):
+
+    - dimension="status"   → key = stato, count = ticket in quello stato
+    - dimension="priority" → key = priorità
+    - dimension="assignee" → key = id operatore ("" = nessuno),
+                             count = ticket NON chiusi (carico di lavoro)
+    """
+
+    DIMENSION_CHOICES = [
+        ('status', 'Stato'),
+        ('priority', 'Priorità'),
+        ('assignee', 'Assegnatario'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=50, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dimension", "key"], name="ticketcounter_unique_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}:{self.key} = {self.count}"
+
+
+# ============================================================
+# ====================== RICERCA FULL-TEXT ===================
+# ============================================================
+
+class TicketSearchDocument(models.Model):
+    """
+    Documento denormalizzato per la ricerca full-text: titolo + descrizione
+    + testo dei messaggi. Mantenuto dai signal (vedi utils/search.py);
+    l'indice vero (FTS5 / tsvector / FULLTEXT) dipende dal backend DB.
+    """
+
+    ticket = models.OneToOneField(
+        Ticket,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document"
+    )
+
+    title = models.CharField(max_length=200)
+    body = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Indice ticket {self.ticket_id}"
+
+
 # ============================================================
 # ========================= ADMIN LOG ========================
 # ============================================================
@@ -119,14 +451,124 @@ class AdminLog(models.Model):
 
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # ✅ admin_logs: ORDER BY timestamp + filtri per data
+            models.Index(fields=["timestamp"], name="adminlog_timestamp_idx"),
+            # ✅ report_dashboard: azione + intervallo di date
+            models.Index(fields=["action", "timestamp"], name="adminlog_action_ts_idx"),
+        ]
+
     def __str__(self):
         return f"{self.actor} - {self.action} - {self.timestamp}"
 
 
+# ============================================================
+# ====================== ROLLUP ATTIVITÀ =====================
+# ============================================================
+
+class ActivityRollup(models.Model):
+    """
+    Conteggi giornalieri di AdminLog per (giorno, attore, azione),
+    riempiti in modo incrementale da `manage.py rollup_activity`.
+    Il report legge da qui invece di fare GROUP BY sul log grezzo.
+    """
+
+    day = models.DateField()
+
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
+
+    action = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "actor", "action"], name="rollup_unique_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["action", "day"], name="rollup_action_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.actor_id} - {self.action}: {self.count}"
+
+
+class RollupWatermark(models.Model):
+    """
+    Punto di ripresa di un job incrementale: ultimo AdminLog.id già
+    aggregato (rollup).
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Record già importati da import_tickets per ogni import.
+    key = SHA-256 del nome completo (di solito il nome del file): nomi
+    lunghi non vengono troncati e due import non condividono il checkpoint.
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    name = models.TextField()
+    last_number = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_number}"
+
+
+class AssignmentCursor(models.Model):
+    """
+    Ultimo operatore servito da una strategia di auto_assign_tickets
+    (round_robin): il giro riprende dal successivo. Una riga per strategia,
+    bloccata per tutto il blocco di assegnazioni.
+    """
+
+    strategy = models.CharField(max_length=20, unique=True)
+    last_operator = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.strategy} @ {self.last_operator_id}"
+
+
 # ============================================================
 # ====================== TICKET ATTACHMENT ===================
 # ============================================================
 
+class StoredBlob(models.Model):
+    """
+    Contenuto di un allegato salvato UNA volta sola, indirizzato dal suo
+    SHA-256 (vedi utils/storage.py). ref_count = allegati che lo usano.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} rif.)"
+
+
 class TicketAttachment(models.Model):
 
     ticket = models.ForeignKey(
@@ -145,6 +587,15 @@ class TicketAttachment(models.Model):
     # ✅ SALVIAMO SOLO IL PATH RELATIVO (COME AVEVAMO DECISO)
     file_path = models.TextField()
 
+    # ✅ contenuto deduplicato; NULL = file legacy in ticket_<id>/<nome>
+    blob = models.ForeignKey(
+        StoredBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="attachments"
+    )
+
     file_size = models.IntegerField()
     mime_type = models.CharField(max_length=100)
 
@@ -152,3 +603,72 @@ class TicketAttachment(models.Model):
 
     def __str__(self):
         return self.file_name
+
+
+# ============================================================
+# ======================= EMAIL OUTBOX =======================
+# ============================================================
+
+class EmailOutbox(models.Model):
+    """
+    Coda persistente delle email: la richiesta HTTP inserisce solo la riga,
+    l'invio SMTP lo fa il worker `manage.py send_outbox`.
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'In coda'),
+        ('sending', 'In invio'),
+        ('sent', 'Inviata'),
+        ('dead', 'Fallita definitivamente'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    text_content = models.TextField()
+    html_content = models.TextField(blank=True)
+    recipients = models.JSONField(default=list)
+
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
+
+    target_user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
+
+    ticket = models.ForeignKey(
+        Ticket,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
+
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # ✅ il worker legge solo le email in coda già scadute
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"[{self.status}] {self.subject}"
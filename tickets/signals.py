@@ -1,157 +1,26 @@
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_init, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.utils import timezone
 
-from .models import Ticket, TicketAttachment, AdminLog
+from .models import Ticket, Message, TicketAttachment, AdminLog, snapshot_fields
 from .utils.audit import log_change
 from .utils.mailer import send_ticket_email
+from .utils.roles import invalidate_roles
+from .utils.search import index_ticket, index_message, refresh_body
+from .utils.stats import apply_ticket_change, apply_ticket_changes, ticket_state
+from .utils.storage import release, remove_legacy_file
+from .utils.thumbnails import discard_thumbnails
+from .utils.live import attachment_event, is_staff_side, message_event, publish_after_commit
+from .utils.fragments import bump_ticket_version, bump_ticket_versions, bump_user_tickets
 
 
 
-# ============================================================
-# ==================== TICKET: PRE SAVE ======================
-# ============================================================
-
-@receiver(pre_save, sender=Ticket)
-def ticket_pre_save(sender, instance, **kwargs):
-    """
-    Salva lo stato precedente del ticket per il confronto PRIMA → DOPO
-    """
-    if not instance.pk:
-        return
-
-    try:
-        old = Ticket.objects.get(pk=instance.pk)
-
-        instance._old_status = old.status
-        instance._old_priority = old.priority
-        instance._old_assigned_to = old.assigned_to
-        instance._old_title = old.title
-        instance._old_description = old.description
-
-    except Ticket.DoesNotExist:
-        pass
-
-
 # ============================================================
 # ==================== TICKET: POST SAVE =====================
 # ============================================================
 
-@receiver(post_save, sender=Ticket)
-def ticket_post_save(sender, instance, created, **kwargs):
-
-    # ✅ CREAZIONE TICKET
-    if created:
-        log_change(
-            actor=instance.created_by,
-            action="TICKET CREATE",
-            ticket=instance,
-            extra=f"Titolo: {instance.title}",
-        )
-        return
-
-    # ✅ CAMBIO STATO
-    if hasattr(instance, "_old_status") and instance._old_status != instance.status:
-        log_change(
-            actor=instance.created_by,
-            action="TICKET STATUS CHANGE",
-            ticket=instance,
-            field_name="status",
-            old_value=instance._old_status,
-            new_value=instance.status,
-        )
-
-    # ✅ CAMBIO PRIORITÀ
-    if hasattr(instance, "_old_priority") and instance._old_priority != instance.priority:
-        log_change(
-            actor=instance.created_by,
-            action="TICKET PRIORITY CHANGE",
-            ticket=instance,
-            field_name="priority",
-            old_value=instance._old_priority,
-            new_value=instance.priority,
-        )
-
-    # ✅ CAMBIO ASSEGNAZIONE
-    if hasattr(instance, "_old_assigned_to") and instance._old_assigned_to != instance.assigned_to:
-        log_change(
-            actor=instance.created_by,
-            action="TICKET ASSIGNED CHANGE",
-            ticket=instance,
-            target_user=instance.assigned_to,
-            field_name="assigned_to",
-            old_value=(
-                instance._old_assigned_to.username
-                if instance._old_assigned_to else "Nessuno"
-            ),
-            new_value=(
-                instance.assigned_to.username
-                if instance.assigned_to else "Nessuno"
-            ),
-        )
-
-    # ✅ CAMBIO TITOLO
-    if hasattr(instance, "_old_title") and instance._old_title != instance.title:
-        log_change(
-            actor=instance.created_by,
-            action="TICKET TITLE CHANGE",
-            ticket=instance,
-            field_name="title",
-            old_value=instance._old_title,
-            new_value=instance.title,
-        )
-
-    # ✅ CAMBIO DESCRIZIONE
-    if hasattr(instance, "_old_description") and instance._old_description != instance.description:
-        log_change(
-            actor=instance.created_by,
-            action="TICKET DESCRIPTION CHANGE",
-            ticket=instance,
-            field_name="description",
-            old_value="(testo precedente)",
-            new_value="(testo aggiornato)",
-        )
-
-
-# ============================================================
-# ==================== TICKET: DELETE ========================
-# ============================================================
-
-@receiver(post_delete, sender=Ticket)
-def ticket_post_delete(sender, instance, **kwargs):
-    log_change(
-        actor=instance.created_by,
-        target_user=instance.created_by,
-        action="TICKET DELETE",
-        ticket=None,
-        extra=f"Titolo: {instance.title}",
-    )
-
-
-# ============================================================
-# ==================== USER: PRE SAVE ========================
-# ============================================================
-
-@receiver(pre_save, sender=User)
-def user_pre_save(sender, instance, **kwargs):
-    if not instance.pk:
-        return
-
-    try:
-        old = User.objects.get(pk=instance.pk)
-
-        instance._old_username = old.username
-        instance._old_email = old.email
-        instance._old_is_staff = old.is_staff
-
-    except User.DoesNotExist:
-        pass
-
-
-# ============================================================
-# ==================== USER: POST SAVE =======================
-# ============================================================
-
 @receiver(post_save, sender=Ticket)
 def ticket_post_save(sender, instance, created, **kwargs):
 
@@ -161,10 +30,17 @@ def ticket_post_save(sender, instance, created, **kwargs):
     from .utils.mailer import send_ticket_email, build_ticket_email_html
     from .utils.audit import log_change
 
+    # ✅ righe e intestazione in cache: nuova versione dopo il commit
+    bump_ticket_version(instance.id)
+
     # =========================================================
     # ✅ 1. CREAZIONE TICKET → LOG + MAIL A OPERATORI + ADMIN
     # =========================================================
     if created:
+        # -------- CONTATORI + INDICE DI RICERCA --------
+        apply_ticket_change(new=ticket_state(instance))
+        index_ticket(instance)
+
         # -------- LOG CREAZIONE --------
         log_change(
             actor=instance.created_by,
@@ -214,46 +90,76 @@ def ticket_post_save(sender, instance, created, **kwargs):
 
         return   # ⛔ IMPORTANTE: impedisce che entri negli altri controlli
 
+    # ✅ PRIMA → DOPO dallo snapshot caricato dal DB (nessuna query)
+    changes = instance.changed_fields()
+
+    # con update_fields espliciti contano solo i campi scritti davvero
+    update_fields = kwargs.get("update_fields")
+    if update_fields:
+        changes = {
+            name: values for name, values in changes.items()
+            if name in update_fields or f"{name}_id" in update_fields
+        }
+
+    # ✅ contatori per stato / priorità / assegnatario
+    old_state = tuple(
+        changes[name][0] if name in changes else current
+        for name, current in zip(
+            ("status", "priority", "assigned_to"), ticket_state(instance)
+        )
+    )
+    apply_ticket_change(old=old_state, new=ticket_state(instance))
+
+    # ✅ indice di ricerca solo se cambia il testo indicizzato
+    if "title" in changes or "description" in changes:
+        index_ticket(instance)
+
     # =========================================================
     # ✅ 2. CAMBIO STATO
     # =========================================================
-    if hasattr(instance, "_old_status") and instance._old_status != instance.status:
+    if "status" in changes:
         log_change(
             actor=instance.assigned_to or instance.created_by,
             action="TICKET STATUS CHANGE",
             ticket=instance,
             field_name="status",
-            old_value=instance._old_status,
+            old_value=changes["status"][0],
             new_value=instance.status,
         )
 
     # =========================================================
     # ✅ 3. CAMBIO PRIORITÀ
     # =========================================================
-    if hasattr(instance, "_old_priority") and instance._old_priority != instance.priority:
+    if "priority" in changes:
         log_change(
             actor=instance.assigned_to or instance.created_by,
             action="TICKET PRIORITY CHANGE",
             ticket=instance,
             field_name="priority",
-            old_value=instance._old_priority,
+            old_value=changes["priority"][0],
             new_value=instance.priority,
         )
 
     # =========================================================
     # ✅ 4. CAMBIO ASSEGNAZIONE → SOLO LOG (EMAIL LA GESTISCE LA VIEW)
     # =========================================================
-    if hasattr(instance, "_old_assigned_to") and instance._old_assigned_to != instance.assigned_to:
+    if "assigned_to" in changes:
+        old_assigned_id = changes["assigned_to"][0]
+
+        # lo snapshot ha solo l'id: lo username serve solo qui
+        old_username = (
+            User.objects.filter(pk=old_assigned_id)
+            .values_list("username", flat=True).first()
+            if old_assigned_id else None
+        )
+
         log_change(
             actor=instance.assigned_to,
             target_user=instance.assigned_to,
             action="TICKET ASSIGNED CHANGE",
             ticket=instance,
             field_name="assigned_to",
-            old_value=(
-                instance._old_assigned_to.username
-                if instance._old_assigned_to else "Nessuno"
-            ),
+            old_value=old_username or "Nessuno",
             new_value=(
                 instance.assigned_to.username
                 if instance.assigned_to else "Nessuno"
@@ -263,20 +169,20 @@ def ticket_post_save(sender, instance, created, **kwargs):
     # =========================================================
     # ✅ 5. CAMBIO TITOLO
     # =========================================================
-    if hasattr(instance, "_old_title") and instance._old_title != instance.title:
+    if "title" in changes:
         log_change(
             actor=instance.assigned_to or instance.created_by,
             action="TICKET TITLE CHANGE",
             ticket=instance,
             field_name="title",
-            old_value=instance._old_title,
+            old_value=changes["title"][0],
             new_value=instance.title,
         )
 
     # =========================================================
     # ✅ 6. CAMBIO DESCRIZIONE
     # =========================================================
-    if hasattr(instance, "_old_description") and instance._old_description != instance.description:
+    if "description" in changes:
         log_change(
             actor=instance.assigned_to or instance.created_by,
             action="TICKET DESCRIPTION CHANGE",
@@ -287,10 +193,120 @@ def ticket_post_save(sender, instance, created, **kwargs):
         )
 
 
+# ============================================================
+# ==================== TICKET: DELETE ========================
+# ============================================================
+
+@receiver(post_delete, sender=Ticket)
+def ticket_post_delete(sender, instance, **kwargs):
+    apply_ticket_change(old=ticket_state(instance))
+    bump_ticket_version(instance.id)
+
+    log_change(
+        actor=instance.created_by,
+        target_user=instance.created_by,
+        action="TICKET DELETE",
+        ticket=None,
+        extra=f"Titolo: {instance.title}",
+    )
+
+
+# ============================================================
+# ==================== MESSAGE: SAVE / DELETE ================
+# ============================================================
+
+@receiver(post_save, sender=Message)
+def message_post_save(sender, instance, created, **kwargs):
+    if created:
+        index_message(instance)
+
+        # ✅ chat live: stesso evento che riceve chi ha scritto (dedup per id)
+        publish_after_commit(
+            instance.ticket_id, message_event(instance, is_staff_side(instance.sender))
+        )
+    else:
+        refresh_body(instance.ticket_id)
+
+
+@receiver(post_delete, sender=Message)
+def message_post_delete(sender, instance, **kwargs):
+    refresh_body(instance.ticket_id)
+
+
+# ============================================================
+# ==================== USER: SNAPSHOT ========================
+# ============================================================
+
+# User è di django.contrib.auth: non possiamo aggiungere TrackedModel,
+# quindi lo snapshot dei campi auditati si fa al post_init.
+USER_TRACKED_FIELDS = ("username", "email", "is_staff")
+
+
+@receiver(post_init, sender=User)
+def user_post_init(sender, instance, **kwargs):
+    if instance.pk:
+        snapshot_fields(instance, USER_TRACKED_FIELDS)
+
+
+# ============================================================
+# ==================== USER: PRE SAVE ========================
+# ============================================================
+
+@receiver(pre_save, sender=User)
+def user_pre_save(sender, instance, **kwargs):
+    """
+    Stato precedente dallo snapshot: niente SELECT ad ogni save
+    (es. il last_login ad ogni accesso).
+    """
+    if not instance.pk:
+        return
+
+    loaded = getattr(instance, "_loaded_values", None) or {}
+
+    if "username" in loaded:
+        instance._old_username = loaded["username"]
+        instance._old_email = loaded["email"]
+        instance._old_is_staff = loaded["is_staff"]
+
+
+@receiver(post_save, sender=User)
+def user_post_save(sender, instance, **kwargs):
+    # ✅ lo username compare nelle righe dei ticket in cache
+    old_username = getattr(instance, "_old_username", None)
+    if old_username is not None and old_username != instance.username:
+        bump_user_tickets(instance.pk)
+
+    update_fields = kwargs.get("update_fields")
+    snapshot_fields(instance, update_fields or USER_TRACKED_FIELDS)
+
+
 # ============================================================
 # ==================== USER: DELETE ==========================
 # ============================================================
 
+@receiver(pre_delete, sender=User)
+def user_pre_delete(sender, instance, **kwargs):
+    # ✅ on_delete=SET_NULL svuota assigned_to con un UPDATE diretto, senza
+    #    save(): versione, updated_at e frammenti in cache vanno aggiornati qui
+    assigned = list(
+        Ticket.objects.filter(assigned_to=instance).values_list("id", "status", "priority")
+    )
+    if not assigned:
+        return
+
+    # ✅ contatori: il post_save non parte, il carico passa ai non assegnati
+    apply_ticket_changes(
+        ((status, priority, instance.pk), (status, priority, None))
+        for _, status, priority in assigned
+    )
+
+    ids = [pk for pk, _, _ in assigned]
+    Ticket.objects.filter(pk__in=ids).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    bump_ticket_versions(ids)
+
+
 @receiver(post_delete, sender=User)
 def user_post_delete(sender, instance, **kwargs):
     log_change(
@@ -301,6 +317,30 @@ def user_post_delete(sender, instance, **kwargs):
     )
 
 
+# ============================================================
+# ==================== USER: CAMBIO GRUPPI ===================
+# ============================================================
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalida la cache dei ruoli quando cambiano i gruppi di un utente.
+    """
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+
+    if not reverse:
+        invalidate_roles(instance)
+        return
+
+    # modifica dal lato Group (group.user_set.add/remove/clear)
+    if action == "pre_clear":
+        pk_set = set(instance.user_set.values_list("pk", flat=True))
+
+    for user_id in pk_set or ():
+        invalidate_roles(user_id)
+
+
 # ============================================================
 # ==================== ATTACHMENT: SAVE ======================
 # ============================================================
@@ -308,6 +348,8 @@ def user_post_delete(sender, instance, **kwargs):
 @receiver(post_save, sender=TicketAttachment)
 def attachment_post_save(sender, instance, created, **kwargs):
     if created:
+        publish_after_commit(instance.ticket_id, attachment_event(instance))
+
         log_change(
             actor=instance.uploaded_by,
             target_user=instance.uploaded_by,
@@ -323,6 +365,13 @@ def attachment_post_save(sender, instance, created, **kwargs):
 
 @receiver(post_delete, sender=TicketAttachment)
 def attachment_post_delete(sender, instance, **kwargs):
+    # ✅ contenuto: -1 riferimenti (file rimosso solo se non serve più)
+    if instance.blob_id:
+        release(instance.blob_id)
+    else:
+        remove_legacy_file(instance.file_path)
+    discard_thumbnails(instance)
+
     log_change(
         actor=instance.uploaded_by,
         target_user=instance.uploaded_by,
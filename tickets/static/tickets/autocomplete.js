@@ -0,0 +1,73 @@
+// Campi utente con ricerca per prefisso: al posto di <select> con TUTTI
+// gli utenti, chiede al server solo i primi risultati di ciò che si scrive
+// e riempie un <datalist>. L'id scelto va nel campo hidden del form.
+(function () {
+    "use strict";
+
+    const DELAY_MS = 200;
+
+    function setup(input) {
+        const form = input.form;
+        const hidden = form.querySelector(
+            'input[type="hidden"][name="' + input.dataset.autocompleteTarget + '"]'
+        );
+        const list = document.getElementById(input.getAttribute("list"));
+        const ids = new Map();
+        let timer = null;
+        let controller = null;
+
+        async function load(query) {
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+
+            const url = new URL(input.dataset.autocomplete, window.location.origin);
+            url.searchParams.set("q", query);
+
+            try {
+                const response = await fetch(url, {
+                    signal: controller.signal,
+                    headers: { "X-Requested-With": "XMLHttpRequest" },
+                });
+                if (!response.ok) {
+                    return;
+                }
+                const data = await response.json();
+
+                list.replaceChildren();
+                for (const user of data.results) {
+                    ids.set(user.username, user.id);
+                    const option = document.createElement("option");
+                    option.value = user.username;
+                    if (user.email) {
+                        option.label = user.email;
+                    }
+                    list.appendChild(option);
+                }
+            } catch (err) {
+                if (err.name !== "AbortError") {
+                    throw err;
+                }
+            }
+        }
+
+        input.addEventListener("input", function () {
+            // id valido solo se il testo è esattamente uno username proposto
+            hidden.value = ids.has(input.value) ? ids.get(input.value) : "";
+
+            clearTimeout(timer);
+            timer = setTimeout(function () { load(input.value.trim()); }, DELAY_MS);
+        });
+
+        input.addEventListener("focus", function () {
+            if (!list.children.length) {
+                load(input.value.trim());
+            }
+        }, { once: true });
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll("input[data-autocomplete]").forEach(setup);
+    });
+})();
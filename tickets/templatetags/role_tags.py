@@ -1,7 +1,9 @@
 from django import template
 
+from tickets.utils.roles import has_role
+
 register = template.Library()
 
 @register.filter
 def has_group(user, group_name):
-    return user.groups.filter(name=group_name).exists()
+    return has_role(user, group_name)
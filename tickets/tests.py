@@ -1,3 +1,1665 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache.backends.base import BaseCache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import pre_save
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import (
+    ActivityRollup, AdminLog, AssignmentCursor, EmailOutbox, Message, RollupWatermark,
+    StoredBlob, Ticket, TicketAttachment, VersionConflict,
+)
+from .utils import archive, downloads, fragments, rollups, storage, thumbnails
+from .utils.assignment import auto_assign, claim_next, claim_ticket
+from .utils.importer import get_checkpoint, import_tickets
+from .utils.live import Hub
+from .utils import mailer
+from .utils.mailer import MAX_ATTEMPTS, deliver_outbox
+from .utils.pagination import USER_PAGE_SIZE, decode_cursor, paginate_tickets
+from .utils import roles
+from .utils.stats import get_counters, reconcile_counters
+from .views import chat_messages
+
+
+# ============================================================
+# ========================== BASE ============================
+# ============================================================
+
+class TicketTestCase(TestCase):
+    """
+    Un utente per ruolo (admin / operator / user), password "pw".
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = cls.make_user("adm", "admin")
+        cls.operator = cls.make_user("op", "operator")
+        cls.customer = cls.make_user("cust", "user")
+
+    @staticmethod
+    def make_user(username, role):
+        group, _ = Group.objects.get_or_create(name=role)
+        user = User.objects.create_user(username, f"{username}@example.com", "pw")
+        user.groups.add(group)
+        return user
+
+    def make_ticket(self, **fields):
+        fields.setdefault("title", "Stampante guasta")
+        fields.setdefault("description", "Non stampa")
+        fields.setdefault("created_by", self.customer)
+        return Ticket.objects.create(**fields)
+
+
+# ============================================================
+# ======================= PAGINAZIONE ========================
+# ============================================================
+
+class KeysetPaginationTests(TicketTestCase):
+
+    def setUp(self):
+        # stesso created_at per metà dei ticket: l'id fa da spareggio
+        same = timezone.now()
+        self.tickets = [self.make_ticket(title=f"T{i}") for i in range(7)]
+        Ticket.objects.filter(id__in=[t.id for t in self.tickets[:4]]).update(created_at=same)
+
+    def pages(self, page_size=3):
+        factory = RequestFactory()
+        page = paginate_tickets(factory.get("/"), Ticket.objects.all(), page_size)
+        pages = [page]
+        while page.has_next:
+            page = paginate_tickets(
+                factory.get("/", {"after": page.next_cursor}), Ticket.objects.all(), page_size
+            )
+            pages.append(page)
+        return pages
+
+    def test_walks_every_ticket_once_newest_first(self):
+        pages = self.pages()
+        ids = [t.id for page in pages for t in page]
+
+        expected = list(
+            Ticket.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous)
+        self.assertFalse(pages[-1].has_next)
+
+    def test_before_returns_previous_page(self):
+        first, second = self.pages()[:2]
+        page = paginate_tickets(
+            RequestFactory().get("/", {"before": second.previous_cursor}),
+            Ticket.objects.all(), 3,
+        )
+        self.assertEqual([t.id for t in page], [t.id for t in first])
+        self.assertTrue(page.has_next)
+        self.assertFalse(page.has_previous)
+
+    def test_tampered_cursor_means_first_page(self):
+        self.assertIsNone(decode_cursor("non-un-cursore"))
+        self.client.force_login(self.admin)
+        response = self.client.get("/tickets/", {"after": "%%%"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 7)
+
+
+# ============================================================
+# ========================== INDICI ==========================
+# ============================================================
+
+class IndexUsageTests(TicketTestCase):
+    """
+    EXPLAIN delle query delle liste: ogni lista legge da un indice
+    (range sulle date compreso) e senza sort in memoria.
+    """
+
+    def setUp(self):
+        for status in ("open", "in_progress", "closed"):
+            self.make_ticket(status=status, assigned_to=self.operator if status != "open" else None)
+        AdminLog.objects.bulk_create([AdminLog(actor=self.admin, action="LOGIN") for _ in range(3)])
+
+    def plans(self, user, url, params=None, table="tickets_ticket"):
+        """
+        Piano di esecuzione delle query sulla tabella fatte dalla pagina.
+        """
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+
+        plans = []
+        for query in ctx.captured_queries:
+            if f'FROM "{table}"' not in query["sql"].replace("`", '"'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}")
+                plans.append((query["sql"], " | ".join(" ".join(map(str, row)) for row in cursor.fetchall())))
+        return plans
+
+    def assertListingUses(self, index, user, url, params=None, table="tickets_ticket"):
+        # la query della lista è quella ordinata (le altre sono aggregati)
+        listing = [
+            plan for sql, plan in self.plans(user, url, params, table)
+            if "ORDER BY" in sql
+        ]
+        self.assertTrue(listing, f"nessuna query di lista su {table}")
+        for plan in listing:
+            self.assertIn(index, plan)
+            self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+            self.assertNotIn("filesort", plan)
+
+    def test_ticket_list(self):
+        self.assertListingUses("ticket_created_id_idx", self.admin, "/tickets/")
+
+    def test_ticket_list_date_range(self):
+        self.assertListingUses(
+            "ticket_created_id_idx", self.admin, "/tickets/",
+            {"date_from": "2025-01-01", "date_to": "2025-12-31"},
+        )
+
+    def test_my_tickets(self):
+        self.assertListingUses("ticket_creator_created_idx", self.customer, "/tickets/my/")
+
+    def test_operator_open(self):
+        self.assertListingUses("ticket_status_assignee_idx", self.operator, "/tickets/operator/open/")
+
+    def test_operator_assigned(self):
+        self.assertListingUses(
+            "ticket_assignee_created_idx", self.operator, "/tickets/operator/assigned/"
+        )
+        self.assertListingUses("ticket_assignee_created_idx", self.operator, "/tickets/operator/")
+
+    def test_admin_logs(self):
+        self.assertListingUses(
+            "adminlog_timestamp_idx", self.admin, "/tickets/admin/logs/", table="tickets_adminlog"
+        )
+        self.assertListingUses(
+            "adminlog_timestamp_idx", self.admin, "/tickets/admin/logs/",
+            {"from": "2025-01-01", "to": "2025-01-31"}, table="tickets_adminlog",
+        )
+
+    def test_report_ranges(self):
+        for params in (
+            {"from": "2025-01-01", "to": "2025-01-31"},
+            {"month": "3", "year": "2025"},
+            {"year": "2025"},
+        ):
+            plans = self.plans(
+                self.admin, "/tickets/admin/report/", params, table="tickets_activityrollup"
+            )
+            self.assertEqual(len(plans), 3)
+            for _, plan in plans:
+                self.assertIn("rollup_action_day_idx", plan)
+
+    def test_user_autocomplete(self):
+        for user, fields in ((self.operator, ("username",)), (self.admin, ("username", "email"))):
+            plans = [
+                plan for sql, plan in self.plans(
+                    user, "/tickets/users/autocomplete/", {"q": "Op"}, table="auth_user"
+                )
+                if "UPPER" in sql
+            ]
+            self.assertEqual(len(plans), 1)
+            for field in fields:
+                self.assertIn(f"auth_user_{field}_upper_idx", plans[0])
+            self.assertNotIn("SCAN auth_user", plans[0])
+
+    def test_report_invalid_dates(self):
+        # date inesistenti o malformate vengono ignorate, niente 500
+        self.client.force_login(self.admin)
+        for params in (
+            {"from": "2025-02-30", "to": "2025-02-31"},
+            {"from": "2025-13-01"},
+            {"month": "x", "year": "2025"},
+        ):
+            response = self.client.get("/tickets/admin/report/", params)
+            self.assertEqual(response.status_code, 200)
+
+
+# ============================================================
+# ===================== AUTOCOMPLETE UTENTI ==================
+# ============================================================
+
+class UserAutocompleteTests(TicketTestCase):
+
+    url = "/tickets/users/autocomplete/"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for name in ("Olga", "oscar", "ottavio", "paolo"):
+            cls.make_user(name, "operator" if name != "paolo" else "user")
+        User.objects.filter(username="paolo").update(email="Ospite@example.com")
+
+    def search(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def usernames(self, data):
+        return [row["username"] for row in data["results"]]
+
+    def test_prefix_ignores_case(self):
+        data = self.search(self.operator, q="O")
+        self.assertEqual(self.usernames(data), ["Olga", "op", "oscar", "ottavio"])
+        self.assertNotIn("email", data["results"][0])
+
+        self.assertEqual(self.usernames(self.search(self.operator, q="OS")), ["oscar"])
+
+    def test_admin_matches_email(self):
+        data = self.search(self.admin, q="osp")
+        self.assertEqual(self.usernames(data), ["paolo"])
+        self.assertEqual(data["results"][0]["email"], "Ospite@example.com")
+
+        # gli operatori cercano solo per username
+        self.assertEqual(self.usernames(self.search(self.operator, q="osp")), [])
+
+    def test_role_and_pages(self):
+        first = self.search(self.operator, q="o", role="operator", limit=2)
+        self.assertEqual(self.usernames(first), ["Olga", "op"])
+        self.assertEqual(first["next"], "op")
+
+        second = self.search(self.operator, q="o", role="operator", limit=2, after=first["next"])
+        self.assertEqual(self.usernames(second), ["oscar", "ottavio"])
+        self.assertIsNone(second["next"])
+
+    def test_access_and_bad_limit(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get(self.url, {"q": "o"}).status_code, 302)
+
+        self.client.force_login(self.operator)
+        self.assertEqual(self.client.get(self.url, {"limit": "x"}).status_code, 400)
+
+
+class AdminUsersTests(TicketTestCase):
+
+    url = "/tickets/admin/users/"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        operators = Group.objects.get(name="operator")
+        users = User.objects.bulk_create([
+            User(username=f"utente{i:03}", email=f"U{i:03}@example.com") for i in range(110)
+        ])
+        operators.user_set.add(*users[::2])
+
+    def page(self, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["page"]
+
+    def test_prefix_search(self):
+        self.assertEqual([u.username for u in self.page(q="OP")], ["op"])
+        self.assertEqual([u.username for u in self.page(q="u007")], ["utente007"])
+        self.assertEqual(len(self.page(q="Utente01")), 10)
+
+    def test_pages(self):
+        first = self.page(q="utente")
+        self.assertEqual(len(first), USER_PAGE_SIZE)
+        self.assertEqual(first.next_cursor, f"utente{USER_PAGE_SIZE - 1:03}")
+        self.assertFalse(first.has_previous)
+
+        second = self.page(q="utente", after=first.next_cursor)
+        self.assertEqual([u.username for u in second][0], f"utente{USER_PAGE_SIZE:03}")
+        self.assertEqual(len(second), 110 - USER_PAGE_SIZE)
+        self.assertFalse(second.has_next)
+
+        back = self.page(q="utente", before=second.previous_cursor)
+        self.assertEqual([u.username for u in back], [u.username for u in first])
+
+    def test_roles_prefetched_per_page(self):
+        self.page()   # ruoli di chi guarda già in cache
+
+        def queries(**params):
+            with CaptureQueriesContext(connection) as ctx:
+                page = self.page(**params)
+            return len(page), len(ctx.captured_queries)
+
+        full, many = queries(q="utente")
+        few, some = queries(q="utente10")
+
+        # stesso numero di query con 100 righe o con 10
+        self.assertEqual((full, few), (USER_PAGE_SIZE, 10))
+        self.assertEqual(many, some)
+        self.assertContains(
+            self.client.get(self.url, {"q": "utente000"}), "bg-primary"
+        )
+
+
+# ============================================================
+# ========================= RICERCA ==========================
+# ============================================================
+
+class SearchScopeTests(TicketTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = cls.make_user("altro", "user")
+
+    def setUp(self):
+        # i ticket degli altri sono più rilevanti (parola ripetuta)
+        self.foreign = [
+            self.make_ticket(
+                title=f"Stampante {i}", description="stampante stampante stampante",
+                created_by=self.other,
+            )
+            for i in range(5)
+        ]
+        self.mine = self.make_ticket(title="Richiesta", description="la stampante è lenta")
+
+    def test_scope_is_applied_before_the_limit(self):
+        from .utils.search import search_tickets
+
+        hits = search_tickets("stampante", limit=1)
+        self.assertNotEqual(hits[0].ticket_id, self.mine.id)
+
+        scope = Ticket.objects.filter(created_by=self.customer)
+        hits = search_tickets("stampante", scope=scope, limit=1)
+        self.assertEqual([h.ticket_id for h in hits], [self.mine.id])
+
+    def test_customer_finds_own_ticket(self):
+        self.client.force_login(self.customer)
+
+        with mock.patch("tickets.utils.search.SEARCH_LIMIT", 1):
+            response = self.client.get("/tickets/my/", {"q": "stampante"})
+
+        self.assertEqual([t.id for t in response.context["page"]], [self.mine.id])
+        self.assertContains(response, "<mark>stampante</mark>")
+
+    def test_filters_are_applied_inside_the_search(self):
+        Ticket.objects.filter(id=self.foreign[-1].id).update(status="closed")
+        self.client.force_login(self.admin)
+
+        response = self.client.get("/tickets/", {"q": "stampante", "status": "closed"})
+        self.assertEqual([t.id for t in response.context["page"]], [self.foreign[-1].id])
+
+    def test_ranked_results_are_paged(self):
+        from .utils.pagination import paginate_search
+
+        factory = RequestFactory()
+        tickets = Ticket.objects.all()
+
+        page = paginate_search(factory.get("/"), "stampante", tickets, page_size=4)
+        seen = [t.id for t in page]
+        self.assertEqual(len(seen), 4)
+        self.assertFalse(page.has_previous)
+
+        last = paginate_search(
+            factory.get("/", {"after": page.next_cursor}), "stampante", tickets, page_size=4
+        )
+        seen += [t.id for t in last]
+        self.assertFalse(last.has_next)
+        self.assertEqual(sorted(seen), sorted(t.id for t in self.foreign + [self.mine]))
+        # il ticket meno rilevante è in fondo alla classifica
+        self.assertEqual(seen[-1], self.mine.id)
+
+        back = paginate_search(
+            factory.get("/", {"before": last.previous_cursor}), "stampante", tickets, page_size=4
+        )
+        self.assertEqual([t.id for t in back], [t.id for t in page])
+
+    def test_export_is_not_truncated(self):
+        self.client.force_login(self.admin)
+
+        with mock.patch("tickets.utils.search.SEARCH_LIMIT", 2):
+            response = self.client.get("/tickets/export/", {"q": "stampante", "format": "jsonl"})
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+
+
+# ============================================================
+# ========================= OUTBOX ===========================
+# ============================================================
+
+class FailingSendBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise OSError("invio rifiutato")
+
+
+class UnreachableBackend(EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("SMTP irraggiungibile")
+
+
+class OutboxTests(TicketTestCase):
+
+    def queue(self, count=2):
+        EmailOutbox.objects.all().delete()
+        return [
+            EmailOutbox.objects.create(
+                subject=f"Email {i}", text_content="testo", recipients=["a@example.com"]
+            )
+            for i in range(count)
+        ]
+
+    def test_sent_and_logged(self):
+        self.queue()
+        self.assertEqual(deliver_outbox(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(EmailOutbox.objects.filter(status="sent").count(), 2)
+
+    def test_send_error_retries_with_backoff(self):
+        item = self.queue(1)[0]
+        self.assertEqual(deliver_outbox(mail_connection=FailingSendBackend()), (0, 1))
+
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.attempts), ("pending", 1))
+        self.assertGreater(item.next_attempt_at, timezone.now())
+        self.assertIn("invio rifiutato", item.last_error)
+
+        # non ancora scaduta: il lotto successivo la salta
+        self.assertEqual(deliver_outbox(mail_connection=FailingSendBackend()), (0, 0))
+
+        EmailOutbox.objects.update(attempts=MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        deliver_outbox(mail_connection=FailingSendBackend())
+        item.refresh_from_db()
+        self.assertEqual(item.status, "dead")
+
+    def test_unreachable_server_backs_off_whole_batch(self):
+        self.queue(3)
+        self.assertEqual(deliver_outbox(mail_connection=UnreachableBackend()), (0, 3))
+
+        for item in EmailOutbox.objects.all():
+            self.assertEqual((item.status, item.attempts), ("pending", 1))
+            self.assertGreater(item.next_attempt_at, timezone.now() + timedelta(seconds=30))
+            self.assertIn("ConnectionRefusedError", item.last_error)
+
+    def test_rows_claimed_before_sending(self):
+        self.queue(2)
+        seen = []
+
+        class CheckingBackend(EmailBackend):
+            def send_messages(self, messages):
+                seen.append(sorted(EmailOutbox.objects.values_list("status", flat=True)))
+                return super().send_messages(messages)
+
+        deliver_outbox(mail_connection=CheckingBackend())
+
+        # la prima email parte con tutto il lotto già "sending" (preso in carico)
+        self.assertEqual(seen[0], ["sending", "sending"])
+
+    def test_crash_mid_batch_does_not_resend(self):
+        first, second, third = self.queue(3)
+        calls = []
+        mark_sent = mailer._mark_sent
+
+        def crash_on_second(item, users):
+            calls.append(item.pk)
+            if len(calls) == 2:
+                raise ConnectionError("database giù")
+            mark_sent(item, users)
+
+        with mock.patch.object(mailer, "_mark_sent", crash_on_second):
+            with self.assertRaises(ConnectionError):
+                deliver_outbox()
+
+        self.assertEqual(EmailOutbox.objects.get(pk=first.pk).status, "sent")
+        self.assertEqual(EmailOutbox.objects.get(pk=third.pk).status, "sending")
+
+        # presa in carico ancora valida: nessun altro worker le legge
+        self.assertEqual(deliver_outbox(), (0, 0))
+
+        # scaduta: ripartono solo quelle senza esito registrato
+        EmailOutbox.objects.filter(status="sending").update(next_attempt_at=timezone.now())
+        mail.outbox.clear()
+        self.assertEqual(deliver_outbox(), (2, 0))
+        self.assertEqual([m.subject for m in mail.outbox], ["Email 1", "Email 2"])
+        self.assertEqual(
+            AdminLog.objects.filter(action="EMAIL SENT").count(), 3
+        )
+
+    def test_worker_survives_errors(self):
+        calls = []
+
+        def deliver(batch_size):
+            calls.append(batch_size)
+            if len(calls) == 1:
+                raise ConnectionRefusedError("database giù")
+            raise KeyboardInterrupt
+
+        with mock.patch("tickets.management.commands.send_outbox.deliver_outbox", deliver), \
+                mock.patch("tickets.management.commands.send_outbox.time.sleep"), \
+                self.assertLogs("tickets.management.commands.send_outbox", "ERROR"):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("send_outbox", stderr=mock.MagicMock())
+
+        self.assertEqual(len(calls), 2)
+
+
+# ============================================================
+# ========================= ARCHIVIO =========================
+# ============================================================
+
+class ArchiveTests(TicketTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        override = override_settings(AUDIT_ARCHIVE_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        AdminLog.objects.bulk_create([
+            AdminLog(actor=self.operator, action=f"LOGIN {i}") for i in range(5)
+        ])
+        # auto_now_add: la data si sposta indietro dopo l'inserimento
+        old = timezone.now() - timedelta(days=400)
+        for i, log in enumerate(AdminLog.objects.order_by("id")):
+            AdminLog.objects.filter(pk=log.pk).update(timestamp=old + timedelta(minutes=i))
+        # si archiviano solo log già aggregati nei rollup
+        rollups.run_rollup()
+        self.recent = AdminLog.objects.create(actor=self.admin, action="LOGIN")
+
+    def rollup_totals(self):
+        return sorted(ActivityRollup.objects.values_list("day", "actor_id", "action", "count"))
+
+    def test_archive_and_read_back(self):
+        self.assertEqual(archive.archive_logs(days=30, batch_size=2), 5)
+
+        self.assertEqual(list(AdminLog.objects.values_list("pk", flat=True)), [self.recent.pk])
+        self.assertEqual(archive.verify_archive(), [])
+        self.assertEqual(sum(p["rows"] for p in archive.load_manifest()["parts"]), 5)
+
+        # dal più recente, con i filtri di admin_logs
+        logs = list(archive.iter_archived_logs())
+        self.assertEqual([log.action for log in logs], [f"LOGIN {i}" for i in reversed(range(5))])
+        self.assertEqual(logs[0].actor.username, "op")
+        self.assertEqual(
+            [log.action for log in archive.iter_archived_logs(action="login 3")], ["LOGIN 3"]
+        )
+
+    def test_admin_logs_reads_archive(self):
+        archive.archive_logs(days=30)
+
+        self.client.force_login(self.admin)
+        start = timezone.localdate() - timedelta(days=500)
+        response = self.client.get("/tickets/admin/logs/", {"from": start.isoformat()})
+
+        self.assertContains(response, "LOGIN 4")
+        self.assertContains(response, "LOGIN 0")
+
+    def test_rows_kept_when_write_fails(self):
+        with mock.patch.object(archive.os, "fsync", side_effect=OSError("disco pieno")):
+            with self.assertRaises(OSError):
+                archive.archive_logs(days=30)
+
+        self.assertEqual(AdminLog.objects.count(), 6)
+        self.assertEqual(archive.load_manifest(), {"parts": []})
+
+    def test_only_rolled_up_logs_are_archived(self):
+        first, second = AdminLog.objects.order_by("id")[:2]
+        RollupWatermark.objects.filter(name=rollups.WATERMARK_NAME).update(last_id=second.pk)
+
+        self.assertEqual(archive.archive_logs(days=30), 2)
+        self.assertFalse(AdminLog.objects.filter(pk__in=[first.pk, second.pk]).exists())
+        self.assertEqual(AdminLog.objects.count(), 4)
+
+    def test_rebuild_reads_archive(self):
+        self.make_ticket()   # log recenti, oltre il SAFETY_LAG
+        AdminLog.objects.filter(action="TICKET CREATE").update(
+            timestamp=timezone.now() - timedelta(hours=1)
+        )
+        rollups.run_rollup()
+        before = self.rollup_totals()
+
+        archive.archive_logs(days=30)
+        rollups.rebuild_rollups(batch_size=2)
+
+        self.assertEqual(self.rollup_totals(), before)
+
+    def test_rebuild_skips_parts_still_in_table(self):
+        before = self.rollup_totals()
+
+        # crash tra manifest e DELETE: il lotto è sia nei file che nella tabella
+        with transaction.atomic():
+            archive.archive_logs(days=30)
+            transaction.set_rollback(True)
+
+        self.assertEqual(AdminLog.objects.count(), 6)
+        self.assertEqual(rollups.rebuild_rollups(), 5)
+        self.assertEqual(self.rollup_totals(), before)
+
+    def test_rerun_is_idempotent(self):
+        archive.archive_logs(days=30)
+        manifest = archive.load_manifest()
+
+        self.assertEqual(archive.archive_logs(days=30), 0)
+        self.assertEqual(archive.load_manifest(), manifest)
+        self.assertTrue(os.path.exists(os.path.join(self.root, archive.MANIFEST_NAME)))
+
+
+# ============================================================
+# ================== STORAGE DEDUPLICATO =====================
+# ============================================================
+
+class StorageTests(TicketTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(SECURE_UPLOAD_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.ticket = self.make_ticket()
+
+    def attach(self, content=b"%PDF contenuto"):
+        blob = storage.store_chunks([content])
+        return TicketAttachment.objects.create(
+            ticket=self.ticket,
+            uploaded_by=self.customer,
+            blob=blob,
+            file_name="doc.pdf",
+            file_path=storage.blob_relative_path(blob.sha256),
+            file_size=blob.size,
+            mime_type="application/pdf",
+        )
+
+    def path(self, attachment):
+        return storage.attachment_path(attachment)
+
+    def test_same_content_is_stored_once(self):
+        first, second = self.attach(), self.attach()
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+        self.assertTrue(os.path.exists(self.path(first)))
+
+    def test_file_removed_with_last_reference(self):
+        first, second = self.attach(), self.attach()
+        path = self.path(first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_upload_between_release_and_collect(self):
+        attachment = self.attach()
+        path = self.path(attachment)
+
+        # l'ultimo riferimento se ne va, ma prima della raccolta (on_commit)
+        # arriva un upload dello stesso contenuto
+        with self.captureOnCommitCallbacks() as callbacks:
+            attachment.delete()
+        again = self.attach()
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(self.path(again)))
+        self.assertEqual(path, self.path(again))
+
+    def test_missing_file_is_restored(self):
+        # raccolta interrotta dopo la rimozione del file: la riga è a zero
+        attachment = self.attach()
+        with self.captureOnCommitCallbacks():
+            attachment.delete()
+        os.remove(self.path(attachment))
+
+        again = self.attach()
+
+        self.assertTrue(os.path.exists(self.path(again)))
+        self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+
+    def test_sweep_removes_orphans(self):
+        kept = self.attach()
+
+        # upload finito in rollback: file senza riga
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                orphan = storage.store_chunks([b"mai salvato"])
+                raise RuntimeError
+        orphan_path = storage.absolute_path(storage.blob_relative_path(orphan.sha256))
+        self.assertTrue(os.path.exists(orphan_path))
+
+        # blob a zero riferimenti rimasto da un processo interrotto
+        StoredBlob.objects.create(sha256="0" * 64, size=1, ref_count=0)
+
+        self.assertEqual(storage.sweep_orphans(grace=3600), (1, 0))
+        self.assertTrue(os.path.exists(orphan_path))
+
+        self.assertEqual(storage.sweep_orphans(grace=-1), (0, 1))
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertTrue(os.path.exists(self.path(kept)))
+
+    def test_logs_of_rows_deleted_in_same_transaction(self):
+        attachment = self.attach()
+        leaving = self.make_user("leaving", "user")
+        leaving_id = leaving.pk
+
+        # log scritti dopo il commit: ticket e utente non esistono più
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ticket.delete()
+            leaving.delete()
+
+        detached = AdminLog.objects.get(action="ATTACHMENT DELETE")
+        self.assertIsNone(detached.ticket_id)
+        self.assertIn(f"Ticket eliminato: #{attachment.ticket_id}", detached.details)
+
+        removed = AdminLog.objects.get(action="USER DELETE")
+        self.assertIsNone(removed.actor_id)
+        self.assertIsNone(removed.target_user_id)
+        self.assertEqual(removed.details.count(f"Utente eliminato: #{leaving_id}"), 1)
+
+        # i riferimenti ancora validi restano
+        self.assertEqual(detached.actor, self.customer)
+
+
+# ============================================================
+# ========================= DOWNLOAD =========================
+# ============================================================
+
+class DownloadTests(TicketTestCase):
+
+    content = b"%PDF-1.7 0123456789"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(SECURE_UPLOAD_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        blob = storage.store_chunks([self.content])
+        self.attachment = TicketAttachment.objects.create(
+            ticket=self.make_ticket(),
+            uploaded_by=self.customer,
+            blob=blob,
+            file_name="doc.pdf",
+            file_path=storage.blob_relative_path(blob.sha256),
+            file_size=blob.size,
+            mime_type="application/pdf",
+        )
+        self.url = f"/tickets/secure-download/{self.attachment.id}/"
+        self.etag = f'"{blob.sha256}"'
+        self.client.force_login(self.customer)
+
+    def get(self, **headers):
+        return self.client.get(self.url, headers=headers)
+
+    def body(self, response):
+        return b"".join(response.streaming_content)
+
+    def downloads(self):
+        return AdminLog.objects.filter(action="ATTACHMENT DOWNLOAD").count()
+
+    def test_full_download(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("attachment", response["Content-Disposition"])
+        self.assertEqual(self.downloads(), 1)
+
+    def test_range(self):
+        size = len(self.content)
+
+        response = self.get(Range="bytes=0-3")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), b"%PDF")
+        self.assertEqual(response["Content-Range"], f"bytes 0-3/{size}")
+        self.assertEqual(response["Content-Length"], "4")
+
+        response = self.get(Range="bytes=-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), b"6789")
+
+        # fine oltre il file: troncata all'ultimo byte
+        response = self.get(Range="bytes=9-999")
+        self.assertEqual(self.body(response), self.content[9:])
+
+        # i pezzi di Range non contano come download
+        self.assertEqual(self.downloads(), 0)
+
+    def test_unsatisfiable_range(self):
+        size = len(self.content)
+
+        for header in (f"bytes={size}-", "bytes=5-2", "bytes=-0"):
+            with self.subTest(header=header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+        # multi-range o sintassi sconosciuta: file intero
+        self.assertEqual(self.get(Range="bytes=0-1,4-5").status_code, 200)
+
+    def test_if_range(self):
+        response = self.get(Range="bytes=0-3", If_Range=self.etag)
+        self.assertEqual(response.status_code, 206)
+
+        # file cambiato (o ETag debole): il Range non vale, file intero
+        for value in ('"altro"', f"W/{self.etag}"):
+            with self.subTest(if_range=value):
+                response = self.get(Range="bytes=0-3", If_Range=value)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.body(response), self.content)
+
+    def test_not_modified(self):
+        response = self.get(If_None_Match=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.downloads(), 0)
+
+    def test_x_accel_redirect(self):
+        with mock.patch.object(downloads, "OFFLOAD", "nginx"):
+            response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            downloads.ACCEL_PREFIX + self.attachment.file_path,
+        )
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["ETag"], self.etag)
+
+    async def test_range_under_asgi(self):
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(self.url, headers={"Range": "bytes=4-7"})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b"".join([chunk async for chunk in response.streaming_content]), b"-1.7")
+
+    def test_other_customer(self):
+        self.client.force_login(self.make_user("altro", "user"))
+        self.assertEqual(self.get().status_code, 404)
+
+
+# ============================================================
+# ========================= MINIATURE ========================
+# ============================================================
+
+class ThumbnailTests(TicketTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(SECURE_UPLOAD_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.ticket = self.make_ticket()
+        self.client.force_login(self.customer)
+
+    def attach(self, content=b"\x89PNG immagine"):
+        blob = storage.store_chunks([content])
+        return TicketAttachment.objects.create(
+            ticket=self.ticket,
+            uploaded_by=self.customer,
+            blob=blob,
+            file_name="foto.png",
+            file_path=storage.blob_relative_path(blob.sha256),
+            file_size=blob.size,
+            mime_type="image/png",
+        )
+
+    def make_thumbnails(self, attachment, content=b"miniatura"):
+        paths = []
+        for size in thumbnails.THUMBNAIL_SIZES:
+            path = storage.absolute_path(thumbnails.thumbnail_relative_path(attachment, size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content + size.encode())
+            paths.append(path)
+        return paths
+
+    def preview(self, attachment, **headers):
+        url = f"/tickets/attachment/{attachment.id}/preview/"
+        return self.client.get(url, {"size": "sm"}, headers=headers)
+
+    def test_ready_thumbnail_is_served(self):
+        attachment = self.attach()
+        self.make_thumbnails(attachment)
+
+        with mock.patch.object(thumbnails, "schedule_thumbnails") as schedule:
+            response = self.preview(attachment)
+
+        schedule.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"miniaturasm")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("foto-sm.png", response["Content-Disposition"])
+
+        # stessa miniatura già in cache nel browser
+        response = self.preview(attachment, If_None_Match=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_thumbnail_is_scheduled(self):
+        attachment = self.attach()
+
+        with mock.patch.object(thumbnails, "schedule_thumbnails") as schedule:
+            response = self.preview(attachment)
+
+        # intanto l'originale
+        schedule.assert_called_once_with(attachment, sizes=["sm"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"\x89PNG immagine")
+
+    def test_invalid_size(self):
+        attachment = self.attach()
+        url = f"/tickets/attachment/{attachment.id}/preview/"
+        self.assertEqual(self.client.get(url, {"size": "xl"}).status_code, 404)
+
+    def test_shared_content_shares_thumbnails(self):
+        first, second = self.attach(), self.attach()
+        self.assertEqual(
+            thumbnails.thumbnail_relative_path(first, "sm"),
+            thumbnails.thumbnail_relative_path(second, "sm"),
+        )
+
+    def test_discard_on_delete(self):
+        first, second = self.attach(), self.attach()
+        paths = self.make_thumbnails(first)
+
+        # lo stesso contenuto serve ancora al secondo allegato
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_discard_waits_for_commit(self):
+        attachment = self.attach()
+        paths = self.make_thumbnails(attachment)
+
+        with self.captureOnCommitCallbacks(execute=False):
+            attachment.delete()
+
+        # rollback: nessuna callback eseguita, miniature intatte
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+
+# ============================================================
+# ======================== CHAT LIVE =========================
+# ============================================================
+
+class LiveChatTests(TicketTestCase):
+
+    def setUp(self):
+        self.ticket = self.make_ticket()
+        self.url = f"/tickets/{self.ticket.id}/"
+
+    def test_xhr_post_returns_message(self):
+        self.client.force_login(self.operator)
+        response = self.client.post(
+            self.url, {"text": "Ciao"}, headers={"X-Requested-With": "XMLHttpRequest"}
+        )
+
+        self.assertEqual(response.status_code, 201)
+        message = Message.objects.get(ticket=self.ticket)
+        data = response.json()
+        # ✅ stesso id dell'evento SSE: la pagina lo mostra una volta sola
+        self.assertEqual(data["id"], message.id)
+        self.assertEqual(data["text"], "Ciao")
+        self.assertTrue(data["is_staff_side"])
+
+    def test_xhr_post_without_text(self):
+        self.client.force_login(self.customer)
+        response = self.client.post(
+            self.url, {"text": " "}, headers={"X-Requested-With": "XMLHttpRequest"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.exists())
+
+    def test_no_live_chat_under_wsgi(self):
+        self.client.force_login(self.customer)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "EventSource")
+        self.assertNotContains(response, "X-Requested-With")
+
+        response = self.client.get(f"{self.url}events/")
+        self.assertEqual(response.status_code, 204)
+
+    async def test_live_chat_under_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.customer)
+
+        response = await client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "EventSource")
+        self.assertContains(response, "renderChatMessage")
+
+    def test_hub_publish_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Hub()
+
+
+# ============================================================
+# ======================= FEED MESSAGGI ======================
+# ============================================================
+
+class MessageFeedTests(TicketTestCase):
+
+    def setUp(self):
+        self.ticket = self.make_ticket()
+        self.url = f"/tickets/{self.ticket.id}/messages/"
+        self.messages = [
+            Message.objects.create(ticket=self.ticket, sender=sender, text=f"Messaggio {i}")
+            for i, sender in enumerate([self.customer, self.operator, self.customer, self.operator])
+        ]
+        # stesso istante per tutti: l'ordine lo decide l'id
+        Message.objects.filter(ticket=self.ticket).update(created_at=timezone.now())
+        Message.objects.create(ticket=self.make_ticket(), sender=self.customer, text="Altro ticket")
+
+    def feed(self, user=None, **params):
+        self.client.force_login(user or self.customer)
+        return self.client.get(self.url, params)
+
+    def ids(self, response):
+        return [m["id"] for m in response.json()["messages"]]
+
+    def test_all_messages_in_order(self):
+        response = self.feed()
+        data = response.json()
+
+        self.assertEqual(self.ids(response), [m.id for m in self.messages])
+        self.assertEqual([m["staff"] for m in data["messages"]], [False, True, False, True])
+        self.assertEqual(data["last_id"], self.messages[-1].id)
+        self.assertFalse(data["has_more"])
+
+    def test_after_cursor(self):
+        second = self.messages[1].id
+
+        response = self.feed(after=second)
+        self.assertEqual(self.ids(response), [m.id for m in self.messages[2:]])
+
+        # pagine con limit: last_id è il cursore successivo
+        data = self.feed(limit=3).json()
+        self.assertTrue(data["has_more"])
+        rest = self.feed(after=data["last_id"], limit=3).json()
+        self.assertEqual([m["id"] for m in rest["messages"]], [self.messages[-1].id])
+        self.assertFalse(rest["has_more"])
+
+        # nulla di nuovo: cursore invariato
+        data = self.feed(after=self.messages[-1].id).json()
+        self.assertEqual((data["messages"], data["last_id"]), ([], self.messages[-1].id))
+
+    def test_after_unknown_or_foreign_id(self):
+        # id di un altro ticket o cancellato: solo id successivi
+        foreign = Message.objects.exclude(ticket=self.ticket).get()
+        self.assertEqual(self.ids(self.feed(after=foreign.id)), [])
+
+        deleted = self.messages[1].id
+        Message.objects.filter(pk=deleted).delete()
+        self.assertEqual(self.ids(self.feed(after=deleted)), [m.id for m in self.messages[2:]])
+
+    def test_not_modified(self):
+        etag = self.feed(after=self.messages[1].id)["ETag"]
+
+        response = self.client.get(
+            self.url, {"after": self.messages[1].id}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        Message.objects.create(ticket=self.ticket, sender=self.operator, text="Nuovo")
+        response = self.client.get(
+            self.url, {"after": self.messages[1].id}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["messages"]), 3)
+
+    def test_visibility(self):
+        self.assertEqual(self.feed(self.operator).status_code, 200)
+        self.assertEqual(self.feed(self.admin).status_code, 200)
+        self.assertEqual(self.feed(self.make_user("altro", "user")).status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_bad_params(self):
+        self.assertEqual(self.feed(after="x").status_code, 400)
+        self.assertEqual(self.feed(limit="x").status_code, 400)
+
+
+# ============================================================
+# ================== FRAMMENTI IN CACHE ======================
+# ============================================================
+
+class FragmentDependencyTests(TestCase):
+    """
+    I frammenti in cache cambiano versione solo con il ticket e con gli
+    username (vedi utils/fragments.py): non devono mostrare messaggi o
+    allegati, che non cambiano la versione.
+    """
+
+    def test_fragments_do_not_use_messages_or_attachments(self):
+        components = os.path.join(os.path.dirname(__file__), "templates", "tickets", "components")
+        templates = [os.path.join(components, "ticket_header.html")] + [
+            os.path.join(components, "rows", name)
+            for name in os.listdir(os.path.join(components, "rows"))
+        ]
+
+        for path in templates:
+            with open(path, encoding="utf-8") as f:
+                tags = " ".join(re.findall(r"{[{%].*?[}%]}", f.read()))
+            with self.subTest(template=os.path.basename(path)):
+                self.assertNotRegex(tags, r"messages?\b|attachments?\b")
+
+
+class AsyncFragmentTests(TicketTestCase):
+    """
+    Le view async leggono e scrivono i frammenti in un solo passaggio al
+    thread pool: niente aget_many/aset_many (un sync_to_async per chiave).
+    """
+
+    def setUp(self):
+        for i in range(5):
+            self.make_ticket(title=f"Guasto {i}")
+
+    async def test_list_and_detail(self):
+        await self.async_client.aforce_login(self.operator)
+        ticket = await Ticket.objects.afirst()
+
+        with mock.patch.object(BaseCache, "aget_many", side_effect=AssertionError), \
+                mock.patch.object(BaseCache, "aset_many", side_effect=AssertionError):
+            for _ in range(2):   # frammenti mancanti, poi dalla cache
+                response = await self.async_client.get("/tickets/")
+                self.assertContains(response, "Guasto 4")
+
+                response = await self.async_client.get(f"/tickets/{ticket.id}/")
+                self.assertContains(response, ticket.title)
+
+
+# ============================================================
+# =========================== IMPORT =========================
+# ============================================================
+
+class ImportCheckpointTests(TicketTestCase):
+
+    def write_records(self, prefix, count):
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for i in range(count):
+                f.write(json.dumps({
+                    "external_id": f"{prefix}-{i}",
+                    "title": f"Ticket {i}",
+                    "description": "Importato",
+                    "created_by": "cust",
+                }) + "\n")
+        return path
+
+    def test_long_names_do_not_share_checkpoint(self):
+        # stesso prefisso oltre i 50 caratteri: prima venivano troncati
+        # allo stesso checkpoint e il secondo import saltava i suoi record
+        base = "export-helpdesk-legacy-sede-centrale-2024-completo-"
+        first = self.write_records("A", 3)
+        second = self.write_records("B", 2)
+
+        import_tickets(first, actor=self.admin, name=base + "gennaio.jsonl")
+        result = import_tickets(second, actor=self.admin, name=base + "febbraio.jsonl")
+
+        self.assertEqual(result.resumed_from, 0)
+        self.assertEqual(result.tickets, 2)
+        self.assertEqual(get_checkpoint(base + "gennaio.jsonl"), 3)
+        self.assertEqual(get_checkpoint(base + "febbraio.jsonl"), 2)
+
+    def test_resume_and_restart(self):
+        path = self.write_records("A", 3)
+        import_tickets(path, actor=self.admin, name="hd.jsonl")
+
+        resumed = import_tickets(path, actor=self.admin, name="hd.jsonl")
+        self.assertEqual((resumed.resumed_from, resumed.tickets), (3, 0))
+
+        restarted = import_tickets(path, actor=self.admin, name="hd.jsonl", restart=True)
+        self.assertEqual(restarted.resumed_from, 0)
+        self.assertEqual(restarted.duplicates, 3)
+
+
+# ============================================================
+# ====================== PRESA IN CARICO =====================
+# ============================================================
+
+class AssignmentTests(TicketTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = cls.make_user("op2", "operator")
+
+    def test_concurrent_claims_have_one_winner(self):
+        ticket = self.make_ticket()
+        # due richieste che hanno letto lo stesso ticket ancora libero
+        first, second = Ticket.objects.get(pk=ticket.pk), Ticket.objects.get(pk=ticket.pk)
+
+        self.assertTrue(claim_ticket(first, self.operator))
+        self.assertFalse(claim_ticket(second, self.other))
+
+        ticket.refresh_from_db()
+        self.assertEqual((ticket.status, ticket.assigned_to), ("in_progress", self.operator))
+        self.assertEqual(ticket.version, first.version)
+
+    def test_claim_with_stale_version_fails(self):
+        ticket = self.make_ticket()
+        stale = Ticket.objects.get(pk=ticket.pk)
+        ticket.priority = "high"
+        ticket.save()
+
+        self.assertFalse(claim_ticket(stale, self.operator))
+        self.assertIsNone(Ticket.objects.get(pk=ticket.pk).assigned_to)
+
+    def test_losing_request_gets_no_email(self):
+        ticket = self.make_ticket()
+        claim_ticket(Ticket.objects.get(pk=ticket.pk), self.other)
+        EmailOutbox.objects.all().delete()
+
+        self.client.force_login(self.operator)
+        response = self.client.post(f"/tickets/{ticket.id}/assign/")
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(EmailOutbox.objects.exists())
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).assigned_to, self.other)
+
+    def test_claim_next_takes_oldest_then_priority(self):
+        old = self.make_ticket(priority="low")
+        urgent = self.make_ticket(priority="high")
+
+        self.assertEqual(claim_next(self.operator, "priority"), urgent)
+        self.assertEqual(claim_next(self.operator), old)
+        self.assertIsNone(claim_next(self.operator))
+
+    def test_round_robin_resumes_from_cursor(self):
+        for _ in range(3):
+            self.make_ticket()
+
+        self.assertEqual(auto_assign("round_robin", batch_size=2), 3)
+        owners = list(Ticket.objects.order_by("id").values_list("assigned_to", flat=True))
+        self.assertEqual(owners, [self.operator.pk, self.other.pk, self.operator.pk])
+        self.assertEqual(
+            AssignmentCursor.objects.get(strategy="round_robin").last_operator, self.operator
+        )
+
+        # esecuzione successiva: si riparte dall'operatore dopo l'ultimo servito
+        ticket = self.make_ticket()
+        auto_assign("round_robin")
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.assigned_to, self.other)
+
+
+# ============================================================
+# =================== RICHIESTE CONDIZIONALI =================
+# ============================================================
+
+class ConditionalRequestTests(TicketTestCase):
+
+    def setUp(self):
+        self.ticket = self.make_ticket()
+        self.client.force_login(self.operator)
+
+    def revalidate(self, url, **params):
+        # la prima risposta imposta il cookie CSRF, che fa parte dell'ETag
+        self.client.get(url, params)
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        return first["ETag"]
+
+    def get(self, url, etag, **params):
+        return self.client.get(url, params, headers={"If-None-Match": etag})
+
+    def test_list_not_modified(self):
+        etag = self.revalidate("/tickets/")
+        self.assertEqual(self.get("/tickets/", etag).status_code, 304)
+
+        # un ticket della pagina cambia
+        self.ticket.priority = "high"
+        self.ticket.save()
+        response = self.get("/tickets/", etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        # username del creatore mostrato nelle righe
+        self.customer.username = "cliente"
+        self.customer.save()
+        response = self.get("/tickets/", etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        # ticket nuovo ed eliminato
+        other = self.make_ticket(title="Scanner")
+        response = self.get("/tickets/", etag)
+        self.assertEqual(response.status_code, 200)
+        other.delete()
+        self.assertEqual(self.get("/tickets/", etag).status_code, 304)
+        self.ticket.delete()
+        self.assertEqual(self.get("/tickets/", etag).status_code, 200)
+
+    def test_list_validator_uses_only_the_page(self):
+        self.revalidate("/tickets/")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/tickets/")
+
+        sql = " ".join(q["sql"] for q in queries).upper()
+        self.assertNotIn("MAX(", sql)
+        self.assertNotIn("COUNT(", sql)
+
+    def test_admin_dashboard_totals_change_etag(self):
+        self.client.force_login(self.admin)
+        etag = self.revalidate("/tickets/admin/dashboard/", status="open")
+
+        # ticket fuori dalla pagina filtrata ma nei totali
+        self.make_ticket(status="closed")
+        response = self.get("/tickets/admin/dashboard/", etag, status="open")
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get("/tickets/admin/dashboard/", etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_never_304(self):
+        response = self.client.get("/tickets/", {"q": "stampante"})
+        self.assertNotIn("ETag", response)
+
+    def test_detail_not_modified(self):
+        url = f"/tickets/{self.ticket.id}/"
+        etag = self.revalidate(url)
+        self.assertEqual(self.get(url, etag).status_code, 304)
+
+        Message.objects.create(ticket=self.ticket, sender=self.customer, text="Ancora rotta")
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+# ============================================================
+# ========================= CONTATORI ========================
+# ============================================================
+
+class CounterTests(TicketTestCase):
+
+    def test_deleting_assignee_moves_workload_to_unassigned(self):
+        leaving = self.make_user("leaving", "operator")
+        self.make_ticket(assigned_to=leaving)
+        self.make_ticket(assigned_to=leaving, status="in_progress")
+        self.make_ticket(assigned_to=leaving, status="closed")
+        self.make_ticket()
+
+        leaving_key = str(leaving.pk)
+        self.assertEqual(get_counters("assignee"), {"": 1, leaving_key: 2})
+
+        leaving.delete()
+
+        counters = get_counters("assignee")
+        self.assertEqual(counters.get(""), 3)
+        self.assertFalse(counters.get(leaving_key))
+
+        # ✅ stessi valori del ricalcolo da zero
+        expected = {
+            key: count for (dimension, key), count in reconcile_counters().items()
+            if dimension == "assignee"
+        }
+        self.assertEqual({k: v for k, v in counters.items() if v}, expected)
+
+
+# ============================================================
+# ================== CONCORRENZA OTTIMISTICA =================
+# ============================================================
+
+class VersionConflictTests(TicketTestCase):
+
+    def setUp(self):
+        self.ticket = self.make_ticket()
+
+    def test_stale_save_raises(self):
+        first = Ticket.objects.get(pk=self.ticket.pk)
+        second = Ticket.objects.get(pk=self.ticket.pk)
+
+        first.priority = "high"
+        first.save()
+        self.assertEqual(first.version, 2)
+
+        second.title = "Sovrascritto"
+        with self.assertRaises(VersionConflict):
+            second.save()
+
+        self.ticket.refresh_from_db()
+        self.assertEqual(
+            (self.ticket.title, self.ticket.priority, self.ticket.version),
+            ("Stampante guasta", "high", 2),
+        )
+
+    def test_save_runs_signals_and_writes_only_changes(self):
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        # colonna cambiata fuori dal save() (stessa versione): non va sovrascritta
+        Ticket.objects.filter(pk=ticket.pk).update(description="Altro")
+
+        ticket.status = "closed"
+        ticket.save()
+
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.status, self.ticket.description), ("closed", "Altro"))
+        # contatori aggiornati dal post_save
+        self.assertEqual(get_counters("status").get("closed"), 1)
+        self.assertFalse(ticket.changed_fields())
+
+    def test_deferred_version_still_bumps(self):
+        ticket = Ticket.objects.only("id", "title").get(pk=self.ticket.pk)
+        ticket.title = "Nuovo"
+        ticket.save(update_fields=["title"])
+
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.title, self.ticket.version), ("Nuovo", 2))
+
+    def test_update_fields_names_and_attnames(self):
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        ticket.assigned_to = self.operator
+        ticket.save(update_fields=["assigned_to_id"])
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).assigned_to, self.operator)
+
+        with self.assertRaisesMessage(ValueError, "assignee"):
+            ticket.save(update_fields=["assignee"])
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).version, 2)
+
+    def test_row_deleted_meanwhile(self):
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        Ticket.objects.filter(pk=ticket.pk).delete()
+        received = []
+
+        def on_pre_save(sender, instance, **kwargs):
+            received.append(instance.pk)
+
+        pre_save.connect(on_pre_save, sender=Ticket)
+        self.addCleanup(pre_save.disconnect, on_pre_save, sender=Ticket)
+
+        # save() completo: INSERT come Model.save(), un solo pre_save
+        ticket.title = "Ripristinato"
+        ticket.save()
+        self.assertEqual(received, [ticket.pk])
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).title, "Ripristinato")
+
+        # con update_fields invece errore, come Model.save()
+        Ticket.objects.filter(pk=ticket.pk).delete()
+        with self.assertRaises(DatabaseError):
+            ticket.save(update_fields=["title"])
+
+    def test_deleting_assignee_invalidates_ticket(self):
+        leaving = self.make_user("leaving", "operator")
+        Ticket.objects.filter(pk=self.ticket.pk).update(assigned_to=leaving)
+        before = Ticket.objects.get(pk=self.ticket.pk)
+        cached = fragments._cache().get(fragments._version_key(before.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            leaving.delete()
+
+        after = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertIsNone(after.assigned_to_id)
+        self.assertEqual(after.version, before.version + 1)
+        # ✅ chiave dei frammenti diversa: versione in cache e updated_at
+        self.assertGreater(after.updated_at, before.updated_at)
+        self.assertNotEqual(fragments._cache().get(fragments._version_key(before.pk)), cached)
+
+    def test_close_with_stale_version(self):
+        self.client.force_login(self.operator)
+        Ticket.objects.filter(pk=self.ticket.pk).update(version=5)
+
+        self.client.get(f"/tickets/{self.ticket.id}/close/", {"version": 4})
+
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).status, "open")
+
+    def test_user_delete_bumps_assigned_tickets(self):
+        operator = self.make_user("op-temp", "operator")
+        claim_ticket(self.ticket, operator)
+        stale = Ticket.objects.get(pk=self.ticket.pk)
+
+        operator.delete()
+
+        stale.priority = "high"
+        with self.assertRaises(VersionConflict):
+            stale.save()
+
+
+class AdminVersionTests(TicketTestCase):
+
+    def setUp(self):
+        self.ticket = self.make_ticket()
+        self.superuser = User.objects.create_superuser("root", "root@example.com", "pw")
+        self.client.force_login(self.superuser)
+        self.url = f"/admin/tickets/ticket/{self.ticket.id}/change/"
+
+    def post(self, **fields):
+        data = {
+            "title": self.ticket.title,
+            "description": self.ticket.description,
+            "status": self.ticket.status,
+            "priority": "high",
+            "created_by": self.customer.id,
+            "assigned_to": "",
+            "seen_version": self.ticket.version,
+        }
+        data.update(fields)
+        return self.client.post(self.url, data)
+
+    def test_form_carries_version(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'name="seen_version"')
+
+    def test_save_with_current_version(self):
+        response = self.post()
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).priority, "high")
+
+    def test_stale_form_is_rejected(self):
+        Ticket.objects.filter(pk=self.ticket.pk).update(version=3)
+
+        response = self.post(seen_version=1)
+
+        self.assertContains(response, "modificato da un altro utente")
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).priority, "medium")
+
+    def test_conflict_during_save(self):
+        with mock.patch.object(Ticket, "save", side_effect=VersionConflict(self.ticket)):
+            response = self.post()
+
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).priority, "medium")
+
+
+# ============================================================
+# =========================== RUOLI ==========================
+# ============================================================
+
+class RoleCacheTests(TicketTestCase):
+
+    def setUp(self):
+        self.group = Group.objects.get(name="operator")
+        self.key = roles._cache_key(self.operator.pk)
+        roles.get_role_names(User.objects.get(pk=self.operator.pk))
+        self.assertIsNotNone(roles.cache.get(self.key))
+
+    def assertRoleGone(self):
+        self.assertIsNone(roles.cache.get(self.key))
+        self.assertFalse(roles.has_role(User.objects.get(pk=self.operator.pk), "operator"))
+
+    def test_removed_from_user_side(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.operator.groups.remove(self.group)
+        self.assertRoleGone()
+
+    def test_removed_from_group_side(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.remove(self.operator)
+        self.assertRoleGone()
+
+    def test_group_cleared(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.clear()
+        self.assertRoleGone()
+
+    def test_invalidated_again_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.operator.groups.remove(self.group)
+            # un'altra richiesta legge i gruppi prima del commit
+            roles.cache.set(self.key, frozenset({"operator"}))
+        self.assertRoleGone()
+
+    def test_short_timeout_with_per_process_cache(self):
+        self.assertEqual(roles._timeout(), roles.LOCAL_ROLE_CACHE_TIMEOUT)
+
+        dummy = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES=dummy):
+            self.assertEqual(roles._timeout(), roles.ROLE_CACHE_TIMEOUT)
+
+
+# ============================================================
+# ====================== CHAT (MITTENTI) =====================
+# ============================================================
+
+class ChatAnnotationTests(TicketTestCase):
+
+    def setUp(self):
+        self.ticket = self.make_ticket()
+        staff = User.objects.create_user("staff", "staff@example.com", "pw", is_staff=True)
+
+        for sender in (self.customer, self.operator, staff, self.admin):
+            Message.objects.create(ticket=self.ticket, sender=sender, text=f"da {sender.username}")
+
+    def test_staff_side_flag(self):
+        flags = {m.sender.username: m.is_staff_side for m in chat_messages(self.ticket)}
+
+        # staff Django o gruppo "operator"; il gruppo "admin" da solo no
+        self.assertEqual(flags, {"cust": False, "op": True, "staff": True, "adm": False})
+
+    def test_one_query_for_senders_and_flags(self):
+        with self.assertNumQueries(1):
+            rows = [(m.sender.username, m.is_staff_side) for m in chat_messages(self.ticket)]
+        self.assertEqual(len(rows), 4)
+
+    def test_detail_renders_sides(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(f"/tickets/{self.ticket.id}/")
+        content = response.content.decode()
+
+        op_row = content[:content.index("da op")].rsplit('class="chat-row', 1)[1]
+        cust_row = content[:content.index("da cust")].rsplit('class="chat-row', 1)[1]
+        self.assertIn("operator-msg", op_row)
+        self.assertIn("user-msg", cust_row)
@@ -5,8 +5,12 @@ urlpatterns = [
     # ----- LISTA / PRINCIPALE -----
     path("", views.ticket_list, name="ticket_list"),
     path("my/", views.my_tickets, name="my_tickets"),
+    path("export/", views.ticket_export, name="ticket_export"),
+    path("users/autocomplete/", views.user_autocomplete, name="user_autocomplete"),
 
     path("<int:ticket_id>/", views.ticket_detail, name="ticket_detail"),
+    path("<int:ticket_id>/events/", views.ticket_events, name="ticket_events"),
+    path("<int:ticket_id>/messages/", views.ticket_messages_feed, name="ticket_messages_feed"),
     path("new/", views.ticket_create, name="ticket_create"),
     path("<int:ticket_id>/assign/", views.ticket_assign, name="ticket_assign"),
     path("<int:ticket_id>/close/", views.ticket_close, name="ticket_close"),
@@ -14,6 +18,7 @@ urlpatterns = [
 
 
     # ----- OPERATOR -----
+    path("operator/next/", views.ticket_next, name="ticket_next"),
     path("operator/open/", views.operator_open, name="operator_open"),
     path("operator/assigned/", views.operator_assigned, name="operator_assigned"),
     path("operator/", views.operator_dashboard, name="operator_dashboard"),
@@ -30,6 +35,7 @@ urlpatterns = [
     path("admin/ticket/<int:ticket_id>/reassign/", views.ticket_reassign_view, name="ticket_reassign_view"),
     path("admin/ticket/<int:ticket_id>/reassign/do/", views.ticket_reassign, name="ticket_reassign"),
     path("admin/logs/", views.admin_logs, name="admin_logs"),
+    path("admin/logs/export/", views.admin_logs_export, name="admin_logs_export"),
 
     path("secure-download/<int:attachment_id>/", views.secure_download, name="secure_download"),
     path("attachment/<int:attachment_id>/delete/", views.attachment_delete, name="attachment_delete"),
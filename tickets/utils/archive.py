@@ -0,0 +1,305 @@
+import gzip
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tickets.models import AdminLog, RollupWatermark
+from tickets.utils.rollups import WATERMARK_NAME
+
+
+# Giorni di AdminLog tenuti nella tabella "calda"
+RETENTION_DAYS = getattr(settings, "AUDIT_RETENTION_DAYS", 365)
+
+# Righe archiviate e cancellate per ogni transazione
+BATCH_SIZE = 5000
+
+# Massimo di righe d'archivio mostrate in admin_logs
+READ_LIMIT = 1000
+
+MANIFEST_NAME = "manifest.json"
+
+
+def archive_root():
+    return getattr(
+        settings,
+        "AUDIT_ARCHIVE_ROOT",
+        os.path.join(getattr(settings, "BASE_DIR", "."), "audit_archive"),
+    )
+
+
+# ============================================================
+# ========================= MANIFEST =========================
+# ============================================================
+
+def load_manifest():
+    path = os.path.join(archive_root(), MANIFEST_NAME)
+
+    if not os.path.exists(path):
+        return {"parts": []}
+
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    path = os.path.join(archive_root(), MANIFEST_NAME)
+    tmp = path + ".tmp"
+
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def _fsync_dir(path):
+    """
+    Rende persistente il rename: senza fsync della cartella, dopo un crash
+    il file può non comparire anche se il suo contenuto è su disco.
+    """
+    fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ============================================================
+# ======================== ARCHIVIAZIONE =====================
+# ============================================================
+
+def _serialize(row):
+    return {
+        "id": row["id"],
+        "timestamp": row["timestamp"].isoformat(),
+        "action": row["action"],
+        "details": row["details"],
+        "actor_id": row["actor_id"],
+        # gli username vengono copiati: l'utente potrebbe non esistere più
+        "actor": row["actor__username"],
+        "target_user_id": row["target_user_id"],
+        "target_user": row["target_user__username"],
+        "ticket_id": row["ticket_id"],
+        "ip_address": row["ip_address"],
+        "user_agent": row["user_agent"],
+    }
+
+
+def _write_part(month, records):
+    """
+    Scrive un file .jsonl.gz immutabile con un lotto di log dello stesso mese,
+    dal più recente (l'ordine di lettura di admin_logs).
+    Il nome dipende dal range di id: rieseguire dopo un crash lo riscrive
+    identico invece di duplicarlo.
+    """
+    first_id, last_id = records[0]["id"], records[-1]["id"]
+    relative = os.path.join(month, f"adminlog-{first_id}-{last_id}.jsonl.gz")
+    path = os.path.join(archive_root(), relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as raw:
+        with gzip.open(raw, "wt", encoding="utf-8") as f:
+            for record in reversed(records):
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+
+        # ✅ dati su disco prima del rename, del manifest e del DELETE
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+    return {
+        "file": relative,
+        "month": month,
+        "rows": len(records),
+        "first_id": first_id,
+        "last_id": last_id,
+        "min_timestamp": min(r["timestamp"] for r in records),
+        "max_timestamp": max(r["timestamp"] for r in records),
+        "sha256": _sha256(path),
+    }
+
+
+def archive_logs(days=RETENTION_DAYS, batch_size=BATCH_SIZE, stdout=None):
+    """
+    Sposta gli AdminLog più vecchi di `days` giorni negli archivi mensili
+    compressi e li cancella dalla tabella, un lotto alla volta.
+    Solo i log già aggregati nei rollup (id <= watermark): gli altri
+    restano nella tabella finché run_rollup non li ha contati.
+    Restituisce il numero di righe archiviate.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    manifest = load_manifest()
+    total = 0
+
+    while True:
+        with transaction.atomic():
+            # ✅ lock sul watermark: rollup e rebuild non leggono a metà lotto
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+                name=WATERMARK_NAME
+            )
+
+            rows = list(
+                AdminLog.objects.filter(timestamp__lt=cutoff, id__lte=watermark.last_id)
+                .order_by("id")
+                .values(
+                    "id", "timestamp", "action", "details", "ip_address", "user_agent",
+                    "actor_id", "actor__username",
+                    "target_user_id", "target_user__username",
+                    "ticket_id",
+                )[:batch_size]
+            )
+            if not rows:
+                break
+
+            by_month = {}
+            for row in rows:
+                month = timezone.localtime(row["timestamp"]).strftime("%Y-%m")
+                by_month.setdefault(month, []).append(_serialize(row))
+
+            # ✅ prima i file (fsync + rename) e il manifest, poi il DELETE:
+            #    se qualcosa fallisce le righe restano nel DB
+            parts = [_write_part(month, records) for month, records in sorted(by_month.items())]
+
+            written = {p["file"] for p in parts}
+            manifest["parts"] = [
+                p for p in manifest["parts"] if p["file"] not in written
+            ] + parts
+            manifest["parts"].sort(key=lambda p: p["first_id"])
+            _save_manifest(manifest)
+
+            AdminLog.objects.filter(id__in=[row["id"] for row in rows]).delete()
+
+        total += len(rows)
+        if stdout:
+            stdout.write(f"Archiviati {total} log")
+
+    return total
+
+
+def verify_archive():
+    """
+    Controlla i checksum di tutti i file del manifest.
+    Restituisce la lista dei file mancanti o corrotti.
+    """
+    broken = []
+
+    for part in load_manifest()["parts"]:
+        path = os.path.join(archive_root(), part["file"])
+        if not os.path.exists(path) or _sha256(path) != part["sha256"]:
+            broken.append(part["file"])
+
+    return broken
+
+
+# ============================================================
+# ========================== LETTURA =========================
+# ============================================================
+
+@dataclass
+class ArchivedLog:
+    """
+    Log letto dall'archivio, con la stessa forma usata da admin_logs.html.
+    """
+
+    id: int
+    timestamp: object
+    action: str
+    details: str
+    actor: object
+    target_user: object
+    ticket: object
+    ip_address: str
+    user_agent: str
+    archived: bool = True
+
+
+def _to_log(record):
+    def ref(pk, username=None):
+        if pk is None and username is None:
+            return None
+        return SimpleNamespace(id=pk, pk=pk, username=username)
+
+    return ArchivedLog(
+        id=record["id"],
+        timestamp=parse_datetime(record["timestamp"]),
+        action=record["action"],
+        details=record["details"],
+        actor=ref(record["actor_id"], record["actor"]),
+        target_user=ref(record["target_user_id"], record["target_user"]),
+        ticket=ref(record["ticket_id"]),
+        ip_address=record["ip_address"],
+        user_agent=record["user_agent"],
+    )
+
+
+def _contains(value, needle):
+    return not needle or needle.lower() in (value or "").lower()
+
+
+def archive_covers(start=None, end=None):
+    """
+    True se qualche file d'archivio cade nel range [start, end).
+    """
+    return any(_overlaps(part, start, end) for part in load_manifest()["parts"])
+
+
+def _overlaps(part, start, end):
+    if start and parse_datetime(part["max_timestamp"]) < start:
+        return False
+    if end and parse_datetime(part["min_timestamp"]) >= end:
+        return False
+    return True
+
+
+def iter_archived_logs(start=None, end=None, actor=None, target=None, action=None):
+    """
+    Legge in streaming i log archiviati, dal più recente, con gli stessi
+    filtri di admin_logs. Apre solo i file che cadono nel range di date.
+    """
+    parts = [
+        p for p in load_manifest()["parts"] if _overlaps(p, start, end)
+    ]
+
+    for part in sorted(parts, key=lambda p: p["last_id"], reverse=True):
+        path = os.path.join(archive_root(), part["file"])
+
+        # ✅ una riga alla volta: i file sono già dal più recente
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                timestamp = parse_datetime(record["timestamp"])
+
+                if start and timestamp < start:
+                    continue
+                if end and timestamp >= end:
+                    continue
+                if not (
+                    _contains(record["actor"], actor)
+                    and _contains(record["target_user"], target)
+                    and _contains(record["action"], action)
+                ):
+                    continue
+
+                yield _to_log(record)
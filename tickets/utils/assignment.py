@@ -0,0 +1,253 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.urls import reverse
+from django.utils import timezone
+
+from tickets.models import AssignmentCursor, Ticket, snapshot_fields
+from tickets.utils.audit import log_change
+from tickets.utils.mailer import build_ticket_email_html, send_ticket_email
+from tickets.utils.stats import get_counters
+
+
+# Presa in carico dei ticket senza gare tra operatori.
+#
+# Il "vincitore" lo decide il DB con un UPDATE condizionato
+# (WHERE status = 'open' AND assigned_to IS NULL AND version = N): con
+# due richieste contemporanee una sola trova la riga, l'altra aggiorna
+# 0 righe e non manda email. update() non invia post_save: il segnale viene inviato a
+# mano, quindi contatori, log e versione dei frammenti sono gli stessi
+# di un save().
+
+# Campi scritti dalla presa in carico (update_fields del post_save)
+CLAIM_FIELDS = frozenset({"status", "assigned_to", "updated_at", "version"})
+
+ORDERS = ("oldest", "priority")
+STRATEGIES = ("least_loaded", "round_robin")
+
+# Strategia di auto_assign_tickets se non indicata
+DEFAULT_STRATEGY = getattr(settings, "AUTO_ASSIGN_STRATEGY", "least_loaded")
+
+# Ticket letti per transazione dallo scheduler
+BATCH_SIZE = 100
+
+# Senza SKIP LOCKED (es. SQLite) due operatori possono puntare lo stesso
+# ticket: chi perde riprova con il successivo
+NEXT_ATTEMPTS = 5
+
+PRIORITY_ORDER = ("high", "medium", "low")
+
+
+# ============================================================
+# ======================= PRESA IN CARICO ====================
+# ============================================================
+
+def unassigned_tickets():
+    return Ticket.objects.filter(status="open", assigned_to__isnull=True)
+
+
+def claim_ticket(ticket, operator):
+    """
+    Assegna `ticket` a `operator` se è ancora aperto e libero.
+    True solo per la richiesta che ha vinto.
+    """
+    if ticket.status != "open" or ticket.assigned_to_id is not None:
+        return False
+
+    updated_at = timezone.now()
+
+    with transaction.atomic():
+        # ✅ anche compare-and-swap sulla versione, come Ticket.save()
+        won = unassigned_tickets().filter(pk=ticket.pk, version=ticket.version).update(
+            status="in_progress",
+            assigned_to=operator,
+            updated_at=updated_at,
+            version=F("version") + 1,
+        )
+        if not won:
+            return False
+
+        ticket.status = "in_progress"
+        ticket.assigned_to = operator
+        ticket.updated_at = updated_at
+        ticket.version += 1
+
+        # ✅ stessi effetti di ticket.save(): lo snapshot ha ancora
+        #    lo stato letto prima (open, nessuno)
+        post_save.send(
+            sender=Ticket,
+            instance=ticket,
+            created=False,
+            update_fields=CLAIM_FIELDS,
+            raw=False,
+            using=ticket._state.db or "default",
+        )
+        snapshot_fields(ticket, CLAIM_FIELDS)
+
+    return True
+
+
+def _queues(order):
+    """
+    Code dei ticket liberi, da leggere in ordine: una sola (i più vecchi)
+    oppure una per priorità, ognuna servita da un indice senza sort.
+    """
+    tickets = unassigned_tickets().order_by("created_at", "id")
+
+    if order == "priority":
+        return [tickets.filter(priority=p) for p in PRIORITY_ORDER]
+    return [tickets]
+
+
+def _lock(tickets):
+    # ✅ MySQL 8 / PostgreSQL: le righe che un altro sta prendendo vengono
+    #    saltate, niente attese e niente conflitti
+    if connection.features.has_select_for_update_skip_locked:
+        return tickets.select_for_update(skip_locked=True)
+    return tickets
+
+
+def claim_next(operator, order="oldest"):
+    """
+    Prende in carico il prossimo ticket libero (il più vecchio o il più
+    urgente). Restituisce il ticket, o None se la coda è vuota.
+    """
+    for _ in range(NEXT_ATTEMPTS):
+        with transaction.atomic():
+            ticket = None
+            for tickets in _queues(order):
+                ticket = _lock(tickets).first()
+                if ticket:
+                    break
+
+            if ticket is None:
+                return None
+
+            if claim_ticket(ticket, operator):
+                return ticket
+
+    return None
+
+
+def send_assignment_email(ticket, operator, actor=None):
+    ticket_url = f"{settings.SITE_URL}{reverse('ticket_detail', args=[ticket.id])}"
+
+    subject = f"[TICKET ASSEGNATO] #{ticket.id}"
+
+    text_message = (
+        f"Ti è stato assegnato un ticket.\n\n"
+        f"Titolo: {ticket.title}\n\n"
+        f"Apri il ticket: {ticket_url}"
+    )
+
+    html_message = build_ticket_email_html(
+        title="Nuovo Ticket Assegnato",
+        message=f"""
+            Ti è stato assegnato un nuovo ticket.<br><br>
+            <b>Titolo:</b> {ticket.title}<br>
+            <b>Creato da:</b> {ticket.created_by.username}<br>
+        """,
+        ticket_url=ticket_url,
+        button_text="Gestisci Ticket"
+    )
+
+    return send_ticket_email(
+        subject=subject,
+        text_content=text_message,
+        html_content=html_message,
+        recipient_list=[operator.email] if operator.email else [],
+        actor=actor,              # ✅ chi assegna (None = scheduler)
+        target_user=operator,     # ✅ destinatario
+        ticket=ticket
+    )
+
+
+# ============================================================
+# ===================== ASSEGNAZIONE AUTO ====================
+# ============================================================
+
+def operator_loads():
+    """
+    {id operatore: ticket non chiusi in carico} per gli operatori attivi,
+    dai contatori precalcolati (dimensione "assignee"): niente COUNT(*).
+    """
+    counts = get_counters("assignee")
+    operators = (
+        User.objects.filter(groups__name="operator", is_active=True)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    return {pk: counts.get(str(pk), 0) for pk in operators}
+
+
+def _cursor(strategy):
+    """
+    Stato della strategia, bloccato fino al commit del blocco: due
+    scheduler in parallelo non servono lo stesso giro due volte.
+    """
+    if strategy != "round_robin":
+        return None
+
+    cursor, _ = AssignmentCursor.objects.select_for_update().get_or_create(strategy=strategy)
+    return cursor
+
+
+def _pick(strategy, loads, last_id):
+    if strategy == "round_robin":
+        # il primo operatore dopo l'ultimo servito, poi si ricomincia
+        return next((pk for pk in loads if pk > last_id), next(iter(loads)))
+
+    return min(loads, key=lambda pk: (loads[pk], pk))
+
+
+def auto_assign(strategy=DEFAULT_STRATEGY, batch_size=BATCH_SIZE):
+    """
+    Distribuisce i ticket liberi (dal più vecchio) tra gli operatori attivi.
+    Ogni blocco è una transazione: i ticket presi nel frattempo da un
+    operatore vengono saltati. Restituisce il numero di ticket assegnati.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Strategia sconosciuta: {strategy}")
+
+    loads = operator_loads()
+    if not loads:
+        return 0
+
+    operators = User.objects.in_bulk(list(loads))
+    assigned = 0
+
+    while True:
+        with transaction.atomic():
+            cursor = _cursor(strategy)
+            last_id = (cursor.last_operator_id or 0) if cursor else 0
+
+            tickets = list(_lock(unassigned_tickets().order_by("created_at", "id"))[:batch_size])
+
+            for ticket in tickets:
+                pk = _pick(strategy, loads, last_id)
+                operator = operators[pk]
+
+                if not claim_ticket(ticket, operator):
+                    continue
+
+                log_change(
+                    actor=None,
+                    target_user=operator,
+                    ticket=ticket,
+                    action="TICKET AUTO ASSIGNED",
+                    extra=f"Strategia: {strategy} - Carico: {loads[pk]}",
+                )
+                send_assignment_email(ticket, operator)
+
+                loads[pk] += 1
+                last_id = pk
+                assigned += 1
+
+            if cursor and last_id:
+                cursor.last_operator_id = last_id
+                cursor.save(update_fields=["last_operator", "updated_at"])
+
+        if len(tickets) < batch_size:
+            return assigned
@@ -1,6 +1,111 @@
 
+import threading
 
-from tickets.models import AdminLog
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from tickets.models import AdminLog, Ticket
+
+
+# Buffer dei log per transazione, uno per livello di savepoint.
+# chiave: tuple(connection.savepoint_ids) → (lista AdminLog, callback on_commit)
+_local = threading.local()
+
+
+def _pending_buffer(connection):
+    """
+    Restituisce il buffer dei log della transazione (o savepoint) corrente.
+
+    Ogni buffer registra UNA callback on_commit che lo scrive con un solo
+    bulk_create. Se la transazione o il savepoint fanno rollback, Django
+    scarta la callback: il buffer non è più tra i run_on_commit e viene
+    buttato via insieme ai suoi log.
+    """
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+
+    # ✅ elimina i buffer già scritti o annullati da un rollback
+    alive = {id(hook[1]) for hook in connection.run_on_commit}
+    for key, (_, flush) in list(buffers.items()):
+        if id(flush) not in alive:
+            del buffers[key]
+
+    key = tuple(connection.savepoint_ids)
+    if key in buffers:
+        return buffers[key][0]
+
+    entries = []
+
+    def flush():
+        AdminLog.objects.bulk_create(_detach_deleted(entries))
+
+    transaction.on_commit(flush)
+    buffers[key] = (entries, flush)
+    return entries
+
+
+# riferimenti dei log che possono sparire nella stessa transazione
+LOG_REFERENCES = (
+    ("ticket", Ticket, "Ticket"),
+    ("actor", User, "Utente"),
+    ("target_user", User, "Utente"),
+)
+
+
+def _detach_deleted(entries):
+    """
+    I log bufferizzati si scrivono DOPO il commit: un ticket o un utente
+    eliminato nella stessa transazione (es. i log della cascata sugli
+    allegati) non esiste più e l'INSERT violerebbe la FK.
+
+    Come farebbe on_delete=SET_NULL: il riferimento diventa NULL e l'id
+    resta nei dettagli. Una SELECT per modello, non una per log.
+    """
+    wanted = {}
+    for field, model, _ in LOG_REFERENCES:
+        ids = {getattr(entry, f"{field}_id") for entry in entries} - {None}
+        wanted.setdefault(model, set()).update(ids)
+
+    existing = {
+        model: set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+        for model, ids in wanted.items() if ids
+    }
+
+    for entry in entries:
+        notes = []
+
+        for field, model, label in LOG_REFERENCES:
+            pk = getattr(entry, f"{field}_id")
+            if pk is None or pk in existing.get(model, ()):
+                continue
+
+            setattr(entry, field, None)
+            note = f"{label} eliminato: #{pk}"
+            if note not in notes:
+                notes.append(note)
+
+        if notes:
+            entry.details = "\n".join(filter(None, [entry.details, *notes]))
+
+    return entries
+
+
+def write_log(entry):
+    """
+    Scrive un AdminLog (non ancora salvato).
+
+    - Dentro una transazione: accodato e scritto al commit insieme agli
+      altri log con un unico bulk_create; perso se la transazione fallisce.
+    - Fuori da transazioni: scritto subito (fallback sincrono).
+    """
+    connection = transaction.get_connection()
+
+    if not connection.in_atomic_block:
+        entry.save()
+        return
+
+    _pending_buffer(connection).append(entry)
 
 
 def log_change(
@@ -42,7 +147,7 @@ def log_change(
 
     details = "\n".join(parts) if parts else ""
 
-    AdminLog.objects.create(
+    write_log(AdminLog(
         actor=actor,
         target_user=target_user,
         ticket=ticket,
@@ -50,4 +155,4 @@ def log_change(
         details=details,
         ip_address=ip_address,
         user_agent=user_agent or "",
-    )
+    ))
@@ -0,0 +1,173 @@
+import hashlib
+
+from django.contrib import messages
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from tickets.models import Message, TicketAttachment
+from tickets.utils.roles import get_role_names
+
+
+# Validatori (ETag / Last-Modified) delle pagine HTML: calcolati dalle
+# righe già lette (liste) o con la stessa query che legge il ticket
+# (dettaglio). Se il browser ha già la stessa versione risponde 304 e la
+# pagina non viene renderizzata.
+
+
+# ============================================================
+# ========================== ETAG ============================
+# ============================================================
+
+def page_etag(request, *parts):
+    """
+    ETag debole di una pagina: chi la guarda (utente, ruoli, token CSRF
+    nei form), quale pagina (path + querystring) e lo stato dei dati.
+    """
+    user = request.user
+    identity = (
+        user.pk,
+        user.username,
+        user.is_staff,
+        user.is_superuser,
+        ",".join(sorted(get_role_names(user))),
+        request.META.get("CSRF_COOKIE", ""),
+    )
+    query = sorted(request.GET.lists())
+
+    raw = repr((identity, request.path, query, parts)).encode()
+    return 'W/"%s"' % hashlib.sha1(raw).hexdigest()
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value else None
+
+
+def not_modified(request, validators):
+    """
+    Risposta 304 se il browser ha già questa versione, altrimenti None.
+    `validators` = (etag, last_modified), oppure None (pagina senza 304).
+    Mai 304 con messaggi flash in attesa: vanno mostrati (e consumati).
+    """
+    if validators is None or request.method not in ("GET", "HEAD"):
+        return None
+
+    etag, last_modified = validators
+
+    if len(messages.get_messages(request)):
+        return None
+
+    return get_conditional_response(
+        request, etag=etag, last_modified=_timestamp(last_modified)
+    )
+
+
+def set_validators(response, validators):
+    """
+    Il browser deve sempre rivalidare (no-cache), ma può riusare la copia.
+    """
+    if validators is None or response.status_code != 200:
+        return response
+
+    etag, last_modified = validators
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(_timestamp(last_modified))
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# ============================================================
+# =========================== LISTE ==========================
+# ============================================================
+
+def page_validators(request, page, *extra):
+    """
+    Validatori di una pagina di ticket GIÀ letta (paginazione keyset):
+    id, updated_at e username delle righe mostrate + i cursori, cioè tutto
+    quello che le righe e la navigazione mostrano. Nessuna query in più e
+    nessuna aggregazione sull'intera lista filtrata: il costo è quello
+    della pagina. `extra`: altri dati della pagina (es. contatori).
+    Con una ricerca attiva niente 304: rank e snippet dipendono anche dai
+    messaggi.
+    """
+    if _searching(request):
+        return None
+
+    rows = [
+        (
+            t.id,
+            t.updated_at.isoformat() if t.updated_at else "",
+            t.created_by.username,
+            t.assigned_to.username if t.assigned_to_id else "",
+        )
+        for t in page
+    ]
+    last = max((t.updated_at for t in page if t.updated_at), default=None)
+
+    etag = page_etag(request, rows, page.next_cursor, page.previous_cursor, *extra)
+    return etag, last
+
+
+def _searching(request):
+    return bool(request.GET.get("q", "").strip())
+
+
+# ============================================================
+# ========================= DETTAGLIO ========================
+# ============================================================
+
+def _latest(model, field):
+    return Subquery(
+        model.objects.filter(ticket_id=OuterRef("pk"))
+        .order_by()
+        .values("ticket_id")
+        .annotate(value=Max(field))
+        .values("value")[:1]
+    )
+
+
+def _count(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(ticket_id=OuterRef("pk"))
+            .order_by()
+            .values("ticket_id")
+            .annotate(value=Count("id"))
+            .values("value")[:1],
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def with_detail_state(tickets):
+    """
+    Annota i ticket con ultimo messaggio/allegato e totali: lo stato della
+    pagina di dettaglio arriva con la stessa query che legge il ticket.
+    """
+    return tickets.annotate(
+        last_message_at=_latest(Message, "created_at"),
+        message_total=_count(Message),
+        last_attachment_at=_latest(TicketAttachment, "uploaded_at"),
+        attachment_total=_count(TicketAttachment),
+    )
+
+
+def detail_validators(request, ticket):
+    """
+    Validatori della pagina di un ticket annotato con with_detail_state:
+    Last-Modified = il più recente tra ticket, ultimo messaggio e allegato.
+    """
+    dates = [
+        d for d in (ticket.updated_at, ticket.last_message_at, ticket.last_attachment_at)
+        if d
+    ]
+    last = max(dates) if dates else None
+
+    parts = tuple(d.isoformat() if d else "" for d in (
+        ticket.updated_at, ticket.last_message_at, ticket.last_attachment_at,
+    )) + (ticket.message_total, ticket.attachment_total)
+
+    return page_etag(request, *parts), last
@@ -0,0 +1,62 @@
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+# Filtri per data come intervalli semiaperti [inizio, fine) sulla colonna
+# datetime "nuda": niente __date/__month/__year, che avvolgono la colonna
+# in una funzione e impediscono l'uso degli indici.
+
+
+def local_midnight(day):
+    """
+    Mezzanotte del giorno `day` nel fuso orario configurato (aware).
+    """
+    naive = datetime.datetime.combine(day, datetime.time.min)
+
+    if settings.USE_TZ:
+        return timezone.make_aware(naive, timezone.get_current_timezone())
+
+    return naive
+
+
+def day_start(value):
+    """
+    "2025-11-26" → inizio di quel giorno (per filtri >=), None se non valida.
+    """
+    try:
+        day = parse_date(value or "")
+    except ValueError:
+        return None
+
+    return local_midnight(day) if day else None
+
+
+def day_end(value):
+    """
+    "2025-11-26" → inizio del giorno DOPO (per filtri <), None se non valida.
+    """
+    try:
+        day = parse_date(value or "")
+    except ValueError:
+        return None
+
+    return local_midnight(day + datetime.timedelta(days=1)) if day else None
+
+
+def month_range(year, month=None):
+    """
+    Intervallo di date [inizio, fine) di un mese, o dell'intero anno
+    se month è None.
+    """
+    if month is None:
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+
+    start = datetime.date(year, month, 1)
+    end = (
+        datetime.date(year + 1, 1, 1) if month == 12
+        else datetime.date(year, month + 1, 1)
+    )
+    return start, end
@@ -0,0 +1,236 @@
+import asyncio
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from tickets.utils.storage import CHUNK_SIZE, absolute_path
+
+
+# Modalità di invio dei file:
+#   None      → Django legge e invia il file (Range / 304 gestiti qui)
+#   "nginx"   → X-Accel-Redirect verso una location `internal`
+#   "sendfile"→ X-Sendfile (Apache mod_xsendfile, lighttpd, ...)
+OFFLOAD = getattr(settings, "ATTACHMENT_OFFLOAD", None)
+
+# Prefisso della location nginx che punta a SECURE_UPLOAD_ROOT, es.
+#   location /protected/ { internal; alias /srv/uploads/; }
+ACCEL_PREFIX = getattr(settings, "ATTACHMENT_ACCEL_PREFIX", "/protected/")
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+# ============================================================
+# ======================== VALIDATORI ========================
+# ============================================================
+
+def attachment_etag(attachment):
+    """
+    Allegati nello storage deduplicato: lo SHA-256 è già un ETag forte.
+    File legacy: None → ETag debole calcolato da serve_file.
+    """
+    if attachment.blob_id:
+        return '"%s"' % os.path.basename(attachment.file_path)
+    return None
+
+
+def is_asgi(request):
+    """
+    Sotto ASGI il corpo va letto con un iteratore async; sotto WSGI un
+    iteratore async verrebbe invece raccolto tutto in memoria.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+# ============================================================
+# =========================== RANGE ==========================
+# ============================================================
+
+def parse_range(header, size):
+    """
+    "bytes=100-199" → (100, 199). Un solo intervallo: le richieste
+    multi-range ricevono il file intero (consentito dall'RFC 9110).
+    Restituisce None se l'header va ignorato, "invalid" se non
+    soddisfacibile (416).
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+
+    if not first:
+        # "bytes=-500" → ultimi 500 byte
+        if not last or int(last) == 0:
+            return "invalid"
+        return max(size - int(last), 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        return "invalid"
+
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    """
+    If-Range: il Range vale solo se il file non è cambiato.
+    """
+    value = request.META.get("HTTP_IF_RANGE")
+    if not value:
+        return True
+
+    if value.startswith('"') or value.startswith("W/"):
+        # serve un confronto forte: gli ETag deboli non valgono
+        return not etag.startswith("W/") and value == etag
+
+    return parse_http_date_safe(value) == last_modified
+
+
+async def _aread_range(path, start, length):
+    """
+    Come _read_range, per ASGI: le letture girano nel thread pool e
+    l'event loop resta libero. (Un iteratore sincrono verrebbe invece
+    letto per intero in memoria da StreamingHttpResponse sotto ASGI.)
+    """
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+# ============================================================
+# ========================== RISPOSTA =========================
+# ============================================================
+
+def _offload_response(relative_path):
+    response = HttpResponse()
+
+    if OFFLOAD == "nginx":
+        response["X-Accel-Redirect"] = ACCEL_PREFIX + quote(relative_path)
+    else:
+        response["X-Sendfile"] = absolute_path(relative_path)
+
+    # il Content-Type lo decide Django, non il web server
+    del response["Content-Type"]
+    return response
+
+
+def serve_file(request, relative_path, *, filename, content_type,
+               etag=None, as_attachment=False, async_stream=False):
+    """
+    Invia un file di SECURE_UPLOAD_ROOT DOPO il controllo dei permessi.
+    Gestisce If-None-Match / If-Modified-Since (304) e Range (206),
+    oppure delega il trasferimento al web server se OFFLOAD è attivo.
+    Senza etag esplicito ne usa uno debole da mtime e dimensione.
+    async_stream=True dalle view async: corpo letto senza bloccare il loop.
+    """
+    path = absolute_path(relative_path)
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404("File non trovato")
+
+    etag = etag or 'W/"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+    last_modified = int(stat.st_mtime)
+
+    # ✅ il browser ha già questa versione → 304 senza toccare il file
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return not_modified
+
+    if OFFLOAD:
+        response = _offload_response(relative_path)
+    else:
+        response = _local_response(
+            request, path, stat.st_size, etag, last_modified, async_stream
+        )
+
+    response["Content-Type"] = content_type
+    response["Content-Disposition"] = content_disposition_header(
+        as_attachment, filename
+    )
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+
+    return response
+
+
+def serve_attachment(request, attachment, as_attachment=False, async_stream=False):
+    content_type = (
+        attachment.mime_type
+        or mimetypes.guess_type(attachment.file_name)[0]
+        or "application/octet-stream"
+    )
+
+    return serve_file(
+        request,
+        attachment.file_path,
+        filename=attachment.file_name,
+        content_type=content_type,
+        etag=attachment_etag(attachment),
+        as_attachment=as_attachment,
+        async_stream=async_stream,
+    )
+
+
+def _local_response(request, path, size, etag, last_modified, async_stream=False):
+    byte_range = None
+    header = request.META.get("HTTP_RANGE")
+
+    if header and _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(header, size)
+
+    if byte_range == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    reader = _aread_range if async_stream else _read_range
+
+    if byte_range is None:
+        if async_stream:
+            response = StreamingHttpResponse(reader(path, 0, size))
+            response["Content-Length"] = str(size)
+        else:
+            response = FileResponse(open(path, "rb"))
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            reader(path, start, end - start + 1), status=206
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+
+    response["Accept-Ranges"] = "bytes"
+    return response
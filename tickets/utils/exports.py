@@ -0,0 +1,237 @@
+import csv
+import json
+import sys
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from tickets.utils.archive import archive_covers, iter_archived_logs
+
+
+# Export in streaming di ticket e log: le righe vengono lette dal DB a
+# blocchi (keyset) e scritte man mano, quindi la memoria usata è la stessa
+# per 100 righe o per 10 milioni.
+#
+# Niente .iterator() "semplice": con MySQL il driver scarica comunque
+# l'intero risultato in memoria; query a blocchi su un indice sì.
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+# Righe lette per ogni query (e scritte per ogni chunk della risposta)
+BATCH_SIZE = 2000
+
+TICKET_COLUMNS = (
+    ("id", "id"),
+    ("title", "title"),
+    ("description", "description"),
+    ("status", "status"),
+    ("priority", "priority"),
+    ("created_by", "created_by__username"),
+    ("assigned_to", "assigned_to__username"),
+    ("created_at", "created_at"),
+    ("updated_at", "updated_at"),
+)
+
+LOG_COLUMNS = (
+    ("id", "id"),
+    ("timestamp", "timestamp"),
+    ("action", "action"),
+    ("details", "details"),
+    ("actor", "actor__username"),
+    ("target_user", "target_user__username"),
+    ("ticket_id", "ticket_id"),
+    ("ip_address", "ip_address"),
+    ("user_agent", "user_agent"),
+)
+
+
+# ============================================================
+# ========================== LETTURA =========================
+# ============================================================
+
+def iter_keyset(queryset, columns, time_field, batch_size=BATCH_SIZE, descending=False):
+    """
+    Tuple di `columns` in ordine (time_field, id), BATCH_SIZE per query.
+    Ogni blocco riparte dall'ultima riga letta: niente OFFSET, niente
+    cursore lato server, stessa memoria dall'inizio alla fine.
+    """
+    sign = "-" if descending else ""
+    op = "lt" if descending else "gt"
+    queryset = queryset.order_by(sign + time_field, sign + "id")
+
+    time_index = columns.index(time_field)
+    id_index = columns.index("id")
+    last = None
+
+    while True:
+        batch = queryset
+        if last is not None:
+            batch = batch.filter(
+                Q(**{f"{time_field}__{op}": last[0]})
+                | Q(**{time_field: last[0], f"id__{op}": last[1]})
+            )
+
+        rows = list(batch.values_list(*columns)[:batch_size])
+        if not rows:
+            return
+
+        yield rows
+        last = (rows[-1][time_index], rows[-1][id_index])
+
+
+def iter_ticket_rows(tickets, batch_size=BATCH_SIZE):
+    """
+    Blocchi di righe dei ticket già filtrati, in ordine di creazione
+    (indice ticket_created_id_idx).
+    """
+    fields = [field for _, field in TICKET_COLUMNS]
+    yield from iter_keyset(tickets, fields, "created_at", batch_size)
+
+
+def iter_log_rows(logs, filters, batch_size=BATCH_SIZE):
+    """
+    Blocchi di righe dei log già filtrati, dal più recente come in
+    admin_logs (indice adminlog_timestamp_idx), seguiti dai log
+    archiviati che cadono nello stesso range di date.
+    """
+    fields = [field for _, field in LOG_COLUMNS]
+    yield from iter_keyset(logs, fields, "timestamp", batch_size, descending=True)
+
+    if not (filters["start"] or filters["end"]):
+        return
+    if not archive_covers(filters["start"], filters["end"]):
+        return
+
+    batch = []
+    for log in iter_archived_logs(**filters):
+        batch.append((
+            log.id,
+            log.timestamp,
+            log.action,
+            log.details,
+            log.actor.username if log.actor else None,
+            log.target_user.username if log.target_user else None,
+            log.ticket.id if log.ticket else None,
+            log.ip_address,
+            log.user_agent,
+        ))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+# ============================================================
+# ========================= SCRITTURA ========================
+# ============================================================
+
+class _Echo:
+    # "file" per csv.writer: restituisce la riga invece di scriverla
+    def write(self, value):
+        return value
+
+
+def _value(value):
+    if hasattr(value, "isoformat"):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value):
+    value = _value(value)
+    # niente formule eseguite da Excel/LibreOffice all'apertura del file
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return "" if value is None else value
+
+
+def encode_csv(columns, batches):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in columns])
+
+    for rows in batches:
+        yield "".join(
+            writer.writerow([_csv_cell(v) for v in row]) for row in rows
+        )
+
+
+def encode_jsonl(columns, batches):
+    names = [name for name, _ in columns]
+
+    for rows in batches:
+        yield "".join(
+            json.dumps(
+                dict(zip(names, (_value(v) for v in row))), ensure_ascii=False
+            ) + "\n"
+            for row in rows
+        )
+
+
+def encode(fmt, columns, batches):
+    if fmt == "csv":
+        return encode_csv(columns, batches)
+    return encode_jsonl(columns, batches)
+
+
+# ============================================================
+# ========================= RISPOSTE =========================
+# ============================================================
+
+def export_tickets(tickets, fmt):
+    return encode(fmt, TICKET_COLUMNS, iter_ticket_rows(tickets))
+
+
+def export_logs(logs, filters, fmt):
+    return encode(fmt, LOG_COLUMNS, iter_log_rows(logs, filters))
+
+
+async def _aiter_chunks(chunks):
+    # ASGI: Django consumerebbe un iteratore sincrono con list(), cioè
+    # tutto l'export in memoria; qui un blocco alla volta, nello stesso
+    # thread (e quindi con la stessa connessione al DB)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def export_response(chunks, fmt, basename, async_stream=False):
+    filename = "%s-%s.%s" % (basename, timezone.localdate().isoformat(), fmt)
+
+    if async_stream:
+        chunks = _aiter_chunks(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["Cache-Control"] = "private, no-store"
+    # niente buffering del proxy (nginx): le righe partono subito
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+
+def write_export(chunks, path=None):
+    """
+    Comandi manage.py: scrive l'export blocco per blocco su file o stdout.
+    """
+    if not path:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        sys.stdout.flush()
+        return
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for chunk in chunks:
+            f.write(chunk)
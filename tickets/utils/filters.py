@@ -0,0 +1,131 @@
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from tickets.utils.dates import day_end, day_start
+from tickets.utils.search import matching_tickets
+
+
+# Filtri delle liste di ticket e di admin_logs, condivisi da pagine HTML,
+# export e comandi manage.py. `params` è un QueryDict (request.GET o
+# costruito da un comando): stessi nomi dei campi dei form.
+
+
+# ============================================================
+# ========================== TICKET ==========================
+# ============================================================
+
+def filter_tickets(queryset, params):
+    """
+    Filtri di apply_ticket_filters (pagine), export e comandi.
+    """
+    priority = params.getlist("priority")
+    status = params.getlist("status")
+    user = params.get("user")
+    title = params.get("title")
+    date_from = params.get("date_from")
+    date_to = params.get("date_to")
+
+    if priority:
+        queryset = queryset.filter(priority__in=priority)
+
+    if status:
+        queryset = queryset.filter(status__in=status)
+
+    if user:
+        queryset = queryset.filter(created_by__id=user)
+
+    if title:
+        queryset = queryset.filter(title__icontains=title)
+
+    # ✅ intervallo semiaperto [date_from 00:00, date_to+1 00:00) nel fuso
+    #    configurato: la colonna resta "nuda" e l'indice viene usato
+    if day_start(date_from):
+        queryset = queryset.filter(created_at__gte=day_start(date_from))
+
+    if day_end(date_to):
+        queryset = queryset.filter(created_at__lt=day_end(date_to))
+
+    # ✅ ricerca full-text (titolo, descrizione, messaggi): sottoquery
+    #    senza limite, quindi valgono anche ambito e filtri qui sopra
+    #    (l'ordine per rilevanza lo dà paginate_search)
+    matches = matching_tickets(params.get("q"))
+    if matches is not None:
+        queryset = queryset.filter(id__in=matches)
+
+    return queryset
+
+
+# ============================================================
+# ========================= ADMIN LOG ========================
+# ============================================================
+
+def log_filters(params):
+    """
+    Filtri di admin_logs, con gli stessi nomi degli argomenti di
+    iter_archived_logs (così valgono anche per l'archivio).
+    """
+    return {
+        "actor": (params.get("admin") or "").strip(),
+        "target": (params.get("target") or "").strip(),
+        "action": (params.get("action") or "").strip(),
+        "start": day_start(params.get("from")),
+        "end": day_end(params.get("to")),
+    }
+
+
+def filter_admin_logs(queryset, filters):
+    if filters["actor"]:
+        queryset = queryset.filter(actor__username__icontains=filters["actor"])
+
+    if filters["target"]:
+        queryset = queryset.filter(target_user__username__icontains=filters["target"])
+
+    if filters["action"]:
+        queryset = queryset.filter(action__icontains=filters["action"])
+
+    if filters["start"]:
+        queryset = queryset.filter(timestamp__gte=filters["start"])
+
+    if filters["end"]:
+        queryset = queryset.filter(timestamp__lt=filters["end"])
+
+    return queryset
+
+
+# ============================================================
+# ========================== UTENTI ==========================
+# ============================================================
+
+def _prefix_range(prefix):
+    """
+    [prefisso, prefisso "successivo") in maiuscolo: tutte le stringhe che
+    iniziano con il prefisso cadono nel range.
+    """
+    start = prefix.upper()
+    last = ord(start[-1])
+    end = start[:-1] + chr(last + 1) if last < 0x10FFFF else None
+    return start, end
+
+
+def filter_users_by_prefix(queryset, query, fields=("username",)):
+    """
+    Utenti il cui campo (username, email, ...) inizia con `query`, senza
+    distinzione di maiuscole.
+
+    Niente istartswith: LIKE/UPPER sulla colonna non usano l'indice.
+    Il confronto è un range su UPPER(campo), la stessa espressione degli
+    indici funzionali della migrazione 0024.
+    """
+    start, end = _prefix_range(query)
+    match = Q()
+
+    for field in fields:
+        alias = f"{field}_upper"
+        queryset = queryset.alias(**{alias: Upper(field)})
+
+        condition = Q(**{f"{alias}__gte": start})
+        if end:
+            condition &= Q(**{f"{alias}__lt": end})
+        match |= condition
+
+    return queryset.filter(match)
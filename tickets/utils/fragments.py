@@ -0,0 +1,197 @@
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from tickets.models import Ticket
+
+
+# Frammenti HTML (righe delle tabelle, intestazione del ticket) salvati in
+# cache con la VERSIONE del ticket nella chiave: i segnali cambiano la
+# versione e i frammenti vecchi semplicemente non vengono più letti.
+#
+# I frammenti mostrano solo campi del ticket e username di creatore e
+# assegnatario: la versione cambia con il ticket (post_save/post_delete) e
+# con lo username (user_post_save). Messaggi e allegati non compaiono in
+# nessun frammento (chat e allegati di ticket_detail sono letti ogni volta),
+# quindi i loro segnali NON cambiano la versione: svuoterebbero la cache
+# delle righe a ogni messaggio senza motivo. Se un frammento inizia a
+# mostrarli (es. numero di messaggi), servono anche quei receiver
+# (vedi FragmentDependencyTests).
+
+CACHE_ALIAS = getattr(settings, "FRAGMENT_CACHE_ALIAS", "default")
+
+# I frammenti di versioni superate scadono da soli
+FRAGMENT_TIMEOUT = getattr(settings, "FRAGMENT_CACHE_TIMEOUT", 24 * 3600)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(ticket_id):
+    return f"tickets:ver:{ticket_id}"
+
+
+def _fragment_key(name, ticket, version, variant=""):
+    # anche updated_at nella chiave: una riga letta dal DB PRIMA di un
+    # salvataggio non può finire sotto la chiave dei dati nuovi
+    stamp = ticket.updated_at.timestamp() if ticket.updated_at else ""
+    return f"tickets:frag:{name}:{variant}:{ticket.id}:{version}:{stamp}"
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+# ============================================================
+# ========================= VERSIONI =========================
+# ============================================================
+
+def bump_ticket_versions(ticket_ids):
+    """
+    Nuova versione per i ticket indicati, DOPO il commit: chi legge prima
+    del commit vede ancora i dati vecchi e li salva con la versione vecchia.
+    """
+    keys = [_version_key(pk) for pk in ticket_ids]
+    if not keys:
+        return
+
+    transaction.on_commit(
+        lambda: _cache().set_many({key: _new_version() for key in keys}, None)
+    )
+
+
+def bump_ticket_version(ticket_id):
+    bump_ticket_versions([ticket_id])
+
+
+def bump_user_tickets(user_id):
+    """
+    Username cambiato: cambia nelle righe dei ticket creati o assegnati.
+    """
+    ids = Ticket.objects.filter(
+        Q(created_by_id=user_id) | Q(assigned_to_id=user_id)
+    ).values_list("id", flat=True)
+
+    bump_ticket_versions(list(ids))
+
+
+def _with_missing(versions, ticket_ids):
+    # versione assente (mai creata o espulsa): una nuova, mai usata prima
+    missing = {
+        _version_key(pk): _new_version()
+        for pk in ticket_ids if _version_key(pk) not in versions
+    }
+    versions.update(missing)
+    return versions, missing
+
+
+# ============================================================
+# ========================== RIGHE ===========================
+# ============================================================
+
+def _row_keys(template_name, tickets, variant, versions):
+    return {
+        t.id: _fragment_key(template_name, t, versions[_version_key(t.id)], variant)
+        for t in tickets
+    }
+
+
+def _render_rows(template_name, tickets, context, keys, cached):
+    """
+    Rende SOLO le righe mancanti; le altre arrivano già pronte dalla cache.
+    I risultati di ricerca (snippet) non vengono mai messi in cache.
+    """
+    html = []
+    fresh = {}
+
+    for t in tickets:
+        snippet = getattr(t, "search_snippet", None)
+        row = None if snippet else cached.get(keys[t.id])
+
+        if row is None:
+            row = render_to_string(template_name, {**context, "t": t})
+            if not snippet:
+                fresh[keys[t.id]] = row
+
+        html.append(row)
+
+    return mark_safe("".join(html)), fresh
+
+
+def render_rows(template_name, tickets, context=None, variant=""):
+    """
+    HTML di tutte le righe di una pagina di ticket con pochi accessi
+    multipli alla cache (versioni, frammenti, salvataggio dei mancanti),
+    qualunque sia il numero di righe.
+    `variant` distingue righe che dipendono da altro oltre al ticket.
+    """
+    cache = _cache()
+    tickets = list(tickets)
+    ids = [t.id for t in tickets]
+
+    versions, missing = _with_missing(
+        cache.get_many([_version_key(pk) for pk in ids]), ids
+    )
+    if missing:
+        cache.set_many(missing, None)
+
+    keys = _row_keys(template_name, tickets, variant, versions)
+    cached = cache.get_many(list(keys.values()))
+
+    html, fresh = _render_rows(template_name, tickets, context or {}, keys, cached)
+    if fresh:
+        cache.set_many(fresh, FRAGMENT_TIMEOUT)
+
+    return html
+
+
+async def arender_rows(template_name, tickets, context=None, variant=""):
+    """
+    Come render_rows, per le view async: tutto (cache + render) in UN solo
+    passaggio al thread pool. Le API async della cache non aiutano: per i
+    backend senza versione nativa (LocMemCache, Redis, Memcached di Django)
+    aget_many/aset_many fanno un sync_to_async PER CHIAVE, cioè ~100
+    passaggi di thread per una pagina da 50 righe.
+    """
+    return await sync_to_async(render_rows)(template_name, tickets, context, variant)
+
+
+# ============================================================
+# ====================== SINGOLO FRAMMENTO ===================
+# ============================================================
+
+def render_fragment(template_name, ticket, context, variant=""):
+    """
+    Un frammento legato a un ticket (es. intestazione di ticket_detail).
+    """
+    cache = _cache()
+    version_key = _version_key(ticket.id)
+
+    version = cache.get(version_key)
+    if version is None:
+        version = _new_version()
+        cache.set(version_key, version, None)
+
+    key = _fragment_key(template_name, ticket, version, variant)
+
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template_name, {**context, "ticket": ticket})
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+
+    return mark_safe(html)
+
+
+async def arender_fragment(template_name, ticket, context, variant=""):
+    """
+    Come render_fragment, in un solo passaggio al thread pool invece di
+    uno per ogni accesso alla cache.
+    """
+    return await sync_to_async(render_fragment)(template_name, ticket, context, variant)
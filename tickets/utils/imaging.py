@@ -0,0 +1,40 @@
+import os
+import tempfile
+
+
+# Questo modulo gira nei processi del pool delle miniature:
+# niente import di Django, solo Pillow e file system.
+
+
+def render_thumbnail(source, dest, max_px):
+    """
+    Riduce l'immagine `source` entro max_px × max_px e la salva in `dest`
+    (scrittura atomica). Restituisce `dest`.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        # JPEG: decodifica direttamente a risoluzione ridotta
+        img.draft("RGB", (max_px, max_px))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_px, max_px))
+
+        if dest.endswith(".png"):
+            fmt, options = "PNG", {"optimize": True}
+        else:
+            fmt, options = "JPEG", {"quality": 85, "optimize": True}
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, fmt, **options)
+            os.replace(tmp, dest)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    return dest
@@ -0,0 +1,423 @@
+import csv
+import hashlib
+import json
+import mimetypes
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tickets.models import ImportCheckpoint, Message, Ticket, TicketAttachment
+from tickets.utils.audit import log_change
+from tickets.utils.search import index_tickets
+from tickets.utils.stats import apply_ticket_inserts, ticket_state
+from tickets.utils.storage import blob_relative_path, store_file
+
+
+# Import in blocco da helpdesk legacy (manage.py import_tickets).
+#
+# Un record = un ticket con i suoi messaggi e allegati:
+#   {"external_id": "HD-1", "title": ..., "description": ...,
+#    "status": "open", "priority": "medium",
+#    "created_by": "mario", "assigned_to": "op1",
+#    "created_at": "2023-01-31T10:00:00+01:00", "updated_at": ...,
+#    "messages": [{"sender": "mario", "text": ..., "created_at": ...}],
+#    "attachments": [{"path": "hd/1/a.pdf", "file_name": ..., "uploaded_by": ...}]}
+# In CSV le colonne "messages" e "attachments" contengono la lista in JSON.
+#
+# bulk_create non invia post_save: niente log, email, chat live e indice
+# per riga. Contatori, indice di ricerca e audit vengono aggiornati UNA
+# volta per blocco, nella stessa transazione del blocco e del checkpoint.
+
+BATCH_SIZE = 1000
+
+STATUSES = {key for key, _ in Ticket.STATUS_CHOICES}
+PRIORITIES = {key for key, _ in Ticket.PRIORITY_CHOICES}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    tickets: int = 0
+    messages: int = 0
+    attachments: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    resumed_from: int = 0
+
+
+# ============================================================
+# ========================== LETTURA =========================
+# ============================================================
+
+def detect_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_records(path, fmt):
+    """
+    (numero, dict) per ogni record, letti in streaming dal file.
+    I numeri partono da 1 e sono la base del checkpoint.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(f), start=1):
+                yield number, _from_csv(row)
+        else:
+            lines = (line for line in f if line.strip())
+            for number, line in enumerate(lines, start=1):
+                try:
+                    yield number, json.loads(line)
+                except ValueError as exc:
+                    yield number, InvalidRecord(f"JSON non valido: {exc}")
+
+
+def _from_csv(row):
+    record = {k: v for k, v in row.items() if v not in (None, "")}
+
+    for key in ("messages", "attachments"):
+        if key in record:
+            try:
+                record[key] = json.loads(record[key])
+            except ValueError:
+                return InvalidRecord(f"colonna {key}: JSON non valido")
+
+    return record
+
+
+# ============================================================
+# ========================= CHECKPOINT =======================
+# ============================================================
+
+def checkpoint_key(name):
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+def get_checkpoint(name):
+    return (
+        ImportCheckpoint.objects.filter(key=checkpoint_key(name))
+        .values_list("last_number", flat=True)
+        .first()
+    ) or 0
+
+
+def reset_checkpoint(name):
+    ImportCheckpoint.objects.filter(key=checkpoint_key(name)).delete()
+
+
+def _save_checkpoint(name, number):
+    ImportCheckpoint.objects.update_or_create(
+        key=checkpoint_key(name), defaults={"name": name, "last_number": number}
+    )
+
+
+# ============================================================
+# ========================== UTENTI ==========================
+# ============================================================
+
+class UserResolver:
+    """
+    username → id, con una query per blocco per i nomi non ancora visti.
+    Con create=True gli utenti mancanti vengono creati disattivati e
+    senza password utilizzabile.
+    """
+
+    def __init__(self, create=False):
+        self.create = create
+        self.ids = {}
+
+    def load(self, records):
+        names = set()
+        for record in records:
+            names.update(_usernames(record))
+        names -= self.ids.keys()
+
+        if not names:
+            return
+
+        self.ids.update(
+            User.objects.filter(username__in=names).values_list("username", "id")
+        )
+
+        if self.create:
+            for name in sorted(names - self.ids.keys()):
+                user = User(username=name, is_active=False)
+                user.set_unusable_password()
+                user.save()
+                self.ids[name] = user.id
+
+    def get(self, name, required=True):
+        if not name:
+            if required:
+                raise InvalidRecord("utente mancante")
+            return None
+        if name not in self.ids:
+            raise InvalidRecord(f"utente inesistente: {name}")
+        return self.ids[name]
+
+
+def _usernames(record):
+    if not isinstance(record, dict):
+        return []
+
+    names = [record.get("created_by"), record.get("assigned_to")]
+    names += [m.get("sender") for m in record.get("messages") or () if isinstance(m, dict)]
+    names += [a.get("uploaded_by") for a in record.get("attachments") or () if isinstance(a, dict)]
+    return [n for n in names if n]
+
+
+# ============================================================
+# ======================= CONVERSIONE ========================
+# ============================================================
+
+def _datetime(value, default):
+    if not value:
+        return default
+
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise InvalidRecord(f"data non valida: {value}")
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _choice(value, choices, default, label):
+    value = value or default
+    if value not in choices:
+        raise InvalidRecord(f"{label} non valido: {value}")
+    return value
+
+
+def build_ticket(record, number, name, users, now):
+    if isinstance(record, InvalidRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord("il record non è un oggetto")
+    if not record.get("title"):
+        raise InvalidRecord("titolo mancante")
+
+    created_at = _datetime(record.get("created_at"), now)
+
+    return Ticket(
+        title=str(record["title"])[:200],
+        description=record.get("description") or "",
+        status=_choice(record.get("status"), STATUSES, "open", "stato"),
+        priority=_choice(record.get("priority"), PRIORITIES, "medium", "priorità"),
+        created_by_id=users.get(record.get("created_by")),
+        assigned_to_id=users.get(record.get("assigned_to"), required=False),
+        created_at=created_at,
+        updated_at=_datetime(record.get("updated_at"), created_at),
+        import_ref=str(record.get("external_id") or f"{name}:{number}")[:100],
+    )
+
+
+def build_messages(record, ticket, users):
+    messages = []
+
+    for item in record.get("messages") or ():
+        if not isinstance(item, dict) or not item.get("text"):
+            raise InvalidRecord("messaggio senza testo")
+
+        messages.append(Message(
+            sender_id=users.get(item.get("sender")),
+            text=item["text"],
+            created_at=_datetime(item.get("created_at"), ticket.created_at),
+        ))
+
+    return messages
+
+
+def build_attachments(record, ticket, users, root):
+    """
+    Allegati con il path del file legacy (relativo a `root`): il contenuto
+    viene copiato nello storage deduplicato solo dentro la transazione.
+    """
+    attachments = []
+
+    for item in record.get("attachments") or ():
+        if not isinstance(item, dict) or not item.get("path"):
+            raise InvalidRecord("allegato senza path")
+
+        path = os.path.join(root, item["path"]) if root else item["path"]
+        if not os.path.isfile(path):
+            raise InvalidRecord(f"file allegato mancante: {item['path']}")
+
+        file_name = item.get("file_name") or os.path.basename(path)
+        attachments.append((path, TicketAttachment(
+            uploaded_by_id=users.get(item.get("uploaded_by")) if item.get("uploaded_by")
+            else ticket.created_by_id,
+            file_name=file_name[:255],
+            mime_type=(
+                item.get("mime_type")
+                or mimetypes.guess_type(file_name)[0]
+                or "application/octet-stream"
+            )[:100],
+            uploaded_at=_datetime(item.get("uploaded_at"), ticket.created_at),
+        )))
+
+    return attachments
+
+
+@contextmanager
+def keep_timestamps(*fields):
+    """
+    bulk_create applica auto_now/auto_now_add e sovrascriverebbe le date
+    d'origine: per la durata dell'import (processo del comando) li spegne.
+    """
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    try:
+        for f, _, _ in saved:
+            f.auto_now = f.auto_now_add = False
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+# ============================================================
+# ========================== IMPORT ==========================
+# ============================================================
+
+def import_tickets(
+    path,
+    *,
+    actor,
+    fmt=None,
+    name=None,
+    batch_size=BATCH_SIZE,
+    create_users=False,
+    attachments_root=None,
+    restart=False,
+    stdout=None,
+    stderr=None,
+):
+    """
+    Importa il file a blocchi di `batch_size` record; ogni blocco è una
+    transazione che salva anche il checkpoint, quindi un import interrotto
+    riparte dal primo blocco non confermato senza doppioni.
+    """
+    fmt = fmt or detect_format(path)
+    name = name or os.path.basename(path)
+
+    if restart:
+        reset_checkpoint(name)
+
+    result = ImportResult(resumed_from=get_checkpoint(name))
+    users = UserResolver(create=create_users)
+
+    records = read_records(path, fmt)
+    records = islice(records, result.resumed_from, None)
+
+    with keep_timestamps(
+        Ticket._meta.get_field("created_at"),
+        Ticket._meta.get_field("updated_at"),
+        Message._meta.get_field("created_at"),
+        TicketAttachment._meta.get_field("uploaded_at"),
+    ):
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            _import_batch(batch, name, actor, users, attachments_root, result, stderr)
+
+            if stdout:
+                stdout.write(
+                    f"Record {batch[-1][0]}: {result.tickets} ticket, "
+                    f"{result.messages} messaggi, {result.attachments} allegati"
+                )
+
+    return result
+
+
+def _import_batch(batch, name, actor, users, root, result, stderr=None):
+    users.load(record for _, record in batch)
+    now = timezone.now()
+
+    rows = []
+    for number, record in batch:
+        try:
+            ticket = build_ticket(record, number, name, users, now)
+            rows.append((
+                ticket,
+                build_messages(record, ticket, users),
+                build_attachments(record, ticket, users, root),
+            ))
+        except InvalidRecord as exc:
+            result.rejected += 1
+            if stderr:
+                stderr.write(f"Record {number} scartato: {exc}")
+
+    with transaction.atomic():
+        # ✅ già importati (stesso external_id): saltati, niente doppioni
+        existing = set(
+            Ticket.objects.filter(
+                import_ref__in=[t.import_ref for t, _, _ in rows]
+            ).values_list("import_ref", flat=True)
+        )
+        fresh = {}
+        for row in rows:
+            if row[0].import_ref in existing or row[0].import_ref in fresh:
+                result.duplicates += 1
+            else:
+                fresh[row[0].import_ref] = row
+        rows = list(fresh.values())
+        tickets = [t for t, _, _ in rows]
+
+        Ticket.objects.bulk_create(tickets)
+
+        # MySQL non restituisce gli id dopo bulk_create: si rileggono
+        ids = dict(
+            Ticket.objects.filter(import_ref__in=fresh).values_list("import_ref", "id")
+        )
+        for ticket in tickets:
+            ticket.pk = ids[ticket.import_ref]
+
+        messages = []
+        attachments = []
+        for ticket, ticket_messages, ticket_attachments in rows:
+            for message in ticket_messages:
+                message.ticket_id = ticket.pk
+                messages.append(message)
+
+            for source, attachment in ticket_attachments:
+                blob = store_file(source)
+                attachment.ticket_id = ticket.pk
+                attachment.blob = blob
+                attachment.file_path = blob_relative_path(blob.sha256)
+                attachment.file_size = blob.size
+                attachments.append(attachment)
+
+        Message.objects.bulk_create(messages)
+        TicketAttachment.objects.bulk_create(attachments)
+
+        # ✅ effetti dei segnali, una volta per blocco
+        apply_ticket_inserts(ticket_state(t) for t in tickets)
+        index_tickets(tickets)
+
+        first, last = batch[0][0], batch[-1][0]
+        log_change(
+            actor=actor,
+            action="TICKET IMPORT",
+            extra=(
+                f"Import: {name} - Record {first}-{last} - "
+                f"Ticket: {len(tickets)} - Messaggi: {len(messages)} - "
+                f"Allegati: {len(attachments)}"
+            ),
+        )
+
+        _save_checkpoint(name, last)
+
+    result.tickets += len(tickets)
+    result.messages += len(messages)
+    result.attachments += len(attachments)
@@ -0,0 +1,210 @@
+import abc
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import formats, timezone
+from django.utils.module_loading import import_string
+
+from tickets.utils.roles import has_role
+
+
+# Coda massima per ogni client: oltre, il client riceve "resync"
+# e ricarica la pagina invece di far crescere la memoria.
+QUEUE_SIZE = 100
+
+# Evento speciale inserito in coda quando un client resta indietro
+OVERFLOW = object()
+
+# Commento ": ping" ogni N secondi per tenere aperti proxy e connessioni
+HEARTBEAT_SECONDS = 15
+
+# Durata massima di una connessione: poi il browser si riconnette da solo
+# (Last-Event-ID) e la richiesta libera le risorse del worker
+MAX_STREAM_SECONDS = getattr(settings, "LIVE_MAX_STREAM_SECONDS", 300)
+
+
+# ============================================================
+# ============================ HUB ===========================
+# ============================================================
+
+class Subscription:
+    """
+    Iscrizione di UN client (una connessione SSE) a un canale.
+    Vive nell'event loop della richiesta: nessun thread per client.
+    """
+
+    def __init__(self, hub, channel):
+        self.hub = hub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def push(self, event):
+        # chiamato nel loop del client (call_soon_threadsafe)
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = OVERFLOW
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """
+        Prossimo evento, oppure None allo scadere del timeout (heartbeat).
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub(abc.ABC):
+    """
+    Interfaccia publish/subscribe usata dalla chat live.
+    publish() è sincrono (arriva dai segnali, dopo il commit);
+    subscribe() va chiamato dentro l'event loop della richiesta.
+
+    Per più nodi basta una sottoclasse che inoltri publish() a un broker
+    (Redis, PostgreSQL LISTEN/NOTIFY, ...) e che, alla ricezione, chiami
+    deliver() sul nodo locale. Si configura con settings.LIVE_HUB.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def deliver(self, channel, event):
+        """
+        Consegna un evento ai client connessi a QUESTO processo.
+        """
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:
+                # loop già chiuso: il client se n'è andato
+                self.unsubscribe(subscription)
+
+    @abc.abstractmethod
+    def publish(self, channel, event):
+        """
+        Invia l'evento a tutti i client del canale, su tutti i nodi.
+        """
+
+
+class LocalHub(Hub):
+    """
+    Hub in memoria: sufficiente con un solo processo ASGI.
+    """
+
+    def publish(self, channel, event):
+        self.deliver(channel, event)
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    global _hub
+
+    with _hub_lock:
+        if _hub is None:
+            hub_class = import_string(
+                getattr(settings, "LIVE_HUB", "tickets.utils.live.LocalHub")
+            )
+            _hub = hub_class()
+        return _hub
+
+
+# ============================================================
+# ========================== EVENTI ==========================
+# ============================================================
+
+def ticket_channel(ticket_id):
+    return f"ticket:{ticket_id}"
+
+
+def is_staff_side(user):
+    """
+    Lato della chat di chi scrive: stesso criterio di chat_messages.
+    """
+    return user.is_staff or has_role(user, "operator")
+
+
+def message_event(message, is_staff_side):
+    return {
+        "type": "message",
+        "id": message.id,
+        "sender": message.sender.username,
+        "text": message.text,
+        "created_at": formats.date_format(
+            timezone.localtime(message.created_at), "d/m/Y H:i"
+        ),
+        "is_staff_side": bool(is_staff_side),
+    }
+
+
+def attachment_event(attachment):
+    return {
+        "type": "attachment",
+        "id": attachment.id,
+        "file_name": attachment.file_name,
+        "mime_type": attachment.mime_type,
+        "uploaded_by": attachment.uploaded_by.username,
+        "preview_url": reverse("attachment_preview", args=[attachment.id]),
+        "download_url": reverse("secure_download", args=[attachment.id]),
+    }
+
+
+def publish_after_commit(ticket_id, event):
+    """
+    Gli altri client rileggono i dati solo se il commit è andato a buon fine.
+    """
+    channel = ticket_channel(ticket_id)
+    transaction.on_commit(lambda: get_hub().publish(channel, event))
+
+
+def parse_cursor(value):
+    """
+    "15.3" → (ultimo messaggio, ultimo allegato) già visti dal client.
+    """
+    try:
+        message_id, attachment_id = (int(x) for x in (value or "").split("."))
+    except ValueError:
+        return None
+    return message_id, attachment_id
+
+
+def format_sse(event, cursor):
+    """
+    Evento nel formato text/event-stream. L'id ("<msg>.<allegato>") viene
+    rimandato dal browser in Last-Event-ID quando si riconnette.
+    """
+    return (
+        f"id: {cursor[0]}.{cursor[1]}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    )
@@ -1,8 +1,25 @@
-from django.core.mail import EmailMultiAlternatives
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from tickets.models import AdminLog, EmailOutbox
+
+
+# Tentativi massimi prima di marcare l'email come "dead"
+MAX_ATTEMPTS = getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
 
-from tickets.models import AdminLog
+# Backoff esponenziale: 60s, 120s, 240s, ... fino a un massimo di 1 ora
+RETRY_BASE_SECONDS = getattr(settings, "EMAIL_OUTBOX_RETRY_BASE", 60)
+RETRY_MAX_SECONDS = 3600
+
+# Durata della presa in carico di un lotto ("sending"): se il worker muore
+# durante l'invio, allo scadere le email tornano inviabili. Deve superare
+# il tempo di invio di un lotto.
+LEASE_SECONDS = getattr(settings, "EMAIL_OUTBOX_LEASE", 300)
 
 
 def send_ticket_email(
@@ -16,42 +33,182 @@ def send_ticket_email(
     ticket=None
 ):
     """
-    Invia email HTML + testo e LOGGA nel DB l'invio.
+    Mette in coda un'email HTML + testo nella tabella EmailOutbox.
+
+    Nessuna connessione SMTP nella richiesta: l'invio reale e il log
+    "EMAIL SENT" li fa il worker `manage.py send_outbox`.
     """
 
     if not recipient_list:
-        return
+        return None
 
-    # ✅ INVIO EMAIL
-    email = EmailMultiAlternatives(
+    return EmailOutbox.objects.create(
         subject=subject,
-        body=text_content,
+        text_content=text_content,
+        html_content=html_content or "",
+        recipients=list(recipient_list),
+        actor=actor,
+        target_user=target_user,
+        ticket=ticket,
+    )
+
+
+def _retry_delay(attempts):
+    return timedelta(
+        seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    )
+
+
+def _mark_failed(item, exc):
+    """
+    Nuovo tentativo con backoff esponenziale, "dead" dopo MAX_ATTEMPTS.
+    """
+    item.attempts += 1
+    item.last_error = f"{type(exc).__name__}: {exc}"
+
+    if item.attempts >= MAX_ATTEMPTS:
+        item.status = "dead"
+    else:
+        item.status = "pending"
+        item.next_attempt_at = timezone.now() + _retry_delay(item.attempts)
+
+    item.save(update_fields=[
+        "attempts", "last_error", "status", "next_attempt_at"
+    ])
+
+
+def _build_message(item, mail_connection):
+    email = EmailMultiAlternatives(
+        subject=item.subject,
+        body=item.text_content,
         from_email=settings.DEFAULT_FROM_EMAIL,
-        to=recipient_list
+        to=item.recipients,
+        connection=mail_connection,
     )
 
-    email.attach_alternative(html_content, "text/html")
-    email.send()
-
-    # ✅ LOG DATABASE (UNO PER OGNI DESTINATARIO)
-    for recipient in recipient_list:
-
-        target = None
-        try:
-            target = User.objects.get(email=recipient)
-        except User.DoesNotExist:
-            target = None
-
-        AdminLog.objects.create(
-            actor=actor,                     # chi ha causato l'evento
-            target_user=target or target_user,
-            ticket=ticket,
-            action="EMAIL SENT",
-            details=(
-                f"Oggetto: {subject}\n"
-                f"Destinatario: {recipient}"
+    if item.html_content:
+        email.attach_alternative(item.html_content, "text/html")
+
+    return email
+
+
+def _users_by_email(items):
+    """
+    Utenti destinatari di tutto il lotto, con un'unica query.
+    """
+    emails = {r for item in items for r in item.recipients}
+    return {u.email: u for u in User.objects.filter(email__in=emails)}
+
+
+def _mark_sent(item, users_by_email):
+    """
+    Riga "sent" + log "EMAIL SENT" (uno per destinatario) nella stessa
+    transazione, una per email: un errore dopo non annulla gli invii già
+    registrati.
+    """
+    item.status = "sent"
+    item.attempts += 1
+    item.sent_at = timezone.now()
+    item.last_error = ""
+
+    with transaction.atomic():
+        item.save(update_fields=["status", "attempts", "sent_at", "last_error"])
+
+        AdminLog.objects.bulk_create([
+            AdminLog(
+                actor_id=item.actor_id,                  # chi ha causato l'evento
+                target_user=users_by_email.get(recipient) or item.target_user,
+                ticket_id=item.ticket_id,
+                action="EMAIL SENT",
+                details=(
+                    f"Oggetto: {item.subject}\n"
+                    f"Destinatario: {recipient}"
+                )
+            )
+            for recipient in item.recipients
+        ])
+
+
+def _claim(batch_size):
+    """
+    Prende in carico un lotto in una transazione breve: le righe passano a
+    "sending" con una scadenza (next_attempt_at = ora + LEASE_SECONDS) e
+    nessun altro worker le legge finché non scade.
+    Sono inviabili le "pending" scadute e le "sending" con la presa in
+    carico scaduta (worker morto durante l'invio).
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        queryset = EmailOutbox.objects.filter(
+            status__in=("pending", "sending"),
+            next_attempt_at__lte=now,
+        ).select_related("target_user").order_by("id")
+
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        else:
+            queryset = queryset.select_for_update()
+
+        batch = list(queryset[:batch_size])
+        if batch:
+            lease = now + timedelta(seconds=LEASE_SECONDS)
+            EmailOutbox.objects.filter(pk__in=[item.pk for item in batch]).update(
+                status="sending", next_attempt_at=lease
             )
-        )
+
+    return batch
+
+
+def deliver_outbox(batch_size=50, mail_connection=None):
+    """
+    Invia un lotto di email in coda su UNA sola connessione SMTP.
+
+    - le righe vengono prese in carico in una transazione breve
+      (SELECT ... FOR UPDATE SKIP LOCKED dove supportato, poi "sending"),
+      così più worker non inviano la stessa email;
+    - l'invio SMTP avviene FUORI da ogni transazione: nessun lock tenuto
+      durante le chiamate al server;
+    - ogni esito viene salvato subito nella sua transazione: un errore a
+      metà lotto non fa ripartire le email già inviate;
+    - in caso di errore (anche di connessione al server SMTP): nuovo
+      tentativo con backoff esponenziale, dopo MAX_ATTEMPTS la riga
+      passa a "dead".
+
+    Restituisce (inviate, fallite).
+    """
+    batch = _claim(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent, failed = 0, 0
+    users_by_email = _users_by_email(batch)
+    mail_connection = mail_connection or get_connection()
+
+    # ✅ SMTP irraggiungibile: nessuna email del lotto può partire,
+    #    tutte riprovano più tardi (backoff) invece di far cadere il worker
+    try:
+        mail_connection.open()
+    except Exception as exc:
+        for item in batch:
+            _mark_failed(item, exc)
+        return 0, len(batch)
+
+    try:
+        for item in batch:
+            try:
+                _build_message(item, mail_connection).send()
+            except Exception as exc:
+                failed += 1
+                _mark_failed(item, exc)
+                continue
+
+            _mark_sent(item, users_by_email)
+            sent += 1
+    finally:
+        mail_connection.close()
+
+    return sent, failed
 
 
 def build_ticket_email_html(title, message, ticket_url, button_text):
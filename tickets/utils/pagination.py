@@ -0,0 +1,226 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from tickets.utils.search import search_tickets
+
+
+# Numero di ticket per pagina nelle liste
+PAGE_SIZE = 50
+
+
+def encode_cursor(created_at, pk):
+    """
+    Codifica la coppia (created_at, id) in un cursore opaco per la URL.
+    """
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica un cursore. Restituisce (created_at, id) oppure None
+    se il cursore è mancante o manomesso.
+    """
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, TypeError):
+        return None
+
+    if created_at is None:
+        return None
+
+    return created_at, pk
+
+
+class KeysetPage:
+    """
+    Pagina di risultati ottenuta con paginazione keyset su (created_at, id).
+
+    È iterabile come il queryset che sostituisce, quindi i template
+    possono continuare a fare {% for t in tickets %}.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _keyset(request, queryset):
+    after = decode_cursor(request.GET.get("after"))
+    before = decode_cursor(request.GET.get("before"))
+
+    if before:
+        created_at, pk = before
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) |
+            Q(created_at=created_at, id__gt=pk)
+        ).order_by("created_at", "id")
+    else:
+        if after:
+            created_at, pk = after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=pk)
+            )
+        queryset = queryset.order_by("-created_at", "-id")
+
+    return queryset, after, before
+
+
+def _ticket_cursor(row):
+    return encode_cursor(row.created_at, row.id)
+
+
+def _build_page(rows, after, before, page_size, cursor=_ticket_cursor):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if before:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage([])
+
+    first, last = rows[0], rows[-1]
+
+    if before:
+        has_next = True
+        has_previous = has_more
+    else:
+        has_next = has_more
+        has_previous = after is not None
+
+    return KeysetPage(
+        rows,
+        next_cursor=cursor(last) if has_next else None,
+        previous_cursor=cursor(first) if has_previous else None,
+    )
+
+
+def paginate_tickets(request, queryset, page_size=PAGE_SIZE):
+    """
+    Paginazione keyset (cursore) su (created_at, id), dal più recente.
+
+    - ?after=<cursore>  → pagina successiva (ticket più vecchi)
+    - ?before=<cursore> → pagina precedente (ticket più recenti)
+
+    Niente OFFSET: ogni pagina è un range scan sull'indice
+    (created_at, id), quindi il costo non dipende dalla profondità.
+    """
+    queryset, after, before = _keyset(request, queryset)
+
+    # ✅ uno in più per sapere se esiste un'altra pagina
+    rows = list(queryset[:page_size + 1])
+
+    return _build_page(rows, after, before, page_size)
+
+
+async def apaginate_tickets(request, queryset, page_size=PAGE_SIZE):
+    """
+    Come paginate_tickets, per le view async (ORM async).
+    """
+    queryset, after, before = _keyset(request, queryset)
+
+    rows = [t async for t in queryset[:page_size + 1]]
+
+    return _build_page(rows, after, before, page_size)
+
+
+# ============================================================
+# ========================= RICERCA ==========================
+# ============================================================
+
+def _position(cursor):
+    try:
+        return max(int(cursor), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def paginate_search(request, query, tickets, page_size=PAGE_SIZE):
+    """
+    Risultati di una ricerca dal più rilevante, una pagina alla volta.
+
+    Il rank non è una chiave stabile come (created_at, id): qui il cursore
+    è la posizione nella classifica (?after= / ?before= = primo risultato
+    della pagina). La query FTS è già limitata ai `tickets` visibili e
+    filtrati, quindi ogni pagina è piena.
+    """
+    start = _position(request.GET.get("before") or request.GET.get("after"))
+
+    hits = search_tickets(query, scope=tickets, limit=page_size + 1, offset=start)
+    has_next = len(hits) > page_size
+    hits = hits[:page_size]
+
+    by_id = tickets.in_bulk([h.ticket_id for h in hits])
+    rows = []
+    for hit in hits:
+        ticket = by_id.get(hit.ticket_id)
+        if ticket:
+            ticket.search_snippet = hit.snippet
+            rows.append(ticket)
+
+    return KeysetPage(
+        rows,
+        next_cursor=str(start + page_size) if has_next else None,
+        previous_cursor=str(max(start - page_size, 0)) if start else None,
+    )
+
+
+# ============================================================
+# ========================== UTENTI ==========================
+# ============================================================
+
+# Utenti per pagina nella directory admin
+USER_PAGE_SIZE = 100
+
+
+def paginate_users(request, queryset, page_size=USER_PAGE_SIZE):
+    """
+    Paginazione keyset in ordine alfabetico sullo username (unico):
+    ?after=<username> / ?before=<username>, sull'indice UNIQUE.
+    """
+    after = request.GET.get("after") or None
+    before = request.GET.get("before") or None
+
+    if before:
+        queryset = queryset.filter(username__lt=before).order_by("-username")
+    else:
+        if after:
+            queryset = queryset.filter(username__gt=after)
+        queryset = queryset.order_by("username")
+
+    rows = list(queryset[:page_size + 1])
+
+    return _build_page(rows, after, before, page_size, cursor=lambda u: u.username)
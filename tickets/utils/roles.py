@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Prefetch
+
+
+# La cache dei ruoli va tenuta in una cache CONDIVISA tra i worker
+# (Redis, Memcached, database): l'invalidazione di m2m_changed cancella la
+# chiave solo nella cache configurata. Con la LocMemCache (una per
+# processo) gli altri worker non la vedrebbero, quindi lì la durata è
+# di pochi secondi.
+
+# Durata della cache condivisa dei ruoli (secondi)
+ROLE_CACHE_TIMEOUT = getattr(settings, "ROLE_CACHE_TIMEOUT", 300)
+
+# Durata con una cache per processo: un ruolo tolto vale ancora al
+# massimo per questo tempo sugli altri worker
+LOCAL_ROLE_CACHE_TIMEOUT = 5
+
+
+# Attributo con i gruppi precaricati da with_roles()
+ROLE_PREFETCH = "role_groups"
+
+
+def _cache_key(user_id):
+    return f"tickets:roles:{user_id}"
+
+
+def _timeout():
+    if isinstance(caches["default"], LocMemCache):
+        return LOCAL_ROLE_CACHE_TIMEOUT
+    return ROLE_CACHE_TIMEOUT
+
+
+def with_roles(queryset):
+    """
+    Gruppi di TUTTI gli utenti del queryset con una sola query (prefetch):
+    poi get_role_names / has_group non interrogano più DB né cache.
+    """
+    return queryset.prefetch_related(
+        Prefetch(
+            "groups",
+            queryset=Group.objects.only("id", "name").order_by("name"),
+            to_attr=ROLE_PREFETCH,
+        )
+    )
+
+
+def get_role_names(user):
+    """
+    Restituisce i nomi dei gruppi dell'utente come frozenset.
+
+    - Dentro la stessa richiesta il risultato resta memorizzato
+      sull'oggetto user (request.user), quindi la query parte una volta sola.
+    - Tra richieste diverse si passa dalla cache di Django, invalidata
+      da m2m_changed su User.groups (vedi signals.py).
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    names = getattr(user, "_role_names", None)
+    if names is not None:
+        return names
+
+    groups = getattr(user, ROLE_PREFETCH, None)
+    if groups is not None:
+        user._role_names = frozenset(g.name for g in groups)
+        return user._role_names
+
+    key = _cache_key(user.pk)
+    names = cache.get(key)
+
+    if names is None:
+        names = frozenset(user.groups.values_list("name", flat=True))
+        cache.set(key, names, _timeout())
+
+    user._role_names = names
+    return names
+
+
+async def aget_role_names(user):
+    """
+    Versione async di get_role_names, con la stessa memoria sull'utente:
+    dopo la chiamata has_role() non fa più query (utile nei template
+    renderizzati dalle view async).
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    names = getattr(user, "_role_names", None)
+    if names is not None:
+        return names
+
+    key = _cache_key(user.pk)
+    names = await cache.aget(key)
+
+    if names is None:
+        names = frozenset([n async for n in user.groups.values_list("name", flat=True)])
+        await cache.aset(key, names, _timeout())
+
+    user._role_names = names
+    return names
+
+
+def has_role(user, name):
+    return name in get_role_names(user)
+
+
+def invalidate_roles(user):
+    """
+    Svuota la cache dei ruoli di un utente (oggetto User o id).
+    """
+    user_id = getattr(user, "pk", user)
+    key = _cache_key(user_id)
+    cache.delete(key)
+
+    # ✅ di nuovo dopo il commit: una richiesta che nel frattempo ha letto
+    #    i gruppi vecchi (transazione non ancora confermata) li ha rimessi
+    #    in cache
+    transaction.on_commit(lambda: cache.delete(key))
+
+    if hasattr(user, "_role_names"):
+        del user._role_names
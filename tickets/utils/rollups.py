@@ -0,0 +1,205 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from tickets.models import ActivityRollup, AdminLog, RollupWatermark
+
+
+WATERMARK_NAME = "activity"
+
+# Righe di log aggregate per ogni giro del job
+BATCH_SIZE = 5000
+
+# I log più recenti di così non vengono ancora aggregati: le transazioni
+# ancora aperte potrebbero committare id più bassi del watermark.
+SAFETY_LAG = timedelta(minutes=2)
+
+# Azioni considerate "lavoro operativo" nel report
+REPORT_ACTIONS = [
+    "TICKET ASSIGNED CHANGE",
+    "TICKET STATUS CHANGE",
+    "TICKET CLOSED",
+]
+
+GRANULARITIES = {
+    "day": None,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+
+# ============================================================
+# ====================== JOB INCREMENTALE ====================
+# ============================================================
+
+def _add(day, actor_id, action, total):
+    bucket = ActivityRollup.objects.filter(day=day, actor_id=actor_id, action=action)
+
+    if bucket.update(count=F("count") + total):
+        return
+
+    try:
+        with transaction.atomic():
+            ActivityRollup.objects.create(day=day, actor_id=actor_id, action=action, count=total)
+    except IntegrityError:
+        bucket.update(count=F("count") + total)
+
+
+def run_rollup(batch_size=BATCH_SIZE):
+    """
+    Aggrega i log con id > watermark (e più vecchi di SAFETY_LAG).
+    Ogni lotto aggiorna rollup e watermark nella stessa transazione,
+    quindi un job interrotto riparte senza contare due volte.
+    Restituisce il numero di righe di log processate.
+    """
+    processed = 0
+
+    upper = AdminLog.objects.filter(
+        timestamp__lt=timezone.now() - SAFETY_LAG
+    ).aggregate(top=Max("id"))["top"]
+
+    if upper is None:
+        return 0
+
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+                name=WATERMARK_NAME
+            )
+
+            ids = list(
+                AdminLog.objects.filter(id__gt=watermark.last_id, id__lte=upper)
+                .order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            buckets = (
+                AdminLog.objects.filter(id__gte=ids[0], id__lte=ids[-1])
+                .annotate(day=TruncDate("timestamp"))
+                .values("day", "actor_id", "action")
+                .annotate(total=Count("id"))
+                .order_by()
+            )
+
+            for bucket in buckets:
+                _add(bucket["day"], bucket["actor_id"], bucket["action"], bucket["total"])
+
+            watermark.last_id = ids[-1]
+            watermark.save(update_fields=["last_id", "updated_at"])
+
+        processed += len(ids)
+
+    return processed
+
+
+def _archived_buckets():
+    """
+    Totali {(giorno, attore, azione): n} dei log già spostati negli archivi
+    (vedi archive_logs). Un lotto scritto ma non cancellato (crash prima del
+    DELETE) è ancora nella tabella: lo conta run_rollup, non l'archivio.
+    """
+    from tickets.utils.archive import iter_archived_logs
+
+    archived = list(iter_archived_logs())
+    still_hot = set()
+    ids = [log.id for log in archived]
+    for start in range(0, len(ids), BATCH_SIZE):
+        still_hot.update(
+            AdminLog.objects.filter(id__in=ids[start:start + BATCH_SIZE])
+            .values_list("id", flat=True)
+        )
+
+    # utenti eliminati dopo l'archiviazione: attore NULL, come SET_NULL
+    actors = {log.actor.id for log in archived if log.actor and log.actor.id}
+    actors = set(User.objects.filter(pk__in=actors).values_list("pk", flat=True))
+
+    buckets = Counter()
+    for log in archived:
+        if log.id in still_hot:
+            continue
+        actor_id = log.actor.id if log.actor and log.actor.id in actors else None
+        day = timezone.localtime(log.timestamp).date()   # come TruncDate
+        buckets[(day, actor_id, log.action)] += 1
+
+    return buckets
+
+
+def rebuild_rollups(batch_size=BATCH_SIZE):
+    """
+    Riparte da zero: i giorni già archiviati dai file d'archivio, poi tutta
+    la tabella dei log dal watermark azzerato.
+    Restituisce il numero di righe di log processate.
+    """
+    with transaction.atomic():
+        # ✅ lock sul watermark: archive_logs non sposta log durante la lettura
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+            name=WATERMARK_NAME
+        )
+
+        ActivityRollup.objects.all().delete()
+
+        buckets = _archived_buckets()
+        ActivityRollup.objects.bulk_create([
+            ActivityRollup(day=day, actor_id=actor_id, action=action, count=total)
+            for (day, actor_id, action), total in buckets.items()
+        ])
+
+        watermark.last_id = 0
+        watermark.save(update_fields=["last_id", "updated_at"])
+
+    return sum(buckets.values()) + run_rollup(batch_size=batch_size)
+
+
+# ============================================================
+# ========================= LETTURA ==========================
+# ============================================================
+
+def operator_activity(start=None, end=None, operator_id=None, action_text=None):
+    """
+    Rollup del lavoro operativo degli operatori nel range [start, end) di date.
+    """
+    rows = ActivityRollup.objects.filter(
+        actor__groups__name="operator",
+        action__in=REPORT_ACTIONS,
+    )
+
+    if start:
+        rows = rows.filter(day__gte=start)
+    if end:
+        rows = rows.filter(day__lt=end)
+    if operator_id:
+        rows = rows.filter(actor_id=operator_id)
+    if action_text:
+        rows = rows.filter(action__icontains=action_text)
+
+    return rows
+
+
+def histogram(rows, field):
+    """
+    [(valore, totale)] ordinati per totale decrescente.
+    """
+    stats = rows.values(field).annotate(total=Sum("count")).order_by("-total")
+    return [(x[field], x["total"]) for x in stats]
+
+
+def timeline(rows, granularity="day"):
+    """
+    Serie temporale dei totali per giorno, settimana o mese.
+    """
+    trunc = GRANULARITIES.get(granularity)
+    period = trunc("day") if trunc else F("day")
+
+    stats = (
+        rows.annotate(period=period)
+        .values("period")
+        .annotate(total=Sum("count"))
+        .order_by("period")
+    )
+    return [(x["period"], x["total"]) for x in stats]
@@ -0,0 +1,338 @@
+import re
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Concat
+from django.utils.html import escape
+
+from tickets.models import Ticket, Message, TicketSearchDocument
+
+
+# Risultati restituiti da search_tickets se non indicato (le liste
+# chiedono una pagina alla volta, vedi paginate_search)
+SEARCH_LIMIT = 200
+
+# Marcatori interni per le parti evidenziate, sostituiti da <mark> dopo l'escape
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class SearchHit:
+    ticket_id: int
+    rank: float
+    snippet: str
+
+
+# ============================================================
+# ==================== MANUTENZIONE INDICE ===================
+# ============================================================
+
+def build_body(ticket):
+    texts = [ticket.description]
+    texts += list(
+        Message.objects.filter(ticket_id=ticket.pk)
+        .order_by("created_at", "id")
+        .values_list("text", flat=True)
+    )
+    return "\n".join(texts)
+
+
+def index_ticket(ticket):
+    """
+    (Ri)costruisce il documento di ricerca di un ticket.
+    I trigger / indici del backend si aggiornano da soli.
+    """
+    TicketSearchDocument.objects.update_or_create(
+        ticket_id=ticket.pk,
+        defaults={"title": ticket.title, "body": build_body(ticket)},
+    )
+
+
+def refresh_body(ticket_id):
+    """
+    Ricalcola il testo di un documento già esistente (es. messaggio
+    eliminato). Non crea documenti: durante la cancellazione a cascata
+    di un ticket il documento potrebbe essere già stato rimosso.
+    """
+    ticket = Ticket.objects.filter(pk=ticket_id).only("description").first()
+    if ticket is None:
+        return
+
+    TicketSearchDocument.objects.filter(ticket_id=ticket_id).update(
+        body=build_body(ticket)
+    )
+
+
+def index_message(message):
+    """
+    Nuovo messaggio: accoda il testo al documento senza rileggere
+    tutta la chat. Se il documento non esiste ancora lo ricostruisce.
+    """
+    updated = TicketSearchDocument.objects.filter(ticket_id=message.ticket_id).update(
+        body=Concat(F("body"), Value("\n"), Value(message.text))
+    )
+
+    if not updated:
+        index_ticket(message.ticket)
+
+
+def rebuild_index(batch_size=500, stdout=None):
+    """
+    Ricostruisce da zero tutti i documenti (backfill).
+    """
+    TicketSearchDocument.objects.all().delete()
+
+    total = 0
+    batch = []
+    tickets = Ticket.objects.only("id", "title", "description").order_by("id")
+
+    for ticket in tickets.iterator(chunk_size=batch_size):
+        batch.append(ticket)
+
+        if len(batch) >= batch_size:
+            total += index_tickets(batch)
+            batch = []
+            if stdout:
+                stdout.write(f"Indicizzati {total} ticket")
+
+    if batch:
+        total += index_tickets(batch)
+
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO tickets_search_fts(tickets_search_fts) VALUES ('rebuild')"
+            )
+
+    return total
+
+
+def index_tickets(tickets):
+    """
+    Documenti di ticket nuovi, con i loro messaggi, in un solo bulk_create
+    (backfill e import_tickets).
+    """
+    bodies = {t.pk: [t.description] for t in tickets}
+
+    messages = (
+        Message.objects.filter(ticket_id__in=bodies)
+        .order_by("ticket_id", "created_at", "id")
+        .values_list("ticket_id", "text")
+    )
+    for ticket_id, text in messages:
+        bodies[ticket_id].append(text)
+
+    TicketSearchDocument.objects.bulk_create([
+        TicketSearchDocument(ticket_id=t.pk, title=t.title, body="\n".join(bodies[t.pk]))
+        for t in tickets
+    ])
+
+    return len(tickets)
+
+
+# ============================================================
+# ========================= RICERCA ==========================
+# ============================================================
+
+# La ricerca lavora SEMPRE dentro un ambito (queryset di ticket già
+# ristretto per visibilità e filtri): l'ambito entra nella query FTS come
+# "id IN (...)" prima di ORDER BY / LIMIT. Così un cliente non perde i
+# propri risultati dietro a quelli (più rilevanti) di altri utenti.
+
+def _terms(query):
+    return WORD_RE.findall(query or "")
+
+
+def _fts_match(terms):
+    # ogni parola tra virgolette: niente errori di sintassi FTS5
+    return " ".join('"%s"' % t for t in terms)
+
+
+def matching_tickets(query):
+    """
+    Sottoquery con gli id di TUTTI i ticket che corrispondono alla ricerca,
+    per filter(id__in=...): nessun limite, l'ambito lo decide la query
+    esterna (liste, totali, export). None se la ricerca è vuota.
+    """
+    terms = _terms(query)
+    if not terms:
+        return None
+
+    if connection.vendor == "sqlite":
+        return RawSQL(
+            "SELECT rowid FROM tickets_search_fts WHERE tickets_search_fts MATCH %s",
+            [_fts_match(terms)],
+        )
+
+    if connection.vendor == "postgresql":
+        return RawSQL(
+            "SELECT ticket_id FROM tickets_ticketsearchdocument "
+            "WHERE to_tsvector('simple', title || ' ' || body) "
+            "@@ websearch_to_tsquery('simple', %s)",
+            [query],
+        )
+
+    if connection.vendor == "mysql":
+        return RawSQL(
+            "SELECT ticket_id FROM tickets_ticketsearchdocument "
+            "WHERE MATCH(title, body) AGAINST (%s IN NATURAL LANGUAGE MODE)",
+            [query],
+        )
+
+    return _fallback_documents(terms).values("ticket_id")
+
+
+def search_tickets(query, scope=None, limit=SEARCH_LIMIT, offset=0):
+    """
+    Ricerca full-text su titolo, descrizione e messaggi, limitata ai ticket
+    di `scope` (queryset; None = tutti). Restituisce una lista di
+    SearchHit dal più rilevante: `limit` risultati a partire da `offset`.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    backend = {
+        "sqlite": _search_sqlite,
+        "postgresql": _search_postgresql,
+        "mysql": _search_mysql,
+    }.get(connection.vendor, _search_fallback)
+
+    return backend(query, terms, scope, limit, offset)
+
+
+def _scope_sql(scope, column):
+    """
+    "AND <column> IN (SELECT id FROM ... ambito ...)" e i suoi parametri.
+    """
+    if scope is None:
+        return "", []
+
+    sql, params = scope.order_by().values("id").query.sql_with_params()
+    return f"AND {column} IN ({sql})", list(params)
+
+
+def _search_sqlite(query, terms, scope, limit, offset):
+    scope_sql, scope_params = _scope_sql(scope, "rowid")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT rowid, bm25(tickets_search_fts),
+                   snippet(tickets_search_fts, -1, %s, %s, '…', 16)
+            FROM tickets_search_fts
+            WHERE tickets_search_fts MATCH %s {scope_sql}
+            ORDER BY bm25(tickets_search_fts), rowid
+            LIMIT %s OFFSET %s
+            """,
+            [MARK_START, MARK_END, _fts_match(terms), *scope_params, limit, offset],
+        )
+        # bm25: più basso = più rilevante
+        return [
+            SearchHit(ticket_id, -rank, _render_snippet(snippet))
+            for ticket_id, rank, snippet in cursor.fetchall()
+        ]
+
+
+def _search_postgresql(query, terms, scope, limit, offset):
+    scope_sql, scope_params = _scope_sql(scope, "d.ticket_id")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT d.ticket_id,
+                   ts_rank(to_tsvector('simple', d.title || ' ' || d.body), q),
+                   ts_headline('simple', d.title || ' ' || d.body, q, %s)
+            FROM tickets_ticketsearchdocument d,
+                 websearch_to_tsquery('simple', %s) q
+            WHERE to_tsvector('simple', d.title || ' ' || d.body) @@ q {scope_sql}
+            ORDER BY 2 DESC, d.ticket_id
+            LIMIT %s OFFSET %s
+            """,
+            [f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=30, MinWords=10",
+             query, *scope_params, limit, offset],
+        )
+        return [
+            SearchHit(ticket_id, rank, _render_snippet(snippet))
+            for ticket_id, rank, snippet in cursor.fetchall()
+        ]
+
+
+def _search_mysql(query, terms, scope, limit, offset):
+    scope_sql, scope_params = _scope_sql(scope, "ticket_id")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT ticket_id,
+                   MATCH(title, body) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score,
+                   title, body
+            FROM tickets_ticketsearchdocument
+            WHERE MATCH(title, body) AGAINST (%s IN NATURAL LANGUAGE MODE) {scope_sql}
+            ORDER BY score DESC, ticket_id
+            LIMIT %s OFFSET %s
+            """,
+            [query, query, *scope_params, limit, offset],
+        )
+        # MySQL non ha un equivalente di snippet()/ts_headline
+        return [
+            SearchHit(ticket_id, score, make_snippet(f"{title}\n{body}", terms))
+            for ticket_id, score, title, body in cursor.fetchall()
+        ]
+
+
+def _fallback_documents(terms):
+    docs = TicketSearchDocument.objects.all()
+    for term in terms:
+        docs = docs.filter(Q(title__icontains=term) | Q(body__icontains=term))
+    return docs
+
+
+def _search_fallback(query, terms, scope, limit, offset):
+    docs = _fallback_documents(terms).order_by("ticket_id")
+    if scope is not None:
+        docs = docs.filter(ticket_id__in=scope.order_by().values("id"))
+
+    return [
+        SearchHit(doc.ticket_id, 0.0, make_snippet(f"{doc.title}\n{doc.body}", terms))
+        for doc in docs[offset:offset + limit]
+    ]
+
+
+# ============================================================
+# ========================= SNIPPET ==========================
+# ============================================================
+
+def make_snippet(text, terms, width=160):
+    """
+    Estratto di testo attorno alla prima parola trovata, con i termini marcati.
+    """
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    found = pattern.search(text)
+
+    start = max(found.start() - width // 3, 0) if found else 0
+    excerpt = text[start:start + width]
+
+    excerpt = pattern.sub(lambda m: f"{MARK_START}{m.group(0)}{MARK_END}", excerpt)
+    if start > 0:
+        excerpt = "…" + excerpt
+    if start + width < len(text):
+        excerpt += "…"
+
+    return _render_snippet(excerpt)
+
+
+def _render_snippet(snippet):
+    """
+    Escape HTML del testo utente, poi i marcatori diventano <mark>.
+    """
+    return (
+        escape(snippet or "")
+        .replace(MARK_START, "<mark>")
+        .replace(MARK_END, "</mark>")
+    )
@@ -0,0 +1,177 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+from tickets.models import Ticket, TicketCounter
+
+
+# Parametri GET che rendono "filtrata" una lista (vedi apply_ticket_filters)
+FILTER_PARAMS = ("priority", "status", "user", "title", "date_from", "date_to", "q")
+
+
+def _assignee_key(assigned_to_id):
+    return str(assigned_to_id) if assigned_to_id else ""
+
+
+def _contributions(status, priority, assigned_to_id):
+    """
+    Le righe dei contatori a cui contribuisce un ticket con questi valori.
+    """
+    rows = [("status", status), ("priority", priority)]
+
+    # il carico di un operatore conta solo i ticket non chiusi
+    if status != "closed":
+        rows.append(("assignee", _assignee_key(assigned_to_id)))
+
+    return rows
+
+
+def _bump(dimension, key, delta):
+    updated = TicketCounter.objects.filter(dimension=dimension, key=key).update(
+        count=F("count") + delta
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            TicketCounter.objects.create(dimension=dimension, key=key, count=delta)
+    except IntegrityError:
+        # creata nel frattempo da un'altra transazione
+        TicketCounter.objects.filter(dimension=dimension, key=key).update(
+            count=F("count") + delta
+        )
+
+
+def apply_ticket_change(old=None, new=None):
+    """
+    Aggiorna i contatori per un ticket passato da `old` a `new`
+    (tuple status, priority, assigned_to_id; None = non esiste).
+    Va chiamata dentro la stessa transazione del salvataggio.
+    """
+    delta = Counter()
+
+    if old:
+        delta.subtract(_contributions(*old))
+    if new:
+        delta.update(_contributions(*new))
+
+    _apply(delta)
+
+
+def apply_ticket_changes(changes):
+    """
+    Contatori per molti ticket cambiati da un UPDATE in blocco (senza save()):
+    coppie (old, new) come apply_ticket_change, un UPDATE per contatore.
+    """
+    delta = Counter()
+
+    for old, new in changes:
+        delta.subtract(_contributions(*old))
+        delta.update(_contributions(*new))
+
+    _apply(delta)
+
+
+def apply_ticket_inserts(states):
+    """
+    Contatori per molti ticket nuovi insieme (import in blocco):
+    un UPDATE per contatore toccato, non uno per ticket.
+    """
+    delta = Counter()
+
+    for state in states:
+        delta.update(_contributions(*state))
+
+    _apply(delta)
+
+
+def _apply(delta):
+    changes = sorted((row, value) for row, value in delta.items() if value)
+    if not changes:
+        return
+
+    with transaction.atomic():
+        for (dimension, key), value in changes:
+            _bump(dimension, key, value)
+
+
+def ticket_state(ticket):
+    return ticket.status, ticket.priority, ticket.assigned_to_id
+
+
+# ============================================================
+# ========================= LETTURA ==========================
+# ============================================================
+
+def get_counters(dimension):
+    """
+    {key: count} per una dimensione: una sola SELECT su una tabella minuscola.
+    """
+    return dict(
+        TicketCounter.objects.filter(dimension=dimension).values_list("key", "count")
+    )
+
+
+def operator_counters(user):
+    """
+    Contatori delle pagine operatore: ticket non assegnati e carico personale.
+    """
+    workload = dict(
+        TicketCounter.objects.filter(
+            dimension="assignee", key__in=["", _assignee_key(user.pk)]
+        ).values_list("key", "count")
+    )
+
+    return {
+        "unassigned": workload.get("", 0),
+        "mine": workload.get(_assignee_key(user.pk), 0),
+    }
+
+
+def has_active_filters(request):
+    return any(request.GET.get(name) for name in FILTER_PARAMS)
+
+
+def status_totals(queryset):
+    """
+    Totali per stato di un queryset filtrato con UNA query
+    (aggregazione condizionale) invece di tre count().
+    """
+    return queryset.aggregate(
+        open=Count("id", filter=Q(status="open")),
+        in_progress=Count("id", filter=Q(status="in_progress")),
+        closed=Count("id", filter=Q(status="closed")),
+    )
+
+
+# ============================================================
+# ======================= RICONCILIAZIONE ====================
+# ============================================================
+
+def reconcile_counters():
+    """
+    Ricalcola da zero tutti i contatori dalla tabella Ticket.
+    """
+    rows = Counter()
+
+    for dimension, field in (("status", "status"), ("priority", "priority")):
+        for item in Ticket.objects.values(field).annotate(total=Count("id")).order_by():
+            rows[(dimension, item[field])] += item["total"]
+
+    active = (
+        Ticket.objects.exclude(status="closed")
+        .values("assigned_to_id").annotate(total=Count("id")).order_by()
+    )
+    for item in active:
+        rows[("assignee", _assignee_key(item["assigned_to_id"]))] += item["total"]
+
+    with transaction.atomic():
+        TicketCounter.objects.all().delete()
+        TicketCounter.objects.bulk_create([
+            TicketCounter(dimension=dimension, key=key, count=count)
+            for (dimension, key), count in sorted(rows.items())
+        ])
+
+    return rows
@@ -0,0 +1,324 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from tickets.models import StoredBlob, TicketAttachment
+
+
+# Sottocartella di SECURE_UPLOAD_ROOT per i contenuti deduplicati
+CAS_DIR = "cas"
+
+CHUNK_SIZE = 64 * 1024
+
+# Età minima (secondi) di un file senza riga prima di considerarlo orfano:
+# protegge gli upload con la transazione ancora aperta
+ORPHAN_GRACE = getattr(settings, "CAS_ORPHAN_GRACE", 24 * 3600)
+
+
+# ============================================================
+# =========================== PATH ===========================
+# ============================================================
+
+def blob_relative_path(sha256):
+    """
+    cas/ab/cd/abcd... → due livelli di cartelle per non avere
+    centinaia di migliaia di file nella stessa directory.
+    """
+    return os.path.join(CAS_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def absolute_path(relative_path):
+    return os.path.join(settings.SECURE_UPLOAD_ROOT, relative_path)
+
+
+def attachment_path(attachment):
+    """
+    Path assoluto del contenuto di un allegato. file_path è relativo:
+    cas/ab/cd/<sha256> oppure, per i file legacy, ticket_<id>/<nome>.
+    """
+    return absolute_path(attachment.file_path)
+
+
+# ============================================================
+# ========================= SCRITTURA ========================
+# ============================================================
+
+def _hash_to_temp(chunks):
+    """
+    Scrive i chunk in un file temporaneo calcolando lo SHA-256 mentre
+    scorrono: il file non viene mai riletto per l'hash.
+    """
+    tmp_dir = absolute_path(os.path.join(CAS_DIR, "tmp"))
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as dest:
+            for chunk in chunks:
+                digest.update(chunk)
+                dest.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return tmp_path, digest.hexdigest(), size
+
+
+def _acquire(sha256, size):
+    """
+    +1 riferimenti al blob, creandolo se non esiste.
+    La riga resta bloccata fino al commit: release() e collect_blob()
+    sullo stesso contenuto aspettano che l'upload sia concluso.
+    """
+    blob = StoredBlob.objects.select_for_update().filter(sha256=sha256).first()
+
+    if blob is None:
+        try:
+            with transaction.atomic():
+                return StoredBlob.objects.create(sha256=sha256, size=size, ref_count=1)
+        except IntegrityError:
+            # creato nel frattempo da un upload concorrente (ora committato)
+            blob = StoredBlob.objects.select_for_update().get(sha256=sha256)
+
+    StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1)
+    blob.ref_count += 1
+    return blob
+
+
+def _place(tmp_path, sha256):
+    """
+    Mette il contenuto al suo posto nel CAS (il file può mancare anche se
+    la riga esiste: collect_blob interrotto). Chiamata con la riga bloccata.
+    """
+    final_path = absolute_path(blob_relative_path(sha256))
+
+    if os.path.exists(final_path):
+        # ✅ mtime aggiornato: sweep_orphans non tocca i file appena usati
+        os.utime(final_path)
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+
+
+def store_chunks(chunks):
+    """
+    Salva un contenuto nello storage deduplicato e restituisce il
+    StoredBlob con un riferimento in più. Contenuti identici → un solo file.
+
+    Va chiamata dentro la transazione che crea l'allegato: se questa fa
+    rollback il file resta senza riga e lo rimuove sweep_orphans.
+    """
+    tmp_path, sha256, size = _hash_to_temp(chunks)
+
+    try:
+        with transaction.atomic():
+            blob = _acquire(sha256, size)
+            _place(tmp_path, sha256)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return blob
+
+
+def store_upload(uploaded_file):
+    return store_chunks(uploaded_file.chunks(CHUNK_SIZE))
+
+
+def store_file(path):
+    """
+    Come store_upload, ma per un file già su disco (migrazione legacy).
+    """
+    with open(path, "rb") as f:
+        return store_chunks(iter(lambda: f.read(CHUNK_SIZE), b""))
+
+
+# ============================================================
+# ======================= RILASCIO ===========================
+# ============================================================
+
+def release(blob_id):
+    """
+    -1 riferimenti. A zero il blob viene raccolto dopo il commit
+    (mai prima: un rollback lo renderebbe orfano di file).
+    """
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+
+        if blob.ref_count > 0:
+            StoredBlob.objects.filter(pk=blob_id).update(ref_count=F("ref_count") - 1)
+
+        if blob.ref_count <= 1:
+            sha256 = blob.sha256
+            transaction.on_commit(lambda: collect_blob(sha256))
+
+
+def collect_blob(sha256):
+    """
+    Cancella riga e file di un blob senza riferimenti.
+    Con la riga bloccata: un upload dello stesso contenuto aspetta e, se
+    arriva prima, il ref_count non è più zero e il blob resta.
+    """
+    with transaction.atomic():
+        blob = (
+            StoredBlob.objects.select_for_update()
+            .filter(sha256=sha256, ref_count=0)
+            .first()
+        )
+        if blob is None:
+            return False
+
+        path = absolute_path(blob_relative_path(sha256))
+        if os.path.exists(path):
+            os.remove(path)
+
+        blob.delete()
+
+    return True
+
+
+def remove_legacy_file(relative_path):
+    """
+    Rimozione (dopo il commit) di un file legacy ticket_<id>/<nome>.
+    """
+    path = absolute_path(relative_path)
+
+    def remove():
+        if os.path.exists(path):
+            os.remove(path)
+
+    transaction.on_commit(remove)
+
+
+# ============================================================
+# ========================== PULIZIA =========================
+# ============================================================
+
+def _old_files(directory, cutoff):
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    yield name, path
+            except FileNotFoundError:
+                continue
+
+
+def sweep_orphans(grace=ORPHAN_GRACE):
+    """
+    Rimuove ciò che release() non ha potuto raccogliere:
+    - blob a zero riferimenti (processo morto prima dell'on_commit);
+    - file del CAS senza riga (upload finito in rollback);
+    - temporanei di upload interrotti.
+    I file più recenti di `grace` secondi non vengono toccati.
+    Restituisce (blob raccolti, file rimossi).
+    """
+    collected = sum(
+        collect_blob(sha256)
+        for sha256 in StoredBlob.objects.filter(ref_count=0).values_list("sha256", flat=True)
+    )
+
+    cutoff = time.time() - grace
+    root = absolute_path(CAS_DIR)
+    tmp_dir = os.path.join(root, "tmp")
+    removed = 0
+
+    for _, path in _old_files(tmp_dir, cutoff):
+        os.remove(path)
+        removed += 1
+
+    candidates = {}
+    for name, path in _old_files(root, cutoff):
+        if not path.startswith(tmp_dir + os.sep):
+            candidates[name] = path
+
+    names = list(candidates)
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        known = set(
+            StoredBlob.objects.filter(sha256__in=chunk).values_list("sha256", flat=True)
+        )
+
+        for name in chunk:
+            if name in known:
+                continue
+
+            # ✅ riga bloccata come in _acquire: se un upload l'ha appena
+            #    creata il file resta
+            with transaction.atomic():
+                if StoredBlob.objects.select_for_update().filter(sha256=name).exists():
+                    continue
+                if os.path.exists(candidates[name]):
+                    os.remove(candidates[name])
+                    removed += 1
+
+    return collected, removed
+
+
+# ============================================================
+# ==================== MIGRAZIONE LEGACY =====================
+# ============================================================
+
+def migrate_legacy_attachments(stdout=None):
+    """
+    Sposta nello storage deduplicato i file ticket_<id>/<nome>.
+    Più allegati possono puntare allo stesso file legacy (upload con lo
+    stesso nome si sovrascrivevano): vengono migrati insieme, un
+    riferimento ciascuno. Restituisce (migrati, file mancanti).
+    """
+    migrated = 0
+    missing = []
+
+    legacy_paths = (
+        TicketAttachment.objects.filter(blob__isnull=True)
+        .order_by("file_path")
+        .values_list("file_path", flat=True)
+        .distinct()
+    )
+
+    for relative_path in list(legacy_paths):
+        path = absolute_path(relative_path)
+        if not os.path.exists(path):
+            missing.append(relative_path)
+            continue
+
+        with transaction.atomic():
+            attachments = list(
+                TicketAttachment.objects.select_for_update()
+                .filter(blob__isnull=True, file_path=relative_path)
+            )
+            if not attachments:
+                continue
+
+            blob = store_file(path)
+            for extra in attachments[1:]:
+                _acquire(blob.sha256, blob.size)
+
+            TicketAttachment.objects.filter(
+                pk__in=[a.pk for a in attachments]
+            ).update(
+                blob=blob,
+                file_path=blob_relative_path(blob.sha256),
+                file_size=blob.size,
+            )
+
+            remove_legacy_file(relative_path)
+
+        migrated += len(attachments)
+        if stdout:
+            stdout.write(f"Migrati {migrated} allegati")
+
+    return migrated, missing
@@ -0,0 +1,226 @@
+import importlib.util
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+
+from tickets.models import StoredBlob, TicketAttachment
+from tickets.utils.downloads import serve_file
+from tickets.utils.imaging import render_thumbnail
+from tickets.utils.storage import absolute_path
+
+
+logger = logging.getLogger(__name__)
+
+# Lato massimo (px) di ogni formato disponibile con ?size=
+THUMBNAIL_SIZES = {
+    "sm": 160,
+    "md": 480,
+    "lg": 1024,
+}
+
+# Processi dedicati alla generazione (fuori dal ciclo della richiesta)
+WORKERS = getattr(settings, "THUMBNAIL_WORKERS", 2)
+
+# Sottocartella di SECURE_UPLOAD_ROOT per le miniature
+THUMB_DIR = "thumbs"
+
+IMAGE_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+}
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+# ============================================================
+# =========================== PATH ===========================
+# ============================================================
+
+def is_image(attachment):
+    return os.path.splitext(attachment.file_name)[1].lower() in IMAGE_TYPES
+
+
+def thumbnail_key(attachment):
+    """
+    Allegati deduplicati: lo SHA-256, così contenuti identici condividono
+    anche le miniature. File legacy: l'id dell'allegato.
+    """
+    if attachment.blob_id:
+        return os.path.basename(attachment.file_path)
+    return f"attachment-{attachment.pk}"
+
+
+def _extension(attachment):
+    # PNG resta PNG (trasparenze, screenshot), il resto diventa JPEG
+    ext = os.path.splitext(attachment.file_name)[1].lower()
+    return ".png" if ext == ".png" else ".jpg"
+
+
+def thumbnail_relative_path(attachment, size, key=None):
+    key = key or thumbnail_key(attachment)
+    return os.path.join(THUMB_DIR, size, key[:2], key + _extension(attachment))
+
+
+# ============================================================
+# ======================== GENERAZIONE =======================
+# ============================================================
+
+def available():
+    return importlib.util.find_spec("PIL") is not None
+
+
+def _pool():
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            # spawn: i figli non ereditano connessioni DB o thread del server
+            _executor = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _done(dest):
+    def callback(future):
+        with _lock:
+            _pending.pop(dest, None)
+
+        if future.exception():
+            logger.warning("Miniatura non generata (%s): %s", dest, future.exception())
+
+    return callback
+
+
+def schedule_thumbnails(attachment, sizes=None, force=False):
+    """
+    Accoda al pool le miniature mancanti di un'immagine.
+    Restituisce i future (già in corso o nuovi).
+    """
+    if not is_image(attachment) or not available():
+        return []
+
+    source = absolute_path(attachment.file_path)
+    futures = []
+
+    for size in sizes or THUMBNAIL_SIZES:
+        dest = absolute_path(thumbnail_relative_path(attachment, size))
+
+        if os.path.exists(dest) and not force:
+            continue
+
+        with _lock:
+            future = _pending.get(dest)
+
+        if future is None:
+            future = _pool().submit(render_thumbnail, source, dest, THUMBNAIL_SIZES[size])
+            with _lock:
+                _pending[dest] = future
+            future.add_done_callback(_done(dest))
+
+        futures.append(future)
+
+    return futures
+
+
+def backfill_thumbnails(sizes=None, force=False, batch_size=200, stdout=None):
+    """
+    Genera le miniature delle immagini già caricate.
+    Restituisce (generate, fallite).
+    """
+    done, failed = 0, 0
+    seen = set()
+    futures = []
+
+    attachments = TicketAttachment.objects.order_by("id")
+
+    for attachment in attachments.iterator(chunk_size=batch_size):
+        key = thumbnail_key(attachment)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        futures += schedule_thumbnails(attachment, sizes=sizes, force=force)
+
+        if len(futures) >= batch_size:
+            ok, ko = _collect(futures)
+            done, failed = done + ok, failed + ko
+            futures = []
+            if stdout:
+                stdout.write(f"Miniature generate: {done}")
+
+    ok, ko = _collect(futures)
+    return done + ok, failed + ko
+
+
+def _collect(futures):
+    wait(futures)
+    failed = sum(1 for f in futures if f.exception())
+    return len(futures) - failed, failed
+
+
+# ============================================================
+# ======================= INVIO / PULIZIA ====================
+# ============================================================
+
+def serve_thumbnail(request, attachment, size, async_stream=False):
+    """
+    Risposta con la miniatura richiesta, oppure None se l'allegato non è
+    un'immagine o la miniatura non è ancora pronta (viene accodata).
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise Http404("Formato anteprima non valido")
+
+    if not is_image(attachment):
+        return None
+
+    relative_path = thumbnail_relative_path(attachment, size)
+
+    if not os.path.exists(absolute_path(relative_path)):
+        schedule_thumbnails(attachment, sizes=[size])
+        return None
+
+    key = thumbnail_key(attachment)
+    ext = _extension(attachment)
+    base_name = os.path.splitext(attachment.file_name)[0]
+
+    return serve_file(
+        request,
+        relative_path,
+        filename=f"{base_name}-{size}{ext}",
+        content_type=IMAGE_TYPES[ext],
+        etag=f'"{key}-{size}"' if attachment.blob_id else None,
+        async_stream=async_stream,
+    )
+
+
+def discard_thumbnails(attachment):
+    """
+    Allegato eliminato: dopo il commit rimuove le sue miniature,
+    a meno che lo stesso contenuto sia ancora usato da altri allegati.
+    """
+    key = thumbnail_key(attachment)
+    paths = [
+        absolute_path(thumbnail_relative_path(attachment, size, key))
+        for size in THUMBNAIL_SIZES
+    ]
+
+    def remove():
+        if attachment.blob_id and StoredBlob.objects.filter(sha256=key).exists():
+            return
+
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    transaction.on_commit(remove)
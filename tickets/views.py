@@ -3,16 +3,42 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import Group, User
 from django.contrib import messages
-from django.db.models import Q 
-from .models import Ticket, Message, AdminLog, TicketAttachment
-from django.http import FileResponse, Http404
+from django.db.models import Q, Exists, OuterRef, ExpressionWrapper, BooleanField
+from .models import Ticket, Message, AdminLog, TicketAttachment, VERSION_CONFLICT_MESSAGE, VersionConflict
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django.conf import settings
 from .forms import TicketForm, MessageForm, CustomRegisterForm
+from .utils.pagination import apaginate_tickets, paginate_search, paginate_tickets, paginate_users
+from .utils.filters import filter_admin_logs, filter_tickets, filter_users_by_prefix, log_filters
+from .utils.exports import FORMATS as EXPORT_FORMATS, export_logs, export_response, export_tickets
+from .utils.dates import day_end, day_start, month_range
+from .utils.archive import archive_covers, iter_archived_logs, READ_LIMIT as ARCHIVE_READ_LIMIT
+from .utils.stats import get_counters, has_active_filters, operator_counters, status_totals
+from .utils.roles import ROLE_PREFETCH, aget_role_names, has_role, invalidate_roles, with_roles
+from .utils.audit import log_change
+from .utils.assignment import ORDERS as ASSIGN_ORDERS, claim_next, claim_ticket, send_assignment_email
+from .utils.storage import blob_relative_path, store_upload
+from .utils.downloads import is_asgi, serve_attachment
+from .utils.thumbnails import schedule_thumbnails, serve_thumbnail
+from .utils.fragments import arender_fragment, arender_rows, render_rows
+from .utils.conditional import (
+    detail_validators, not_modified, page_validators, set_validators,
+    with_detail_state,
+)
+from .utils.live import (
+    HEARTBEAT_SECONDS, MAX_STREAM_SECONDS, OVERFLOW,
+    attachment_event, format_sse, get_hub, is_staff_side, message_event, parse_cursor,
+    ticket_channel,
+)
+from asgiref.sync import sync_to_async
+from django.db import transaction
 from django.utils.timezone import now
-from django.db.models import Count
+from django.db.models import Count, Max
 
 
-import logging, mimetypes, os, json, datetime    
+import asyncio, logging, mimetypes, os, json, datetime    
+from itertools import islice
 
 ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
 
@@ -22,47 +48,145 @@ admin_logger = logging.getLogger("admin_actions")
 # Funzione per i filtri
 
 def apply_ticket_filters(request, queryset):
-    priority = request.GET.getlist("priority")
-    status = request.GET.getlist("status")
-    user = request.GET.get("user")
-    title = request.GET.get("title")
-    date_from = request.GET.get("date_from")
-    date_to = request.GET.get("date_to")
+    # ✅ stessi filtri di export e comandi (utils/filters.py)
+    return filter_tickets(queryset, request.GET)
+
 
-    if priority:
-        queryset = queryset.filter(priority__in=priority)
+def ticket_page(request, tickets):
+    """
+    Pagina di ticket da mostrare nelle liste:
+    - con una ricerca attiva → risultati ordinati per rilevanza + snippet;
+    - altrimenti → paginazione keyset su (created_at, id).
+    """
+    tickets = tickets.select_related("created_by", "assigned_to")
 
-    if status:
-        queryset = queryset.filter(status__in=status)
+    query = request.GET.get("q", "").strip()
+    if query:
+        return paginate_search(request, query, tickets)
 
-    if user:
-        queryset = queryset.filter(created_by__id=user)
+    return paginate_tickets(request, tickets)
 
-    if title:
-        queryset = queryset.filter(title__icontains=title)
 
-    if date_from:
-        queryset = queryset.filter(created_at__date__gte=date_from)
+async def aticket_page(request, tickets):
+    """
+    Come ticket_page, per le view async (la ricerca usa un cursore raw,
+    sincrono: gira in un thread).
+    """
+    tickets = tickets.select_related("created_by", "assigned_to")
 
-    if date_to:
-        queryset = queryset.filter(created_at__date__lte=date_to)
+    query = request.GET.get("q", "").strip()
+    if query:
+        return await sync_to_async(paginate_search)(request, query, tickets)
 
-    return queryset
+    return await apaginate_tickets(request, tickets)
 
 
 # =========================================================
 #                   HELPER PER I RUOLI
 # =========================================================
 
+# I ruoli vengono letti una volta per richiesta e poi serviti dalla
+# memoria (vedi utils/roles.py), anche se questi helper sono chiamati
+# più volte da user_passes_test, dalle view e dai template.
+
 def is_operator_or_admin(user):
     return is_operator(user) or is_admin(user)
 
 
 def is_operator(user):
-    return user.groups.filter(name="operator").exists()
+    return has_role(user, "operator")
 
 def is_admin(user):
-    return user.is_superuser or user.is_staff or user.groups.filter(name="admin").exists()
+    return user.is_superuser or user.is_staff or has_role(user, "admin")
+
+
+async def async_user(request):
+    """
+    View async: utente e ruoli caricati con l'ORM async PRIMA del render.
+    request.user diventa l'oggetto già risolto, così template, has_group
+    e is_operator/is_admin non fanno query dentro l'event loop.
+    """
+    user = await request.auser()
+    await aget_role_names(user)
+    request.user = user
+    return user
+
+
+# =========================================================
+#                AUTOCOMPLETE UTENTI / OPERATORI
+# =========================================================
+
+AUTOCOMPLETE_LIMIT = 20
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+
+def _selected_user_id(request):
+    value = request.GET.get("user", "")
+    return int(value) if value.isdigit() else None
+
+
+def selected_user(request):
+    """
+    Utente scelto nel filtro "Creato da": solo quello, per riempire il campo.
+    """
+    user_id = _selected_user_id(request)
+    if user_id is None:
+        return None
+    return User.objects.filter(id=user_id).only("id", "username").first()
+
+
+async def aselected_user(request):
+    user_id = _selected_user_id(request)
+    if user_id is None:
+        return None
+    return await User.objects.filter(id=user_id).only("id", "username").afirst()
+
+
+@login_required
+@user_passes_test(is_operator_or_admin)
+def user_autocomplete(request):
+    """
+    Utenti (o solo operatori con ?role=operator) il cui username inizia
+    con ?q=, in ordine alfabetico, a pagine: ?after=<ultimo username>.
+    Gli admin cercano anche per prefisso dell'email.
+    Prefissi senza distinzione di maiuscole come range su UPPER(username)
+    e UPPER(email): usano gli indici funzionali (filter_users_by_prefix).
+    """
+    query = request.GET.get("q", "").strip()
+    after = request.GET.get("after", "")
+
+    try:
+        limit = min(max(int(request.GET.get("limit", AUTOCOMPLETE_LIMIT)), 1), AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        return HttpResponse("Parametri non validi", status=400)
+
+    admin = is_admin(request.user)
+    users = User.objects.all()
+
+    if request.GET.get("role") == "operator":
+        users = users.filter(groups__name="operator")
+
+    if query:
+        searched = ("username", "email") if admin else ("username",)
+        users = filter_users_by_prefix(users, query, searched)
+
+    # ✅ keyset sullo username (unico): niente OFFSET
+    if after:
+        users = users.filter(username__gt=after)
+
+    fields = ("id", "username", "email") if admin else ("id", "username")
+    rows = list(users.order_by("username").values(*fields)[:limit + 1])
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return JsonResponse(
+        {
+            "results": rows,
+            "next": rows[-1]["username"] if has_more else None,
+        },
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+    )
 
 
 # =========================================================
@@ -122,31 +246,56 @@ def user_logout(request):
 # =========================================================
 
 @login_required
-def ticket_list(request):
-    if is_operator(request.user) or is_admin(request.user):
-        tickets = Ticket.objects.all().order_by("-created_at")
+async def ticket_list(request):
+    user = await async_user(request)
+
+    if is_operator(user) or is_admin(user):
+        tickets = Ticket.objects.all()
     else:
-        tickets = Ticket.objects.filter(created_by=request.user).order_by("-created_at")
+        tickets = Ticket.objects.filter(created_by=user)
 
     tickets = apply_ticket_filters(request, tickets)
 
-    users = User.objects.all()
+    page = await aticket_page(request, tickets)
+
+    # ✅ stessa pagina già vista dal browser → 304 senza render
+    validators = page_validators(request, page)
+    response = not_modified(request, validators)
+    if response:
+        return response
 
-    return render(request, "tickets/ticket_list.html", {
-        "tickets": tickets,
+    rows = await arender_rows("tickets/components/rows/ticket_list_row.html", page)
+
+    return set_validators(render(request, "tickets/ticket_list.html", {
+        "tickets": page,
+        "page": page,
+        "rows": rows,
         "page_title": "Tutti i ticket",
-        "users": users,
+        "show_export": True,
+        "filter_user": await aselected_user(request),
         "filters": request.GET
-    })
+    }), validators)
 
 
 @login_required
 def my_tickets(request):
-    tickets = Ticket.objects.filter(created_by=request.user).order_by("-created_at")
-    return render(request, "tickets/ticket_list.html", {
-        "tickets": tickets,
-        "page_title": "I miei ticket"
-    })
+    tickets = Ticket.objects.filter(created_by=request.user)
+    tickets = apply_ticket_filters(request, tickets)
+
+    page = ticket_page(request, tickets)
+
+    validators = page_validators(request, page)
+    response = not_modified(request, validators)
+    if response:
+        return response
+
+    return set_validators(render(request, "tickets/ticket_list.html", {
+        "tickets": page,
+        "page": page,
+        "rows": render_rows("tickets/components/rows/ticket_list_row.html", page),
+        "page_title": "I miei ticket",
+        "filters": request.GET
+    }), validators)
 
 
 # =========================================================
@@ -156,49 +305,82 @@ def my_tickets(request):
 @login_required
 @user_passes_test(is_operator)
 def operator_open(request):
-    tickets = Ticket.objects.filter(status="open", assigned_to__isnull=True).order_by("-created_at")
+    tickets = Ticket.objects.filter(status="open", assigned_to__isnull=True)
     tickets = apply_ticket_filters(request, tickets)
 
-    users = User.objects.all()
+    # ✅ i contatori cambiano anche per ticket fuori dalla lista
+    counters = operator_counters(request.user)
+    page = ticket_page(request, tickets)
 
-    return render(request, "tickets/operator_open.html", {
-        "tickets": tickets,
+    validators = page_validators(request, page, *counters.values())
+    response = not_modified(request, validators)
+    if response:
+        return response
+
+    return set_validators(render(request, "tickets/operator_open.html", {
+        "tickets": page,
+        "page": page,
+        "rows": render_rows("tickets/components/rows/operator_open_row.html", page),
         "active_tab": "open",
-        "users": users,
+        "counters": counters,
+        "filter_user": selected_user(request),
         "filters": request.GET
-    })
+    }), validators)
 
 
 @login_required
 @user_passes_test(is_operator)
 def operator_assigned(request):
-    tickets = Ticket.objects.filter(assigned_to=request.user).order_by("-created_at")
+    tickets = Ticket.objects.filter(assigned_to=request.user)
     tickets = apply_ticket_filters(request, tickets)
 
-    users = User.objects.all()
+    # ✅ i contatori cambiano anche per ticket fuori dalla lista
+    counters = operator_counters(request.user)
+    page = ticket_page(request, tickets)
+
+    validators = page_validators(request, page, *counters.values())
+    response = not_modified(request, validators)
+    if response:
+        return response
 
-    return render(request, "tickets/operator_assigned.html", {
-        "tickets": tickets,
+    return set_validators(render(request, "tickets/operator_assigned.html", {
+        "tickets": page,
+        "page": page,
+        "rows": render_rows("tickets/components/rows/operator_assigned_row.html", page),
         "active_tab": "assigned",
-        "users": users,
+        "counters": counters,
+        "filter_user": selected_user(request),
         "filters": request.GET
-    })
+    }), validators)
 
 
 @login_required
 @user_passes_test(is_operator)
 def operator_dashboard(request):
-    tickets = Ticket.objects.filter(assigned_to=request.user).order_by("-created_at")
+    tickets = Ticket.objects.filter(assigned_to=request.user)
     tickets = apply_ticket_filters(request, tickets)
 
-    users = User.objects.all()
-
-    return render(request, "tickets/operator_dashboard.html", {
-        "tickets": tickets,
+    # ✅ i contatori cambiano anche per ticket fuori dalla lista
+    counters = operator_counters(request.user)
+    page = ticket_page(request, tickets)
+
+    validators = page_validators(request, page, *counters.values())
+    response = not_modified(request, validators)
+    if response:
+        return response
+
+    return set_validators(render(request, "tickets/operator_dashboard.html", {
+        "tickets": page,
+        "page": page,
+        "rows": render_rows(
+            "tickets/components/rows/operator_dashboard_row.html", page,
+            context={"active_tab": "assigned"}, variant="assigned",
+        ),
         "active_tab": "assigned",
-        "users": users,
+        "counters": counters,
+        "filter_user": selected_user(request),
         "filters": request.GET
-    })
+    }), validators)
 
 # =========================================================
 #                 ADMIN DASHBOARD
@@ -207,118 +389,369 @@ def operator_dashboard(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_dashboard(request):
-    tickets = Ticket.objects.all().order_by("-created_at")
+    tickets = Ticket.objects.all()
     tickets = apply_ticket_filters(request, tickets)
 
-    users = User.objects.all()
+    page = ticket_page(request, tickets)
 
-    return render(request, "tickets/admin_dashboard.html", {
-        "tickets": tickets,
-        "users": users,
+    # ✅ senza filtri: contatori precalcolati (lettura O(1));
+    #    con filtri: una sola query con aggregazione condizionale
+    if has_active_filters(request):
+        totals = status_totals(tickets)
+    else:
+        totals = get_counters("status")
+
+    # ✅ i totali cambiano anche per ticket fuori dalla pagina
+    validators = page_validators(request, page, *sorted(totals.items()))
+    response = not_modified(request, validators)
+    if response:
+        return response
+
+    return set_validators(render(request, "tickets/admin_dashboard.html", {
+        "tickets": page,
+        "page": page,
+        "rows": render_rows("tickets/components/rows/admin_dashboard_row.html", page),
+        "filter_user": selected_user(request),
         "filters": request.GET,
-        "total_open": tickets.filter(status="open").count(),
-        "total_in_progress": tickets.filter(status="in_progress").count(),
-        "total_closed": tickets.filter(status="closed").count(),
-    })
+        "total_open": totals.get("open", 0),
+        "total_in_progress": totals.get("in_progress", 0),
+        "total_closed": totals.get("closed", 0),
+    }), validators)
 
 
 # =========================================================
 #                TICKET DETTAGLIO + MESSAGGI
 # =========================================================
 
+def staff_side_expression():
+    """
+    True se il mittente è staff oppure nel gruppo "operator" (una EXISTS).
+    """
+    sender_is_operator = Exists(
+        User.groups.through.objects.filter(
+            user_id=OuterRef("sender_id"),
+            group__name="operator",
+        )
+    )
+
+    return ExpressionWrapper(
+        Q(sender__is_staff=True) | Q(sender_is_operator),
+        output_field=BooleanField(),
+    )
+
+
+def chat_messages(ticket):
+    """
+    Messaggi del ticket con mittente e ruolo già calcolati in UNA query:
+    is_staff_side = mittente staff oppure nel gruppo "operator".
+    Il template legge solo m.is_staff_side, senza query per messaggio.
+    """
+    return (
+        ticket.messages
+        .select_related("sender")
+        .annotate(is_staff_side=staff_side_expression())
+        .order_by("created_at", "id")
+    )
+
+
+def can_view_ticket(user, ticket):
+    """
+    Regole di accesso di ticket_detail, condivise da chat live e feed JSON.
+    created_by_id: nessuna query per confrontare il creatore.
+    """
+    return (
+        ticket.created_by_id == user.id or
+        is_operator(user) or
+        is_admin(user)
+    )
+
+
 @login_required
-def ticket_detail(request, ticket_id):
-    ticket = get_object_or_404(Ticket, id=ticket_id)
+async def ticket_detail(request, ticket_id):
+    user = await async_user(request)
+
+    # ✅ ultimo messaggio/allegato e totali nella stessa query del ticket
+    ticket = await with_detail_state(
+        Ticket.objects.select_related("created_by", "assigned_to")
+    ).filter(id=ticket_id).afirst()
+    if ticket is None:
+        raise Http404()
 
     # permessi di accesso al ticket
-    if not (
-        ticket.created_by == request.user or
-        is_operator(request.user) or
-        is_admin(request.user)
-    ):
+    if not can_view_ticket(user, ticket):
         return redirect("ticket_list")
 
-    operators = User.objects.filter(groups__name="operator")
-    selected_operator_id = ticket.assigned_to.id if ticket.assigned_to else None
-
     # =========================================================
     # ✅ INVIO MESSAGGIO + UPLOAD ALLEGATO SICURO
     # =========================================================
+    # scritture, upload e messaggi flash restano sincroni (in un thread)
     if request.method == "POST":
+        return await sync_to_async(ticket_detail_post)(request, ticket)
 
-        text = request.POST.get("text", "").strip()
+    # =========================================================
+    # ✅ VISUALIZZAZIONE TICKET
+    # =========================================================
+    validators = detail_validators(request, ticket)
+    response = not_modified(request, validators)
+    if response:
+        return response
+
+    chat = [m async for m in chat_messages(ticket)]
+    attachments = [a async for a in ticket.attachments.all()]
+
+    # ✅ da dove riparte la chat live (vedi ticket_events)
+    live_cursor = "%d.%d" % (
+        max((m.id for m in chat), default=0),
+        max((a.id for a in attachments), default=0),
+    )
 
-        # ✅ invio messaggio
-        if text:
-            Message.objects.create(
-                ticket=ticket,
-                sender=request.user,
-                text=text
-            )
+    roles = {"is_operator": is_operator(user), "is_admin": is_admin(user)}
+    header = await arender_fragment(
+        "tickets/components/ticket_header.html", ticket, roles,
+        variant="%d%d" % (roles["is_operator"], roles["is_admin"]),
+    )
 
-        # ✅ gestione upload allegato
-        if request.FILES.get("attachment"):
-            f = request.FILES["attachment"]
-            import os
+    return set_validators(render(request, "tickets/ticket_detail.html", {
+        "ticket": ticket,
+        "header": header,
+        **roles,
+        "messages": chat,
+        "attachments": attachments,
+        "live_cursor": live_cursor,
+        # ✅ chat live solo sotto ASGI: sotto WSGI ogni stream SSE
+        #    occuperebbe un worker per tutta la sua durata
+        "live": is_asgi(request),
+    }), validators)
+
+
+def ticket_detail_post(request, ticket):
+    """
+    POST di ticket_detail: nuovo messaggio e/o allegato.
+    """
+    text = request.POST.get("text", "").strip()
+
+    # ✅ invio messaggio
+    message = None
+    if text:
+        message = Message.objects.create(
+            ticket=ticket,
+            sender=request.user,
+            text=text
+        )
 
-            ext = os.path.splitext(f.name)[1].lower()
+    # ✅ invio dalla chat live (fetch): il messaggio torna nella risposta e
+    #    la pagina lo mostra subito (stesso evento dell'SSE, stesso id),
+    #    niente redirect e niente ricaricamento della pagina
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest" and not request.FILES:
+        if message is None:
+            return JsonResponse({"error": "Messaggio vuoto."}, status=400)
+        event = message_event(message, is_staff_side(request.user))
+        return JsonResponse(event, status=201, json_dumps_params={"ensure_ascii": False})
 
-            # --- WHITELIST ESTENSIONI ---
-            ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
-            MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+    # ✅ gestione upload allegato
+    if request.FILES.get("attachment"):
+        f = request.FILES["attachment"]
+        import os
 
-            if ext not in ALLOWED_EXTENSIONS:
-                messages.error(
-                    request,
-                    "Formato non consentito. Sono ammessi solo PDF, JPG e PNG."
-                )
-                return redirect("ticket_detail", ticket_id=ticket.id)
+        ext = os.path.splitext(f.name)[1].lower()
 
-            if f.size > MAX_FILE_SIZE:
-                messages.error(
-                    request,
-                    "File troppo grande. Dimensione massima: 10MB."
-                )
-                return redirect("ticket_detail", ticket_id=ticket.id)
+        # --- WHITELIST ESTENSIONI ---
+        ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
+        MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
 
-            # ✅ cartella RELATIVA per ticket
-            relative_dir = f"ticket_{ticket.id}"
-            absolute_dir = os.path.join(settings.SECURE_UPLOAD_ROOT, relative_dir)
-            os.makedirs(absolute_dir, exist_ok=True)
+        if ext not in ALLOWED_EXTENSIONS:
+            messages.error(
+                request,
+                "Formato non consentito. Sono ammessi solo PDF, JPG e PNG."
+            )
+            return redirect("ticket_detail", ticket_id=ticket.id)
 
-            relative_path = os.path.join(relative_dir, f.name)
-            absolute_path = os.path.join(settings.SECURE_UPLOAD_ROOT, relative_path)
+        if f.size > MAX_FILE_SIZE:
+            messages.error(
+                request,
+                "File troppo grande. Dimensione massima: 10MB."
+            )
+            return redirect("ticket_detail", ticket_id=ticket.id)
 
-            with open(absolute_path, "wb+") as dest:
-                for chunk in f.chunks():
-                    dest.write(chunk)
+        # ✅ storage deduplicato: contenuti identici → un solo file
+        with transaction.atomic():
+            blob = store_upload(f)
 
-            TicketAttachment.objects.create(
+            attachment = TicketAttachment.objects.create(
                 ticket=ticket,
                 uploaded_by=request.user,
+                blob=blob,
                 file_name=f.name,
-                file_path=relative_path,   # ✅ SOLO RELATIVO NEL DB
-                file_size=f.size,
+                file_path=blob_relative_path(blob.sha256),   # ✅ SOLO RELATIVO NEL DB
+                file_size=blob.size,
                 mime_type=f.content_type
             )
 
+            # ✅ miniature generate dal pool, non in questa richiesta
+            transaction.on_commit(lambda: schedule_thumbnails(attachment))
 
-            messages.success(request, "Allegato caricato correttamente.")
+        messages.success(request, "Allegato caricato correttamente.")
 
-        return redirect("ticket_detail", ticket_id=ticket.id)
+    return redirect("ticket_detail", ticket_id=ticket.id)
 
-    # =========================================================
-    # ✅ VISUALIZZAZIONE TICKET
-    # =========================================================
-    return render(request, "tickets/ticket_detail.html", {
-        "ticket": ticket,
-        "operators": operators,
-        "selected_operator_id": selected_operator_id,
-        "is_operator": is_operator(request.user),
-        "is_admin": is_admin(request.user),
-        "messages": ticket.messages.order_by("created_at"),
-        "attachments": ticket.attachments.all()
-    })
+
+# =========================================================
+#               FEED JSON INCREMENTALE DEI MESSAGGI
+# =========================================================
+
+FEED_LIMIT = 100
+FEED_MAX_LIMIT = 500
+
+
+@login_required
+def ticket_messages_feed(request, ticket_id):
+    """
+    Messaggi di un ticket successivi a ?after=<id messaggio>, in JSON compatto.
+    ETag + If-None-Match: se non c'è nulla di nuovo risponde 304 dopo una
+    sola query aggregata, senza leggere i messaggi.
+    """
+    ticket = get_object_or_404(Ticket.objects.only("id", "created_by_id"), id=ticket_id)
+
+    if not can_view_ticket(request.user, ticket):
+        raise Http404()
+
+    try:
+        after = max(int(request.GET.get("after", 0)), 0)
+        limit = min(max(int(request.GET.get("limit", FEED_LIMIT)), 1), FEED_MAX_LIMIT)
+    except ValueError:
+        return HttpResponse("Parametri non validi", status=400)
+
+    feed = Message.objects.filter(ticket_id=ticket.id)
+
+    # ✅ keyset su (created_at, id): range scan su message_ticket_created_idx
+    if after:
+        anchor = feed.filter(id=after).values_list("created_at", flat=True).first()
+        if anchor is None:
+            feed = feed.filter(id__gt=after)
+        else:
+            feed = feed.filter(
+                Q(created_at__gt=anchor) | Q(created_at=anchor, id__gt=after)
+            )
+
+    state = feed.aggregate(last=Max("id"), total=Count("id"))
+    etag = 'W/"%d-%d-%s-%d-%d"' % (
+        ticket.id, after, state["last"] or 0, state["total"], limit
+    )
+
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    rows = list(
+        feed.annotate(is_staff_side=staff_side_expression())
+        .order_by("created_at", "id")
+        .values_list("id", "sender__username", "text", "created_at", "is_staff_side")[:limit]
+    )
+
+    response = JsonResponse(
+        {
+            "ticket": ticket.id,
+            "messages": [
+                {
+                    "id": pk,
+                    "sender": sender,
+                    "text": text,
+                    "created_at": created_at.isoformat(),
+                    "staff": staff,
+                }
+                for pk, sender, text, created_at, staff in rows
+            ],
+            "last_id": rows[-1][0] if rows else after,
+            "has_more": state["total"] > len(rows),
+        },
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+    )
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# =========================================================
+#               CHAT LIVE (SERVER-SENT EVENTS)
+# =========================================================
+
+@login_required
+async def ticket_events(request, ticket_id):
+    """
+    Stream text/event-stream con i nuovi messaggi e allegati di un ticket.
+    View async: sotto ASGI ogni client in attesa è una coroutine in
+    attesa sulla propria coda, non un thread occupato.
+    """
+    user = await request.auser()
+
+    ticket = await Ticket.objects.filter(id=ticket_id).afirst()
+    if ticket is None or not await sync_to_async(can_view_ticket)(user, ticket):
+        raise Http404()
+
+    # sotto WSGI lo stream verrebbe raccolto tutto prima di rispondere:
+    # 204 = il browser non riprova a connettersi
+    if not is_asgi(request):
+        return HttpResponse(status=204)
+
+    # riconnessione: il browser rimanda l'ultimo id in Last-Event-ID
+    cursor = (
+        parse_cursor(request.headers.get("Last-Event-ID"))
+        or parse_cursor(request.GET.get("cursor"))
+        or (0, 0)
+    )
+
+    # ✅ iscrizione PRIMA del recupero dal DB: nessun evento perso nel mezzo
+    subscription = get_hub().subscribe(ticket_channel(ticket.id))
+
+    response = StreamingHttpResponse(
+        _ticket_event_stream(ticket, subscription, cursor),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"   # nginx: niente buffering
+    return response
+
+
+async def _ticket_event_stream(ticket, subscription, cursor):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_STREAM_SECONDS
+    last = {"message": cursor[0], "attachment": cursor[1]}
+    sent = set()
+
+    def emit(event):
+        sent.add((event["type"], event["id"]))
+        last[event["type"]] = max(last[event["type"]], event["id"])
+        return format_sse(event, (last["message"], last["attachment"]))
+
+    try:
+        yield "retry: 3000\n\n"
+
+        # ✅ quanto arrivato mentre il client era disconnesso
+        async for m in chat_messages(ticket).filter(id__gt=cursor[0]):
+            yield emit(message_event(m, m.is_staff_side))
+
+        new_attachments = (
+            ticket.attachments.select_related("uploaded_by")
+            .filter(id__gt=cursor[1]).order_by("id")
+        )
+        async for a in new_attachments:
+            yield emit(attachment_event(a))
+
+        while loop.time() < deadline:
+            event = await subscription.get(
+                timeout=min(HEARTBEAT_SECONDS, deadline - loop.time())
+            )
+
+            if event is None:
+                yield ": ping\n\n"
+            elif event is OVERFLOW:
+                # client troppo indietro: ricarica la pagina
+                yield "event: resync\ndata: {}\n\n"
+                return
+            elif (event["type"], event["id"]) not in sent:
+                yield emit(event)
+    finally:
+        subscription.close()
 
 # =========================================================
 #               WORKFLOW TICKET (OPERATOR)
@@ -329,46 +762,47 @@ def ticket_detail(request, ticket_id):
 def ticket_assign(request, ticket_id):
     ticket = get_object_or_404(Ticket, id=ticket_id)
 
-    if ticket.status == "open":
-        ticket.assigned_to = request.user
-        ticket.status = "in_progress"
-        ticket.save()
-
-        from django.urls import reverse
-        from django.conf import settings
-        from .utils.mailer import send_ticket_email, build_ticket_email_html
+    # ✅ UPDATE condizionato: con due click contemporanei vince uno solo,
+    #    e solo il vincitore riceve l'email
+    if claim_ticket(ticket, request.user):
+        send_assignment_email(ticket, request.user, actor=request.user)
+    elif ticket.assigned_to_id != request.user.id:
+        messages.warning(request, "Il ticket non è più disponibile: è già stato preso in carico.")
 
-        ticket_url = f"{settings.SITE_URL}{reverse('ticket_detail', args=[ticket.id])}"
+    return redirect("ticket_detail", ticket_id=ticket.id)
 
-        subject = f"[TICKET ASSEGNATO] #{ticket.id}"
 
-        text_message = (
-            f"Ti è stato assegnato un ticket.\n\n"
-            f"Titolo: {ticket.title}\n\n"
-            f"Apri il ticket: {ticket_url}"
-        )
-
-        html_message = build_ticket_email_html(
-            title="Nuovo Ticket Assegnato",
-            message=f"""
-                Ti è stato assegnato un nuovo ticket.<br><br>
-                <b>Titolo:</b> {ticket.title}<br>
-                <b>Creato da:</b> {ticket.created_by.username}<br>
-            """,
-            ticket_url=ticket_url,
-            button_text="Gestisci Ticket"
-        )
+@login_required
+@user_passes_test(is_operator)
+def ticket_next(request):
+    """
+    Prende in carico il prossimo ticket libero: order=oldest (default)
+    o priority. JSON per i client che lo chiedono, altrimenti redirect.
+    """
+    if request.method != "POST":
+        return redirect("operator_open")
+
+    order = request.POST.get("order", "oldest")
+    if order not in ASSIGN_ORDERS:
+        order = "oldest"
+
+    ticket = claim_next(request.user, order)
+    if ticket:
+        send_assignment_email(ticket, request.user, actor=request.user)
+
+    if "application/json" in request.headers.get("Accept", ""):
+        from django.urls import reverse
 
-        send_ticket_email(
-            subject=subject,
-            text_content=text_message,
-            html_content=html_message,
-            recipient_list=[request.user.email],
-            actor=request.user,          # ✅ chi assegna
-            target_user=request.user,   # ✅ destinatario
-            ticket=ticket
-        )
+        return JsonResponse({"ticket": ticket and {
+            "id": ticket.id,
+            "title": ticket.title,
+            "priority": ticket.priority,
+            "url": reverse("ticket_detail", args=[ticket.id]),
+        }})
 
+    if ticket is None:
+        messages.info(request, "Nessun ticket da prendere in carico.")
+        return redirect("operator_open")
 
     return redirect("ticket_detail", ticket_id=ticket.id)
 
@@ -380,28 +814,45 @@ def ticket_reassign(request, ticket_id):
 
     if request.method == "POST":
         new_operator_id = request.POST.get("operator_id")
-        new_operator = get_object_or_404(User, id=new_operator_id)
+        if not str(new_operator_id or "").isdigit():
+            messages.error(request, "Seleziona un operatore dall'elenco.")
+            return redirect("ticket_reassign_view", ticket_id=ticket.id)
+
+        # ✅ l'id arriva dall'autocomplete: deve essere davvero un operatore
+        new_operator = get_object_or_404(
+            User, id=new_operator_id, groups__name="operator"
+        )
 
         # ✅ === STATO PRIMA ===
         old_operator = ticket.assigned_to
 
-        # ✅ ASSEGNA NUOVO OPERATORE
-        ticket.assigned_to = new_operator
-        ticket.status = "in_progress"
-        ticket.save()
-
-        # ✅ === LOG PRIMA → DOPO ===
-        AdminLog.objects.create(
-            actor=request.user,
-            target_user=new_operator,
-            ticket=ticket,
-            action="TICKET REASSIGNED",
-            details=(
-                f"Assegnazione modificata: "
-                f"PRIMA = {old_operator.username if old_operator else 'Nessuno'} → "
-                f"DOPO = {new_operator.username}"
-            )
-        )
+        # ✅ salvataggio + log dei signal + log della view in un'unica
+        #    transazione → un solo INSERT di AdminLog al commit
+        try:
+            with transaction.atomic():
+                # ✅ versione vista nel form: niente riassegnazioni "alla cieca"
+                ticket.check_version(request.POST.get("version"))
+
+                # ✅ ASSEGNA NUOVO OPERATORE
+                ticket.assigned_to = new_operator
+                ticket.status = "in_progress"
+                ticket.save()
+
+                # ✅ === LOG PRIMA → DOPO ===
+                log_change(
+                    actor=request.user,
+                    target_user=new_operator,
+                    ticket=ticket,
+                    action="TICKET REASSIGNED",
+                    extra=(
+                        f"Assegnazione modificata: "
+                        f"PRIMA = {old_operator.username if old_operator else 'Nessuno'} → "
+                        f"DOPO = {new_operator.username}"
+                    )
+                )
+        except VersionConflict:
+            messages.error(request, VERSION_CONFLICT_MESSAGE)
+            return redirect("ticket_reassign_view", ticket_id=ticket.id)
 
         messages.success(
             request,
@@ -412,20 +863,16 @@ def ticket_reassign(request, ticket_id):
 
         return redirect("ticket_detail", ticket_id=ticket.id)
 
-    operators = User.objects.filter(groups__name="operator")
-
     return render(request, "tickets/ticket_reassign.html", {
         "ticket": ticket,
-        "operators": operators
     })
 
 
 @login_required
 @user_passes_test(is_admin)
 def ticket_reassign_view(request, ticket_id):
-    ticket = get_object_or_404(Ticket, id=ticket_id)
+    ticket = get_object_or_404(Ticket.objects.select_related("assigned_to"), id=ticket_id)
 
-    operators = User.objects.filter(groups__name="operator")
     AdminLog.objects.create(
     actor=request.user,
     ticket=ticket,
@@ -435,7 +882,6 @@ def ticket_reassign_view(request, ticket_id):
 
     return render(request, "tickets/ticket_reassign.html", {
         "ticket": ticket,
-        "operators": operators
     })
 
 
@@ -445,8 +891,14 @@ def ticket_close(request, ticket_id):
     ticket = get_object_or_404(Ticket, id=ticket_id)
 
     if ticket.status != "closed":
-        ticket.status = "closed"
-        ticket.save()
+        try:
+            with transaction.atomic():
+                ticket.check_version(request.GET.get("version"))
+                ticket.status = "closed"
+                ticket.save()
+        except VersionConflict:
+            messages.error(request, VERSION_CONFLICT_MESSAGE)
+            return redirect("ticket_detail", ticket_id=ticket.id)
 
         from django.urls import reverse
         from django.conf import settings
@@ -507,12 +959,14 @@ def ticket_create(request):
                 "error": "Compila tutti i campi."
             })
 
-        ticket = Ticket.objects.create(
-            title=title,
-            description=description,
-            priority=priority,
-            created_by=request.user
-        )
+        # ✅ ticket + contatori + indice + log nella stessa transazione
+        with transaction.atomic():
+            ticket = Ticket.objects.create(
+                title=title,
+                description=description,
+                priority=priority,
+                created_by=request.user
+            )
         # Il log di creazione lo fa il signal post_save (TICKET CREATE)
 
         return redirect("ticket_detail", ticket_id=ticket.id)
@@ -527,8 +981,31 @@ def ticket_create(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_users(request):
-    users = User.objects.all().order_by("username")
-    return render(request, "tickets/admin_users.html", {"users": users})
+    """
+    Directory utenti: ricerca per prefisso di username/email, filtro per
+    ruolo, pagine keyset da USER_PAGE_SIZE e ruoli precaricati con una
+    query per pagina (nessuna query per riga nel template).
+    """
+    users = User.objects.only("id", "username", "email")
+
+    query = request.GET.get("q", "").strip()
+    if query:
+        # ✅ stessa espressione indicizzata dell'autocomplete (UPPER(...))
+        users = filter_users_by_prefix(users, query, ("username", "email"))
+
+    role = request.GET.get("role", "")
+    if role in ("admin", "operator"):
+        users = users.filter(groups__name=role)
+    elif role == "user":
+        users = users.exclude(groups__name__in=["admin", "operator"])
+
+    page = paginate_users(request, with_roles(users))
+
+    return render(request, "tickets/admin_users.html", {
+        "users": page,
+        "page": page,
+        "filters": request.GET,
+    })
 
 
 @login_required
@@ -546,8 +1023,10 @@ def make_operator(request, user_id):
     user.save()
 
     # LOG DB
+    invalidate_roles(user)
+
     AdminLog.objects.create(
-        user=request.user,
+        actor=request.user,
         action="Assegnato ruolo OPERATOR",
         target_user=user
     )
@@ -569,8 +1048,10 @@ def make_admin(request, user_id):
     user.is_staff = True
     user.save()
 
+    invalidate_roles(user)
+
     AdminLog.objects.create(
-        user=request.user,
+        actor=request.user,
         action="Assegnato ruolo ADMIN",
         target_user=user
     )
@@ -594,8 +1075,10 @@ def make_user(request, user_id):
     user.groups.add(group)
     user.save()
 
+    invalidate_roles(user)
+
     AdminLog.objects.create(
-        user=request.user,
+        actor=request.user,
         action="Assegnato ruolo USER",
         target_user=user
     )
@@ -612,21 +1095,24 @@ def make_user(request, user_id):
 @login_required
 @user_passes_test(is_admin)
 def admin_user_detail(request, user_id):
-    user_obj = get_object_or_404(User, id=user_id)
+    user_obj = get_object_or_404(with_roles(User.objects.all()), id=user_id)
     return render(request, "tickets/admin_user_detail.html", {"u": user_obj})
 
 
 @login_required
 @user_passes_test(is_admin)
 def admin_user_edit(request, user_id):
-    user_obj = get_object_or_404(User, id=user_id)
+    user_obj = get_object_or_404(with_roles(User.objects.all()), id=user_id)
     groups = Group.objects.all()
-    current_group = user_obj.groups.first()
+
+    # ✅ gruppi già precaricati: nessuna query per leggere il ruolo attuale
+    role_groups = getattr(user_obj, ROLE_PREFETCH)
+    current_group = role_groups[0] if role_groups else None
 
     if request.method == "POST":
         old_username = user_obj.username
         old_email = user_obj.email
-        old_group = user_obj.groups.first().name if user_obj.groups.first() else None
+        old_group = current_group.name if current_group else None
 
         username = request.POST.get("username").strip()
         email = request.POST.get("email").strip()
@@ -720,36 +1206,34 @@ def admin_user_delete(request, user_id):
 
 @login_required
 @user_passes_test(is_admin)
-def admin_logs(request):
+async def admin_logs(request):
+    await async_user(request)
 
     logs = AdminLog.objects.select_related(
         "actor", "target_user", "ticket"
     ).order_by("-timestamp")
 
     # ==========================
-    # ✅ FILTRI
+    # ✅ FILTRI (gli stessi dell'export, vedi utils/filters.py)
     # ==========================
 
-    admin_username = request.GET.get("admin", "").strip()
-    target_username = request.GET.get("target", "").strip()
-    action_text = request.GET.get("action", "").strip()
-    date_from = request.GET.get("from")
-    date_to = request.GET.get("to")
-
-    if admin_username:
-        logs = logs.filter(actor__username__icontains=admin_username)
-
-    if target_username:
-        logs = logs.filter(target_user__username__icontains=target_username)
-
-    if action_text:
-        logs = logs.filter(action__icontains=action_text)
-
-    if date_from:
-        logs = logs.filter(timestamp__date__gte=date_from)
+    filters = log_filters(request.GET)
+    logs = filter_admin_logs(logs, filters)
 
-    if date_to:
-        logs = logs.filter(timestamp__date__lte=date_to)
+    # ==========================
+    # ✅ ARCHIVIO (LOG OLTRE LA RETENTION)
+    # ==========================
+    # solo se il range di date richiesto cade su file archiviati;
+    # i log archiviati sono sempre più vecchi di quelli in tabella
+    start, end = filters["start"], filters["end"]
+
+    # lettura del manifest e dei file .gz in un thread: niente I/O nel loop
+    if (start or end) and await sync_to_async(archive_covers)(start, end):
+        archived = iter_archived_logs(**filters)
+        archived = await sync_to_async(list)(islice(archived, ARCHIVE_READ_LIMIT))
+        logs = [log async for log in logs] + archived
+    else:
+        logs = [log async for log in logs]
 
     return render(request, "tickets/admin_logs.html", {
         "logs": logs,
@@ -757,87 +1241,143 @@ def admin_logs(request):
     })
 
 
+# =========================================================
+#              EXPORT CSV / JSONL (STREAMING)
+# =========================================================
+
+def export_format(request):
+    fmt = request.GET.get("format", "csv")
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
 @login_required
-def secure_download(request, attachment_id):
-    attachment = get_object_or_404(TicketAttachment, id=attachment_id)
+def ticket_export(request):
+    """
+    Ticket con gli stessi filtri di ticket_list, in CSV o JSONL (?format=).
+    """
+    fmt = export_format(request)
+    if fmt is None:
+        return HttpResponse("Formato non valido (csv, jsonl)", status=400)
+
+    if is_operator(request.user) or is_admin(request.user):
+        tickets = Ticket.objects.all()
+    else:
+        tickets = Ticket.objects.filter(created_by=request.user)
+
+    tickets = apply_ticket_filters(request, tickets)
+
+    log_change(
+        actor=request.user,
+        action="TICKET EXPORT",
+        extra=f"Formato: {fmt} - Filtri: {request.GET.urlencode()}",
+    )
+
+    return export_response(
+        export_tickets(tickets, fmt), fmt, "tickets", async_stream=is_asgi(request)
+    )
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_logs_export(request):
+    """
+    Log con gli stessi filtri di admin_logs (archivio compreso), in CSV o JSONL.
+    """
+    fmt = export_format(request)
+    if fmt is None:
+        return HttpResponse("Formato non valido (csv, jsonl)", status=400)
+
+    filters = log_filters(request.GET)
+    logs = filter_admin_logs(AdminLog.objects.all(), filters)
+
+    log_change(
+        actor=request.user,
+        action="LOG EXPORT",
+        extra=f"Formato: {fmt} - Filtri: {request.GET.urlencode()}",
+    )
+
+    return export_response(
+        export_logs(logs, filters, fmt), fmt, "admin-logs", async_stream=is_asgi(request)
+    )
+
+
+@login_required
+async def secure_download(request, attachment_id):
+    user = await async_user(request)
+
+    attachment = await aget_attachment(attachment_id)
 
     # ✅ permessi
     if not (
-        is_admin(request.user) or
-        is_operator(request.user) or
-        attachment.ticket.created_by == request.user
+        is_admin(user) or
+        is_operator(user) or
+        attachment.ticket.created_by_id == user.id
     ):
         raise Http404()
 
-    # ✅ ricostruzione path assoluto
-    absolute_path = os.path.join(settings.SECURE_UPLOAD_ROOT, attachment.file_path)
+    # ✅ Range / 304 / offload al web server, lettura senza bloccare il loop
+    response = serve_attachment(
+        request, attachment, as_attachment=True, async_stream=is_asgi(request)
+    )
 
-    if not os.path.exists(absolute_path):
-        raise Http404("File non trovato")
+    # un solo log per download completo, non per ogni 304 o pezzo di Range
+    if response.status_code == 200:
+        await AdminLog.objects.acreate(
+            actor=user,
+            ticket=attachment.ticket,
+            action="ATTACHMENT DOWNLOAD",
+            details=attachment.file_name
+        )
 
-    AdminLog.objects.create(
-    actor=request.user,
-    ticket=attachment.ticket,
-    action="ATTACHMENT DOWNLOAD",
-    details=attachment.file_name
-)
+    return response
 
 
-    return FileResponse(
-        open(absolute_path, "rb"),
-        as_attachment=True,
-        filename=attachment.file_name
-    )
+async def aget_attachment(attachment_id):
+    attachment = await TicketAttachment.objects.select_related(
+        "ticket"
+    ).filter(id=attachment_id).afirst()
+
+    if attachment is None:
+        raise Http404()
+    return attachment
 
 @login_required
 @user_passes_test(is_admin)
 def attachment_delete(request, attachment_id):
     attachment = get_object_or_404(TicketAttachment, id=attachment_id)
 
-    # Ricostruzione path assoluto dal relativo
-    absolute_path = os.path.join(settings.SECURE_UPLOAD_ROOT, attachment.file_path)
-
-    # Cancellazione file fisico (se esiste)
-    if os.path.exists(absolute_path):
-        try:
-            os.remove(absolute_path)
-        except Exception as e:
-            messages.error(
-                request,
-                "Errore durante la cancellazione del file fisico."
-            )
-            return redirect("ticket_detail", ticket_id=attachment.ticket.id)
-
+    # ✅ il file fisico viene rimosso dal segnale post_delete, dopo il commit,
+    #    e solo se nessun altro allegato usa lo stesso contenuto
     # Cancellazione record DB
-    attachment.delete()
+    with transaction.atomic():
+        attachment.delete()
 
     messages.success(request, "Allegato eliminato correttamente.")
     return redirect("ticket_detail", ticket_id=attachment.ticket.id)
 
 @login_required
-def attachment_preview(request, attachment_id):
-    attachment = get_object_or_404(TicketAttachment, id=attachment_id)
+async def attachment_preview(request, attachment_id):
+    user = await async_user(request)
+
+    attachment = await aget_attachment(attachment_id)
 
     # ✅ permessi: admin, operator, creatore ticket
     if not (
-        is_admin(request.user) or
-        is_operator(request.user) or
-        attachment.ticket.created_by == request.user
+        is_admin(user) or
+        is_operator(user) or
+        attachment.ticket.created_by_id == user.id
     ):
         raise Http404()
 
-    # ✅ ricostruzione path assoluto dal relativo
-    absolute_path = os.path.join(settings.SECURE_UPLOAD_ROOT, attachment.file_path)
-
-    if not os.path.exists(absolute_path):
-        raise Http404("File non trovato")
+    # ✅ miniatura (?size=sm|md|lg) se già pronta
+    size = request.GET.get("size")
+    if size:
+        response = serve_thumbnail(request, attachment, size, async_stream=is_asgi(request))
+        if response is not None:
+            return response
 
-    # ✅ apertura inline (preview)
-    response = FileResponse(open(absolute_path, "rb"))
-    response["Content-Type"] = attachment.mime_type or "application/octet-stream"
-    response["Content-Disposition"] = f'inline; filename="{attachment.file_name}"'
-
-    return response
+    # ✅ apertura inline (preview), con ETag / Last-Modified per la cache
+    return serve_attachment(request, attachment, async_stream=is_asgi(request))
 
 def log_action(request, action, *, target_user=None, ticket=None, details=""):
     ip = request.META.get("REMOTE_ADDR")
@@ -859,61 +1399,64 @@ def report_dashboard(request):
     if not is_admin(request.user):
         return redirect("dashboard")
 
-    from django.db.models import Count
-    from .models import AdminLog, User
+    from .utils.rollups import operator_activity, histogram, timeline, GRANULARITIES
 
     month = request.GET.get("month")
     year = request.GET.get("year")
+    date_from = request.GET.get("from")
+    date_to = request.GET.get("to")
+    granularity = request.GET.get("granularity") or "day"
     operator_id = request.GET.get("operator")
     action_filter = request.GET.get("action")
 
-    # ✅ SOLO LOG DI LAVORO OPERATIVO DEGLI OPERATORI
-    logs = AdminLog.objects.filter(
-        actor__groups__name="operator",
-        action__in=[
-            "TICKET ASSIGNED CHANGE",
-            "TICKET STATUS CHANGE",
-            "TICKET CLOSED"
-        ]
-    )
-
-    # ✅ FILTRI TEMPORALI
-    if month:
-        logs = logs.filter(timestamp__month=int(month))
+    if granularity not in GRANULARITIES:
+        granularity = "day"
 
-    if year:
-        logs = logs.filter(timestamp__year=int(year))
+    # ✅ INTERVALLO DI DATE [start, end): range libero oppure mese/anno
+    #    (date non valide, es. 2025-02-30, vengono ignorate come negli altri filtri)
+    start = day_start(date_from)
+    end = day_end(date_to)
 
-    # ✅ FILTRO OPERATORE
-    if operator_id:
-        logs = logs.filter(actor_id=operator_id)
+    # i rollup sono per giorno locale: bastano le date
+    start = start.date() if start else None
+    end = end.date() if end else None
 
-    # ✅ FILTRO PER TESTO AZIONE (opzionale)
-    if action_filter:
-        logs = logs.filter(action__icontains=action_filter)
+    # mese senza anno → mese dell'anno corrente
+    if not (start or end) and (month or year):
+        try:
+            start, end = month_range(
+                int(year) if year else now().year,
+                int(month) if month else None,
+            )
+        except ValueError:
+            start = end = None
+
+    # ✅ SOLO LAVORO OPERATIVO DEGLI OPERATORI, DAI ROLLUP GIORNALIERI
+    #    (tabella piccola, non cresce con il log grezzo)
+    rows = operator_activity(
+        start=start,
+        end=end,
+        operator_id=operator_id,
+        action_text=action_filter,
+    )
 
     # ✅ SOLO UTENTI DEL GRUPPO OPERATOR PER LA SELECT
     operators = User.objects.filter(groups__name="operator")
 
     # ✅ GRAFICO ATTIVITÀ PER OPERATORE
-    operator_stats_qs = (
-        logs.values("actor__username")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-
-    operator_labels = [x["actor__username"] for x in operator_stats_qs]
-    operator_values = [x["total"] for x in operator_stats_qs]
+    operator_stats = histogram(rows, "actor__username")
+    operator_labels = [label for label, _ in operator_stats]
+    operator_values = [total for _, total in operator_stats]
 
     # ✅ GRAFICO DISTRIBUZIONE AZIONI
-    action_stats_qs = (
-        logs.values("action")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
+    action_stats = histogram(rows, "action")
+    action_labels = [label for label, _ in action_stats]
+    action_values = [total for _, total in action_stats]
 
-    action_labels = [x["action"] for x in action_stats_qs]
-    action_values = [x["total"] for x in action_stats_qs]
+    # ✅ ANDAMENTO NEL TEMPO (giorno / settimana / mese)
+    timeline_stats = timeline(rows, granularity)
+    timeline_labels = [period.isoformat() for period, _ in timeline_stats]
+    timeline_values = [total for _, total in timeline_stats]
 
     context = {
         "operators": operators,
@@ -921,8 +1464,13 @@ def report_dashboard(request):
         "operator_values": operator_values,
         "action_labels": action_labels,
         "action_values": action_values,
+        "timeline_labels": timeline_labels,
+        "timeline_values": timeline_values,
         "selected_month": month,
         "selected_year": year,
+        "selected_from": date_from,
+        "selected_to": date_to,
+        "selected_granularity": granularity,
         "selected_operator": operator_id,
         "selected_action": action_filter,
     }